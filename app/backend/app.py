@@ -1,11 +1,11 @@
 import dataclasses
-import io
 import json
 import logging
 import mimetypes
 import os
 import time
 from collections.abc import AsyncGenerator, Awaitable, Callable
+from datetime import datetime
 from pathlib import Path
 from typing import Any, cast
 
@@ -34,15 +34,18 @@ from opentelemetry.instrumentation.openai import OpenAIInstrumentor
 from quart import (
     Blueprint,
     Quart,
+    Response,
     abort,
     current_app,
     jsonify,
     make_response,
     request,
-    send_file,
     send_from_directory,
 )
+from quart.wrappers.response import IterableBody
 from quart_cors import cors
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import unquote_etag
 
 from approaches.approach import Approach, DataPoints
 from approaches.chatreadretrieveread import ChatReadRetrieveReadApproach
@@ -57,15 +60,22 @@ from config import (
     CONFIG_CHAT_HISTORY_BROWSER_ENABLED,
     CONFIG_CHAT_HISTORY_COSMOS_ENABLED,
     CONFIG_CREDENTIAL,
+    CONFIG_DEBUG_ADMIN_OIDS,
+    CONFIG_DEBUG_ALLOW_UNAUTHENTICATED,
+    CONFIG_DEBUG_ENDPOINTS_ENABLED,
     CONFIG_DEFAULT_REASONING_EFFORT,
     CONFIG_DEFAULT_RETRIEVAL_REASONING_EFFORT,
+    CONFIG_EMBEDDING_CACHE,
     CONFIG_GLOBAL_BLOB_MANAGER,
+    CONFIG_IMAGE_EMBEDDINGS_CLIENT,
     CONFIG_INGESTER,
     CONFIG_KNOWLEDGEBASE_CLIENT,
     CONFIG_KNOWLEDGEBASE_CLIENT_WITH_SHAREPOINT,
     CONFIG_KNOWLEDGEBASE_CLIENT_WITH_WEB,
     CONFIG_KNOWLEDGEBASE_CLIENT_WITH_WEB_AND_SHAREPOINT,
     CONFIG_LANGUAGE_PICKER_ENABLED,
+    CONFIG_LOOP_LAG_MONITOR,
+    CONFIG_METRICS_TOKEN,
     CONFIG_MULTIMODAL_ENABLED,
     CONFIG_OPENAI_CLIENT,
     CONFIG_QUERY_REWRITING_ENABLED,
@@ -91,10 +101,23 @@ from config import (
     CONFIG_WEB_SOURCE_ENABLED,
 )
 from core.authentication import AuthenticationHelper
+from core.looplag import LoopLagMonitor
+from core.metrics import (
+    CONTENT_TYPE_LATEST,
+    MetricsMiddleware,
+    generate_latest,
+    metrics_authorized,
+    observe_first_token,
+    set_metrics_endpoint,
+    stage_timings,
+    track_stream,
+)
+from core.profiler import ProfilerBusyError, profile
 from core.sessionhelper import create_session_id
-from decorators import authenticated, authenticated_path
+from decorators import authenticated, authenticated_path, debug_admin_required
 from error import error_dict, error_response
 from prepdocs import (
+    LocalPdfParserLibrary,
     OpenAIHost,
     setup_embeddings_service,
     setup_file_processors,
@@ -102,8 +125,10 @@ from prepdocs import (
     setup_openai_client,
     setup_search_info,
 )
-from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.blobmanager import AdlsBlobManager, BaseBlobManager, BlobManager
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings
+from prepdocslib.figureprocessor import FigureLimits
 from prepdocslib.filestrategy import UploadUserFileStrategy
 from prepdocslib.listfilestrategy import File
 
@@ -113,6 +138,23 @@ mimetypes.add_type("application/javascript", ".js")
 mimetypes.add_type("text/css", ".css")
 
 
+@bp.before_app_request
+async def set_request_metrics_endpoint():
+    # Label metrics with the route template rather than the raw path to bound label cardinality
+    set_metrics_endpoint(request.url_rule.rule if request.url_rule else "unmatched")
+
+
+@bp.route("/metrics")
+async def metrics():
+    # Metrics are only served to scrapers holding the METRICS_TOKEN
+    token = current_app.config[CONFIG_METRICS_TOKEN]
+    if not token:
+        abort(404)
+    if not metrics_authorized(request.headers.get("Authorization"), token):
+        return jsonify({"error": "Invalid metrics token"}), 401, {"WWW-Authenticate": "Bearer"}
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
 @bp.route("/")
 async def index():
     return await bp.send_static_file("index.html")
@@ -143,7 +185,8 @@ async def content_file(path: str, auth_claims: dict[str, Any]):
     *** NOTE *** if you are using app services authentication, this route will return unauthorized to all users that are not logged in
     if AZURE_ENFORCE_ACCESS_CONTROL is not set or false, logged in users can access all files regardless of access control
     if AZURE_ENFORCE_ACCESS_CONTROL is set to true, logged in users can only access files they have access to
-    This is also slow and memory hungry.
+    Files are streamed from storage in chunks, single byte ranges are served for PDF viewers,
+    and conditional requests are answered with 304 Not Modified.
     """
     # Remove page number from path, filename-1.txt -> filename.txt
     # This shouldn't typically be necessary as browsers don't send hash fragments to servers
@@ -151,24 +194,20 @@ async def content_file(path: str, auth_claims: dict[str, Any]):
         path_parts = path.rsplit("#page=", 1)
         path = path_parts[0]
     current_app.logger.info("Opening file %s", path)
-    blob_manager: BlobManager = current_app.config[CONFIG_GLOBAL_BLOB_MANAGER]
+    blob_manager: BaseBlobManager = current_app.config[CONFIG_GLOBAL_BLOB_MANAGER]
+    user_oid = None
 
-    # Get bytes and properties from the blob manager
-    result = await blob_manager.download_blob(path)
+    # Get the properties first, so that conditional requests don't download anything
+    properties = await blob_manager.get_blob_properties(path)
 
-    if result is None:
+    if properties is None:
         current_app.logger.info("Path not found in general Blob container: %s", path)
         if current_app.config[CONFIG_USER_UPLOAD_ENABLED]:
             user_oid = auth_claims["oid"]
-            user_blob_manager: AdlsBlobManager = current_app.config[CONFIG_USER_BLOB_MANAGER]
-            result = await user_blob_manager.download_blob(path, user_oid=user_oid)
-            if result is None:
-                current_app.logger.exception("Path not found in DataLake: %s", path)
-
-    if not result:
-        abort(404)
-
-    content, properties = result
+            blob_manager = current_app.config[CONFIG_USER_BLOB_MANAGER]
+            properties = await blob_manager.get_blob_properties(path, user_oid=user_oid)
+            if properties is None:
+                current_app.logger.info("Path not found in DataLake: %s", path)
 
     if not properties or "content_settings" not in properties:
         abort(404)
@@ -177,9 +216,54 @@ async def content_file(path: str, auth_claims: dict[str, Any]):
     if mime_type == "application/octet-stream":
         mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
 
-    # Create a BytesIO object from the bytes
-    blob_file = io.BytesIO(content)
-    return await send_file(blob_file, mimetype=mime_type, as_attachment=False, attachment_filename=path)
+    size = properties["size"]
+    etag = unquote_etag(properties["etag"])[0]
+    last_modified = properties["last_modified"]
+    response = Response(b"", mimetype=mime_type)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.accept_ranges = "bytes"
+    # The files are access controlled, so browsers may keep them but must check that they are still current
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+    if not_modified:
+        response.status_code = 304
+        return response
+
+    offset, length = 0, size
+    # Multiple ranges are rare and served as the whole file, as are ranges of another version of the file
+    if request.range is not None and len(request.range.ranges) == 1 and _if_range_matches(etag, last_modified):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response.status_code = 416
+            response.content_range = ContentRange("bytes", None, None, size)
+            return response
+        offset, length = byte_range[0], byte_range[1] - byte_range[0]
+        response.status_code = 206
+        response.content_range = ContentRange("bytes", byte_range[0], byte_range[1], size)
+
+    if length > 0:
+        chunks = await blob_manager.stream_blob(path, offset, length, properties["etag"], user_oid=user_oid)
+        if chunks is None:
+            abort(404)
+        response.response = IterableBody(chunks)
+    response.content_length = length
+    return response
+
+
+def _if_range_matches(etag: str, last_modified: datetime) -> bool:
+    """Whether the If-Range header, if any, names the current version of the file"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
 
 
 @bp.route("/ask", methods=["POST"])
@@ -215,12 +299,18 @@ class JSONEncoder(json.JSONEncoder):
 
 
 async def format_as_ndjson(r: AsyncGenerator[dict, None]) -> AsyncGenerator[str, None]:
-    try:
-        async for event in r:
-            yield json.dumps(event, ensure_ascii=False, cls=JSONEncoder) + "\n"
-    except Exception as error:
-        logging.exception("Exception while generating response stream: %s", error)
-        yield json.dumps(error_dict(error))
+    with track_stream():
+        try:
+            async for event in r:
+                if event.get("delta", {}).get("content"):
+                    observe_first_token()
+                yield json.dumps(event, ensure_ascii=False, cls=JSONEncoder) + "\n"
+            # Stage timings can only be sent after the body has started, so they get a final frame
+            if timings := stage_timings():
+                yield json.dumps({"timings": timings}) + "\n"
+        except Exception as error:
+            logging.exception("Exception while generating response stream: %s", error)
+            yield json.dumps(error_dict(error))
 
 
 @bp.route("/chat", methods=["POST"])
@@ -410,6 +500,41 @@ async def list_uploaded(auth_claims: dict[str, Any]):
     return jsonify(files), 200
 
 
+@bp.route("/debug/loop-lag", methods=["GET", "POST"])
+@debug_admin_required
+async def loop_lag():
+    monitor: LoopLagMonitor = current_app.config[CONFIG_LOOP_LAG_MONITOR]
+    if request.method == "POST":
+        request_json = await request.get_json(silent=True) or {}
+        try:
+            if "threshold_ms" in request_json:
+                monitor.configure(threshold=float(request_json["threshold_ms"]) / 1000)
+        except (TypeError, ValueError) as error:
+            return jsonify({"error": str(error)}), 400
+        if request_json.get("enabled") is True:
+            monitor.start()
+        elif request_json.get("enabled") is False:
+            monitor.stop()
+    return jsonify(monitor.status())
+
+
+@bp.route("/debug/profile", methods=["GET"])
+@debug_admin_required
+async def debug_profile():
+    try:
+        seconds = float(request.args.get("seconds", 30))
+        interval = float(request.args.get("interval_ms", 10)) / 1000
+        collapsed = await profile(seconds, interval)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except ProfilerBusyError as error:
+        return jsonify({"error": str(error)}), 409
+    response = await make_response(collapsed)
+    response.mimetype = "text/plain"
+    response.headers["Content-Disposition"] = f'attachment; filename="profile-{int(time.time())}.collapsed"'
+    return response
+
+
 @bp.before_app_serving
 async def setup_clients():
     # Replace these with your own values, either in environment variables or directly here
@@ -487,6 +612,17 @@ async def setup_clients():
     USE_SHAREPOINT_SOURCE = os.getenv("USE_SHAREPOINT_SOURCE", "").lower() == "true"
     AGENTIC_KNOWLEDGEBASE_REASONING_EFFORT = os.getenv("AGENTIC_KNOWLEDGEBASE_REASONING_EFFORT", "low")
     USE_VECTORS = os.getenv("USE_VECTORS", "").lower() != "false"
+    ENABLE_DEBUG_ENDPOINTS = os.getenv("ENABLE_DEBUG_ENDPOINTS", "").lower() == "true"
+    AZURE_DEBUG_ADMIN_OIDS = [oid for oid in os.getenv("AZURE_DEBUG_ADMIN_OIDS", "").split(";") if oid]
+    ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS = os.getenv("ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS", "").lower() == "true"
+    ENABLE_LOOP_LAG_MONITOR = os.getenv("ENABLE_LOOP_LAG_MONITOR", "").lower() == "true"
+    LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS") or 250)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB") or 256)
+    MAX_CONCURRENT_FIGURE_DESCRIPTIONS = int(os.getenv("MAX_CONCURRENT_FIGURE_DESCRIPTIONS") or 4)
+    MAX_CONCURRENT_FIGURE_UPLOADS = int(os.getenv("MAX_CONCURRENT_FIGURE_UPLOADS") or 8)
+    MAX_CONCURRENT_FIGURE_EMBEDDINGS = int(os.getenv("MAX_CONCURRENT_FIGURE_EMBEDDINGS") or 4)
 
     # WEBSITE_HOSTNAME is always set by App Service, RUNNING_IN_PRODUCTION is set in main.bicep
     RUNNING_ON_AZURE = os.getenv("WEBSITE_HOSTNAME") is not None or os.getenv("RUNNING_IN_PRODUCTION") is not None
@@ -631,6 +767,7 @@ async def setup_clients():
             document_intelligence_service=os.getenv("AZURE_DOCUMENTINTELLIGENCE_SERVICE"),
             local_pdf_parser=os.getenv("USE_LOCAL_PDF_PARSER", "").lower() == "true",
             local_html_parser=os.getenv("USE_LOCAL_HTML_PARSER", "").lower() == "true",
+            local_pdf_parser_library=LocalPdfParserLibrary(os.getenv("LOCAL_PDF_PARSER_LIBRARY") or "pypdf"),
             use_content_understanding=os.getenv("USE_CONTENT_UNDERSTANDING", "").lower() == "true",
             content_understanding_endpoint=os.getenv("AZURE_CONTENTUNDERSTANDING_ENDPOINT"),
             use_multimodal=USE_MULTIMODAL,
@@ -673,6 +810,11 @@ async def setup_clients():
             search_field_name_embedding=AZURE_SEARCH_FIELD_NAME_EMBEDDING,
             blob_manager=user_blob_manager,
             figure_processor=figure_processor,
+            figure_limits=FigureLimits(
+                descriptions=MAX_CONCURRENT_FIGURE_DESCRIPTIONS,
+                uploads=MAX_CONCURRENT_FIGURE_UPLOADS,
+                embeddings=MAX_CONCURRENT_FIGURE_EMBEDDINGS,
+            ),
         )
         current_app.config[CONFIG_INGESTER] = ingester
 
@@ -680,6 +822,7 @@ async def setup_clients():
     if USE_MULTIMODAL:
         image_embeddings_client = ImageEmbeddings(AZURE_VISION_ENDPOINT, azure_ai_token_provider)
 
+    current_app.config[CONFIG_IMAGE_EMBEDDINGS_CLIENT] = image_embeddings_client
     current_app.config[CONFIG_OPENAI_CLIENT] = openai_client
     current_app.config[CONFIG_SEARCH_CLIENT] = search_client
     current_app.config[CONFIG_KNOWLEDGEBASE_CLIENT] = knowledgebase_client
@@ -689,6 +832,25 @@ async def setup_clients():
         knowledgebase_client_with_web_and_sharepoint
     )
     current_app.config[CONFIG_AUTH_CLIENT] = auth_helper
+    current_app.config[CONFIG_DEBUG_ENDPOINTS_ENABLED] = ENABLE_DEBUG_ENDPOINTS
+    current_app.config[CONFIG_DEBUG_ADMIN_OIDS] = AZURE_DEBUG_ADMIN_OIDS
+    # Without authentication anyone could profile the app, which is only allowed when running locally
+    current_app.config[CONFIG_DEBUG_ALLOW_UNAUTHENTICATED] = (
+        ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS and not RUNNING_ON_AZURE
+    )
+    current_app.config[CONFIG_METRICS_TOKEN] = METRICS_TOKEN
+
+    # The loop lag monitor logs the stack of calls that block the event loop, it can be toggled at runtime
+    loop_lag_monitor = LoopLagMonitor(threshold=LOOP_LAG_THRESHOLD_MS / 1000)
+    if ENABLE_LOOP_LAG_MONITOR:
+        loop_lag_monitor.start()
+    current_app.config[CONFIG_LOOP_LAG_MONITOR] = loop_lag_monitor
+
+    # The embeddings of repeated queries are cached on local disk, when a cache path is configured
+    embedding_cache = None
+    if EMBEDDING_CACHE_PATH:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+    current_app.config[CONFIG_EMBEDDING_CACHE] = embedding_cache
 
     current_app.config[CONFIG_SEMANTIC_RANKER_DEPLOYED] = AZURE_SEARCH_SEMANTIC_RANKER != "disabled"
     current_app.config[CONFIG_QUERY_REWRITING_ENABLED] = (
@@ -751,6 +913,7 @@ async def setup_clients():
         image_embeddings_client=image_embeddings_client,
         global_blob_manager=global_blob_manager,
         user_blob_manager=user_blob_manager,
+        embedding_cache=embedding_cache,
         use_web_source=current_app.config[CONFIG_WEB_SOURCE_ENABLED],
         use_sharepoint_source=current_app.config[CONFIG_SHAREPOINT_SOURCE_ENABLED],
         retrieval_reasoning_effort=AGENTIC_KNOWLEDGEBASE_REASONING_EFFORT,
@@ -783,6 +946,7 @@ async def setup_clients():
         image_embeddings_client=image_embeddings_client,
         global_blob_manager=global_blob_manager,
         user_blob_manager=user_blob_manager,
+        embedding_cache=embedding_cache,
         use_web_source=current_app.config[CONFIG_WEB_SOURCE_ENABLED],
         use_sharepoint_source=current_app.config[CONFIG_SHAREPOINT_SOURCE_ENABLED],
         retrieval_reasoning_effort=AGENTIC_KNOWLEDGEBASE_REASONING_EFFORT,
@@ -791,10 +955,17 @@ async def setup_clients():
 
 @bp.after_app_serving
 async def close_clients():
+    current_app.config[CONFIG_LOOP_LAG_MONITOR].stop()
     await current_app.config[CONFIG_SEARCH_CLIENT].close()
     await current_app.config[CONFIG_GLOBAL_BLOB_MANAGER].close_clients()
     if user_blob_manager := current_app.config.get(CONFIG_USER_BLOB_MANAGER):
         await user_blob_manager.close_clients()
+    if image_embeddings_client := current_app.config.get(CONFIG_IMAGE_EMBEDDINGS_CLIENT):
+        await image_embeddings_client.close()
+    if ingester := current_app.config.get(CONFIG_INGESTER):
+        await ingester.close()
+    if embedding_cache := current_app.config.get(CONFIG_EMBEDDING_CACHE):
+        embedding_cache.close()
     await current_app.config[CONFIG_CREDENTIAL].close()
 
 
@@ -802,6 +973,11 @@ def create_app():
     app = Quart(__name__)
     app.register_blueprint(bp)
     app.register_blueprint(chat_history_cosmosdb_bp)
+    # This middleware records Prometheus metrics, exposed by the /metrics route,
+    # and optionally reports per-stage durations with a Server-Timing header
+    app.asgi_app = MetricsMiddleware(  # type: ignore[assignment]
+        app.asgi_app, server_timing=os.getenv("ENABLE_SERVER_TIMING", "").lower() == "true"
+    )
 
     if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
         app.logger.info("APPLICATIONINSIGHTS_CONNECTION_STRING is set, enabling Azure Monitor")
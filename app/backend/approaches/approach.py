@@ -45,7 +45,14 @@ from openai.types.chat import (
 )
 
 from approaches.promptmanager import PromptManager
+from core.metrics import (
+    observe_llm_tokens,
+    record_cache_lookup,
+    track_retrieval,
+    track_stage,
+)
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings
 
 
@@ -159,9 +166,15 @@ class ThoughtStep:
     props: Optional[dict[str, Any]] = None
 
     def update_token_usage(self, usage: CompletionUsage) -> None:
+        observe_llm_tokens(usage.prompt_tokens, usage.completion_tokens)
         if self.props:
             self.props["token_usage"] = TokenUsageProps.from_completion_usage(usage)
 
+    def update_stage_timings(self, timings: dict[str, float]) -> None:
+        if self.props is None:
+            self.props = {}
+        self.props["stage_timings"] = timings
+
 
 @dataclass
 class AgenticRetrievalResults:
@@ -258,6 +271,7 @@ class Approach(ABC):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
     ):
         self.search_client = search_client
         self.openai_client = openai_client
@@ -281,6 +295,7 @@ class Approach(ABC):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.embedding_cache = embedding_cache
 
     def build_filter(self, overrides: dict[str, Any]) -> Optional[str]:
         include_category = overrides.get("include_category")
@@ -307,59 +322,60 @@ class Approach(ABC):
         use_query_rewriting: Optional[bool] = None,
         access_token: Optional[str] = None,
     ) -> list[Document]:
-        search_text = query_text if use_text_search else ""
-        search_vectors = vectors if use_vector_search else []
-        if use_semantic_ranker:
-            results = await self.search_client.search(
-                search_text=search_text,
-                filter=filter,
-                top=top,
-                query_caption="extractive|highlight-false" if use_semantic_captions else None,
-                query_rewrites="generative" if use_query_rewriting else None,
-                vector_queries=search_vectors,
-                query_type=QueryType.SEMANTIC,
-                query_language=self.query_language,
-                query_speller=self.query_speller,
-                semantic_configuration_name="default",
-                semantic_query=query_text,
-                x_ms_query_source_authorization=access_token,
-            )
-        else:
-            results = await self.search_client.search(
-                search_text=search_text,
-                filter=filter,
-                top=top,
-                vector_queries=search_vectors,
-                x_ms_query_source_authorization=access_token,
-            )
+        with track_retrieval():
+            search_text = query_text if use_text_search else ""
+            search_vectors = vectors if use_vector_search else []
+            if use_semantic_ranker:
+                results = await self.search_client.search(
+                    search_text=search_text,
+                    filter=filter,
+                    top=top,
+                    query_caption="extractive|highlight-false" if use_semantic_captions else None,
+                    query_rewrites="generative" if use_query_rewriting else None,
+                    vector_queries=search_vectors,
+                    query_type=QueryType.SEMANTIC,
+                    query_language=self.query_language,
+                    query_speller=self.query_speller,
+                    semantic_configuration_name="default",
+                    semantic_query=query_text,
+                    x_ms_query_source_authorization=access_token,
+                )
+            else:
+                results = await self.search_client.search(
+                    search_text=search_text,
+                    filter=filter,
+                    top=top,
+                    vector_queries=search_vectors,
+                    x_ms_query_source_authorization=access_token,
+                )
 
-        documents: list[Document] = []
-        async for page in results.by_page():
-            async for document in page:
-                documents.append(
-                    Document(
-                        id=document.get("id"),
-                        content=document.get("content"),
-                        category=document.get("category"),
-                        sourcepage=document.get("sourcepage"),
-                        sourcefile=document.get("sourcefile"),
-                        oids=document.get("oids"),
-                        groups=document.get("groups"),
-                        captions=cast(list[QueryCaptionResult], document.get("@search.captions")),
-                        score=document.get("@search.score"),
-                        reranker_score=document.get("@search.reranker_score"),
-                        images=document.get("images"),
+            documents: list[Document] = []
+            async for page in results.by_page():
+                async for document in page:
+                    documents.append(
+                        Document(
+                            id=document.get("id"),
+                            content=document.get("content"),
+                            category=document.get("category"),
+                            sourcepage=document.get("sourcepage"),
+                            sourcefile=document.get("sourcefile"),
+                            oids=document.get("oids"),
+                            groups=document.get("groups"),
+                            captions=cast(list[QueryCaptionResult], document.get("@search.captions")),
+                            score=document.get("@search.score"),
+                            reranker_score=document.get("@search.reranker_score"),
+                            images=document.get("images"),
+                        )
                     )
-                )
 
-            qualified_documents = [
-                doc
-                for doc in documents
-                if (
-                    (doc.score or 0) >= (minimum_search_score or 0)
-                    and (doc.reranker_score or 0) >= (minimum_reranker_score or 0)
-                )
-            ]
+                qualified_documents = [
+                    doc
+                    for doc in documents
+                    if (
+                        (doc.score or 0) >= (minimum_search_score or 0)
+                        and (doc.reranker_score or 0) >= (minimum_reranker_score or 0)
+                    )
+                ]
 
         return qualified_documents
 
@@ -405,22 +421,24 @@ class Approach(ABC):
         temperature: float = 0.0,
         no_response_token: Optional[str] = None,
     ) -> RewriteQueryResult:
-        query_messages = self.prompt_manager.render_prompt(prompt_template, prompt_variables)
+        with track_stage("prompt_render"):
+            query_messages = self.prompt_manager.render_prompt(prompt_template, prompt_variables)
         rewrite_reasoning_effort = self.get_lowest_reasoning_effort(self.chatgpt_model)
 
-        chat_completion = cast(
-            ChatCompletion,
-            await self.create_chat_completion(
-                chatgpt_deployment,
-                chatgpt_model,
-                messages=query_messages,
-                overrides=overrides,
-                response_token_limit=response_token_limit,
-                temperature=temperature,
-                tools=tools,
-                reasoning_effort=rewrite_reasoning_effort,
-            ),
-        )
+        with track_stage("query_rewrite"):
+            chat_completion = cast(
+                ChatCompletion,
+                await self.create_chat_completion(
+                    chatgpt_deployment,
+                    chatgpt_model,
+                    messages=query_messages,
+                    overrides=overrides,
+                    response_token_limit=response_token_limit,
+                    temperature=temperature,
+                    tools=tools,
+                    reasoning_effort=rewrite_reasoning_effort,
+                ),
+            )
 
         rewritten_query = self.extract_rewritten_query(
             chat_completion,
@@ -556,10 +574,11 @@ class Approach(ABC):
         }
         request_kwargs.update(agentic_retrieval_input)
 
-        response = await knowledgebase_client.retrieve(
-            retrieval_request=KnowledgeBaseRetrievalRequest(**request_kwargs),
-            x_ms_query_source_authorization=access_token,
-        )
+        with track_retrieval():
+            response = await knowledgebase_client.retrieve(
+                retrieval_request=KnowledgeBaseRetrievalRequest(**request_kwargs),
+                x_ms_query_source_authorization=access_token,
+            )
 
         # Map activity id -> agent's internal search query and citation
         activities = response.activity or []
@@ -887,13 +906,22 @@ class Approach(ABC):
         dimensions_args: ExtraArgs = (
             {"dimensions": self.embedding_dimensions} if SUPPORTED_DIMENSIONS_MODEL[self.embedding_model] else {}
         )
-        embedding = await self.openai_client.embeddings.create(
-            # Azure OpenAI takes the deployment name as the model name
-            model=self.embedding_deployment if self.embedding_deployment else self.embedding_model,
-            input=q,
-            **dimensions_args,
-        )
-        query_vector = embedding.data[0].embedding
+        with track_stage("embedding"):
+            query_vector = None
+            if self.embedding_cache is not None:
+                cache_key = EmbeddingCache.key(self.embedding_model, dimensions_args.get("dimensions"), q)
+                query_vector = (await self.embedding_cache.aget_many([cache_key])).get(cache_key)
+                record_cache_lookup("query_embedding", query_vector is not None)
+            if query_vector is None:
+                embedding = await self.openai_client.embeddings.create(
+                    # Azure OpenAI takes the deployment name as the model name
+                    model=self.embedding_deployment if self.embedding_deployment else self.embedding_model,
+                    input=q,
+                    **dimensions_args,
+                )
+                query_vector = embedding.data[0].embedding
+                if self.embedding_cache is not None:
+                    await self.embedding_cache.aput_many([(cache_key, query_vector)])
         # This performs an oversampling due to how the search index was setup,
         # so we do not need to explicitly pass in an oversampling parameter here
         return VectorizedQuery(vector=query_vector, k=50, fields=self.embedding_field)
@@ -901,7 +929,8 @@ class Approach(ABC):
     async def compute_multimodal_embedding(self, q: str):
         if not self.image_embeddings_client:
             raise ValueError("Approach is missing an image embeddings client for multimodal queries")
-        multimodal_query_vector = await self.image_embeddings_client.create_embedding_for_text(q)
+        with track_stage("embedding"):
+            multimodal_query_vector = await self.image_embeddings_client.create_embedding_for_text(q)
         return VectorizedQuery(vector=multimodal_query_vector, k=50, fields="images/embedding")
 
     def get_system_prompt_variables(self, override_prompt: Optional[str]) -> dict[str, str]:
@@ -995,6 +1024,7 @@ class Approach(ABC):
                 "reasoning_effort", self.reasoning_effort
             )
         if usage:
+            observe_llm_tokens(usage.prompt_tokens, usage.completion_tokens)
             properties["token_usage"] = TokenUsageProps.from_completion_usage(usage)
         return ThoughtStep(title, messages, properties)
 
@@ -21,7 +21,9 @@ from approaches.approach import (
     ThoughtStep,
 )
 from approaches.promptmanager import PromptManager
+from core.metrics import stage_timings, track_stage
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings
 
 
@@ -62,6 +64,7 @@ class ChatReadRetrieveReadApproach(Approach):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
         use_web_source: bool = False,
         use_sharepoint_source: bool = False,
         retrieval_reasoning_effort: Optional[str] = None,
@@ -95,6 +98,7 @@ class ChatReadRetrieveReadApproach(Approach):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.embedding_cache = embedding_cache
         # Track whether web source retrieval is enabled for this deployment; overrides may only disable it.
         self.web_source_enabled = use_web_source
         self.use_sharepoint_source = use_sharepoint_source
@@ -122,7 +126,8 @@ class ChatReadRetrieveReadApproach(Approach):
         extra_info, chat_coroutine = await self.run_until_final_call(
             messages, overrides, auth_claims, should_stream=False
         )
-        chat_completion_response: ChatCompletion = await cast(Awaitable[ChatCompletion], chat_coroutine)
+        with track_stage("answer"):
+            chat_completion_response: ChatCompletion = await cast(Awaitable[ChatCompletion], chat_coroutine)
         content = chat_completion_response.choices[0].message.content
         role = chat_completion_response.choices[0].message.role
         if overrides.get("suggest_followup_questions"):
@@ -132,6 +137,8 @@ class ChatReadRetrieveReadApproach(Approach):
         # TODO: Update for agentic? This isn't still true?
         if self.include_token_usage and extra_info.thoughts and chat_completion_response.usage:
             extra_info.thoughts[-1].update_token_usage(chat_completion_response.usage)
+        if extra_info.thoughts and (timings := stage_timings()):
+            extra_info.thoughts[-1].update_stage_timings(timings)
         chat_app_response = {
             "message": {"content": content, "role": role},
             "context": {
@@ -297,18 +304,19 @@ class ChatReadRetrieveReadApproach(Approach):
 
             return (extra_info, return_answer())
 
-        messages = self.prompt_manager.render_prompt(
-            self.answer_prompt,
-            self.get_system_prompt_variables(overrides.get("prompt_template"))
-            | {
-                "include_follow_up_questions": bool(overrides.get("suggest_followup_questions")),
-                "past_messages": messages[:-1],
-                "user_query": original_user_query,
-                "text_sources": extra_info.data_points.text,
-                "image_sources": extra_info.data_points.images,
-                "citations": extra_info.data_points.citations,
-            },
-        )
+        with track_stage("prompt_render"):
+            messages = self.prompt_manager.render_prompt(
+                self.answer_prompt,
+                self.get_system_prompt_variables(overrides.get("prompt_template"))
+                | {
+                    "include_follow_up_questions": bool(overrides.get("suggest_followup_questions")),
+                    "past_messages": messages[:-1],
+                    "user_query": original_user_query,
+                    "text_sources": extra_info.data_points.text,
+                    "image_sources": extra_info.data_points.images,
+                    "citations": extra_info.data_points.citations,
+                },
+            )
 
         chat_coroutine = cast(
             Awaitable[ChatCompletion] | Awaitable[AsyncStream[ChatCompletionChunk]],
@@ -13,7 +13,9 @@ from approaches.approach import (
     ThoughtStep,
 )
 from approaches.promptmanager import PromptManager
+from core.metrics import stage_timings, track_stage
 from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings
 
 
@@ -52,6 +54,7 @@ class RetrieveThenReadApproach(Approach):
         image_embeddings_client: Optional[ImageEmbeddings] = None,
         global_blob_manager: Optional[BlobManager] = None,
         user_blob_manager: Optional[AdlsBlobManager] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
         use_web_source: bool = False,
         use_sharepoint_source: bool = False,
         retrieval_reasoning_effort: Optional[str] = None,
@@ -84,6 +87,7 @@ class RetrieveThenReadApproach(Approach):
         self.image_embeddings_client = image_embeddings_client
         self.global_blob_manager = global_blob_manager
         self.user_blob_manager = user_blob_manager
+        self.embedding_cache = embedding_cache
         # Track whether web source retrieval is enabled; overrides may only turn it off.
         self.web_source_enabled = use_web_source
         self.use_sharepoint_source = use_sharepoint_source
@@ -111,27 +115,29 @@ class RetrieveThenReadApproach(Approach):
             answer = extra_info.answer
         else:
             # Process results
-            messages = self.prompt_manager.render_prompt(
-                self.answer_prompt,
-                self.get_system_prompt_variables(overrides.get("prompt_template"))
-                | {
-                    "user_query": q,
-                    "text_sources": extra_info.data_points.text,
-                    "image_sources": extra_info.data_points.images or [],
-                    "citations": extra_info.data_points.citations or [],
-                },
-            )
+            with track_stage("prompt_render"):
+                messages = self.prompt_manager.render_prompt(
+                    self.answer_prompt,
+                    self.get_system_prompt_variables(overrides.get("prompt_template"))
+                    | {
+                        "user_query": q,
+                        "text_sources": extra_info.data_points.text,
+                        "image_sources": extra_info.data_points.images or [],
+                        "citations": extra_info.data_points.citations or [],
+                    },
+                )
 
-            chat_completion = cast(
-                ChatCompletion,
-                await self.create_chat_completion(
-                    self.chatgpt_deployment,
-                    self.chatgpt_model,
-                    messages=messages,
-                    overrides=overrides,
-                    response_token_limit=self.get_response_token_limit(self.chatgpt_model, 1024),
-                ),
-            )
+            with track_stage("answer"):
+                chat_completion = cast(
+                    ChatCompletion,
+                    await self.create_chat_completion(
+                        self.chatgpt_deployment,
+                        self.chatgpt_model,
+                        messages=messages,
+                        overrides=overrides,
+                        response_token_limit=self.get_response_token_limit(self.chatgpt_model, 1024),
+                    ),
+                )
             extra_info.thoughts.append(
                 self.format_thought_step_for_chatcompletion(
                     title="Prompt to generate answer",
@@ -144,6 +150,9 @@ class RetrieveThenReadApproach(Approach):
             )
             answer = chat_completion.choices[0].message.content or ""
 
+        if extra_info.thoughts and (timings := stage_timings()):
+            extra_info.thoughts[-1].update_stage_timings(timings)
+
         return {
             "message": {
                 "content": answer,
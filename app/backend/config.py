@@ -41,3 +41,10 @@ CONFIG_RAG_SEND_TEXT_SOURCES = "rag_send_text_sources"
 CONFIG_RAG_SEND_IMAGE_SOURCES = "rag_send_image_sources"
 CONFIG_WEB_SOURCE_ENABLED = "web_source_enabled"
 CONFIG_SHAREPOINT_SOURCE_ENABLED = "sharepoint_source_enabled"
+CONFIG_DEBUG_ENDPOINTS_ENABLED = "debug_endpoints_enabled"
+CONFIG_DEBUG_ADMIN_OIDS = "debug_admin_oids"
+CONFIG_DEBUG_ALLOW_UNAUTHENTICATED = "debug_allow_unauthenticated"
+CONFIG_LOOP_LAG_MONITOR = "loop_lag_monitor"
+CONFIG_METRICS_TOKEN = "metrics_token"
+CONFIG_EMBEDDING_CACHE = "embedding_cache"
+CONFIG_IMAGE_EMBEDDINGS_CLIENT = "image_embeddings_client"
@@ -1,8 +1,12 @@
 # Refactored from https://github.com/Azure-Samples/ms-identity-python-on-behalf-of
 
+import asyncio
 import base64
+import hashlib
 import json
 import logging
+import re
+import time
 from typing import Any, Optional
 
 import aiohttp
@@ -21,6 +25,15 @@ from tenacity import (
 )
 
 
+def _prune(cache: dict[Any, tuple], now: float, max_size: int):
+    """Make room in a cache whose entries start with their expiry time, dropping everything if none has expired"""
+    if len(cache) >= max_size:
+        for key in [key for key, entry in cache.items() if entry[0] <= now]:
+            del cache[key]
+        if len(cache) >= max_size:
+            cache.clear()
+
+
 # AuthError is raised when the authentication token sent by the client UI cannot be parsed or there is an authentication error accessing the graph API
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -33,6 +46,13 @@ class AuthError(Exception):
 
 class AuthenticationHelper:
     scope: str = "https://search.azure.com/.default"
+    # Entries of the path authorization and validated token caches, beyond which the expired ones are dropped
+    PATH_AUTH_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_SIZE: int = 10000
+    # How long the signing keys are kept when the response has no Cache-Control max-age
+    JWKS_DEFAULT_MAX_AGE: float = 3600
+    # Tokens signed with an unknown key refetch the keys at most this often
+    JWKS_MIN_REFRESH_INTERVAL: float = 60
 
     def __init__(
         self,
@@ -44,6 +64,7 @@ class AuthenticationHelper:
         tenant_id: Optional[str],
         enforce_access_control: bool = False,
         enable_unauthenticated_access: bool = False,
+        path_auth_ttl: float = 60,
     ):
         self.use_authentication = use_authentication
         self.server_app_id = server_app_id
@@ -60,6 +81,18 @@ class AuthenticationHelper:
         self.valid_audiences = [f"api://{server_app_id}", str(server_app_id)]
         # See https://learn.microsoft.com/entra/identity-platform/access-tokens#validate-the-issuer for more information on token validation
         self.key_url = f"{self.authority}/discovery/v2.0/keys"
+        # Results of check_path_auth per user and path, so that fetching the pages of a document
+        # doesn't run a search query for every request
+        self.path_auth_ttl = path_auth_ttl
+        self.path_auth_cache: dict[tuple[str, str], tuple[float, bool]] = {}
+        # Signing keys of Entra, their public keys by key ID, and the expiry of the tokens already validated,
+        # so that requests don't each download the keys and check the signature again
+        self.jwks: Optional[dict[str, Any]] = None
+        self.jwks_expires = 0.0
+        self.jwks_fetched = 0.0
+        self.jwks_lock = asyncio.Lock()
+        self.public_keys: dict[str, bytes] = {}
+        self.validated_tokens: dict[bytes, tuple[float]] = {}
 
         if self.use_authentication:
             field_names = [field.name for field in search_index.fields] if search_index else []
@@ -187,6 +220,11 @@ class AuthenticationHelper:
         # Sourcepage is used for GPT-4V
         # Replace ' with '' to escape the single quote for the filter
         # https://learn.microsoft.com/azure/search/query-odata-filter-orderby-syntax#escaping-special-characters-in-string-constants
+        cache_key = (auth_claims.get("oid", ""), path)
+        cached = self.path_auth_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
         path_for_filter = path.replace("'", "''")
         filter = f"(sourcefile eq '{path_for_filter}') or (sourcepage eq '{path_for_filter}')"
 
@@ -200,6 +238,9 @@ class AuthenticationHelper:
             allowed = True
             break
 
+        if cache_key[0]:
+            _prune(self.path_auth_cache, time.monotonic(), self.PATH_AUTH_CACHE_SIZE)
+            self.path_auth_cache[cache_key] = (time.monotonic() + self.path_auth_ttl, allowed)
         return allowed
 
     async def create_pem_format(self, jwks, token):
@@ -220,29 +261,74 @@ class AuthenticationHelper:
                 rsa_key = pem_key
                 return rsa_key
 
+    async def get_jwks(self, refresh: bool = False) -> dict[str, Any]:
+        """
+        Get the signing keys of Entra, downloading them again once they expire as per their Cache-Control header.
+        With refresh, they are downloaded again unless that was just done, as when a token names an unknown key.
+        Concurrent callers share a single download.
+        """
+        async with self.jwks_lock:
+            now = time.monotonic()
+            if self.jwks is not None:
+                if refresh and now - self.jwks_fetched < self.JWKS_MIN_REFRESH_INTERVAL:
+                    return self.jwks
+                if not refresh and now < self.jwks_expires:
+                    return self.jwks
+
+            jwks = None
+            max_age = self.JWKS_DEFAULT_MAX_AGE
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(AuthError),
+                wait=wait_random_exponential(min=15, max=60),
+                stop=stop_after_attempt(5),
+            ):
+                with attempt:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(url=self.key_url) as resp:
+                            resp_status = resp.status
+                            if resp_status in [500, 502, 503, 504]:
+                                raise AuthError(
+                                    error=f"Failed to get keys info: {await resp.text()}", status_code=resp_status
+                                )
+                            jwks = await resp.json()
+                            if match := re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", "")):
+                                max_age = int(match.group(1))
+
+            if not jwks or "keys" not in jwks:
+                raise AuthError("Unable to get keys to validate auth token.", 401)
+
+            self.jwks = jwks
+            self.jwks_fetched = time.monotonic()
+            self.jwks_expires = self.jwks_fetched + max_age
+            # Forget the public keys of the signing keys that were removed
+            kids = {key.get("kid") for key in jwks["keys"]}
+            self.public_keys = {kid: pem for kid, pem in self.public_keys.items() if kid in kids}
+            return jwks
+
+    async def get_public_key(self, token: str) -> Optional[bytes]:
+        """Get the public key that signed the token, refreshing the signing keys once if it is unknown"""
+        jwks = await self.get_jwks()
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid in self.public_keys:
+            return self.public_keys[kid]
+        rsa_key = await self.create_pem_format(jwks, token)
+        if not rsa_key:
+            jwks = await self.get_jwks(refresh=True)
+            rsa_key = await self.create_pem_format(jwks, token)
+        if rsa_key:
+            self.public_keys[kid] = rsa_key
+        return rsa_key
+
     # See https://github.com/Azure-Samples/ms-identity-python-on-behalf-of/blob/939be02b11f1604814532fdacc2c2eccd198b755/FlaskAPI/helpers/authorization.py#L44
     async def validate_access_token(self, token: str):
         """
         Validate an access token is issued by Entra
+        Tokens already validated are not checked again until they expire.
         """
-        jwks = None
-        async for attempt in AsyncRetrying(
-            retry=retry_if_exception_type(AuthError),
-            wait=wait_random_exponential(min=15, max=60),
-            stop=stop_after_attempt(5),
-        ):
-            with attempt:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url=self.key_url) as resp:
-                        resp_status = resp.status
-                        if resp_status in [500, 502, 503, 504]:
-                            raise AuthError(
-                                error=f"Failed to get keys info: {await resp.text()}", status_code=resp_status
-                            )
-                        jwks = await resp.json()
-
-        if not jwks or "keys" not in jwks:
-            raise AuthError("Unable to get keys to validate auth token.", 401)
+        token_key = hashlib.sha256(token.encode()).digest()
+        validated = self.validated_tokens.get(token_key)
+        if validated is not None and validated[0] > time.time():
+            return
 
         rsa_key = None
         issuer = None
@@ -251,7 +337,7 @@ class AuthenticationHelper:
             unverified_claims = jwt.decode(token, options={"verify_signature": False})
             issuer = unverified_claims.get("iss")
             audience = unverified_claims.get("aud")
-            rsa_key = await self.create_pem_format(jwks, token)
+            rsa_key = await self.get_public_key(token)
         except jwt.PyJWTError as exc:
             raise AuthError("Unable to parse authorization token.", 401) from exc
         if not rsa_key:
@@ -267,7 +353,7 @@ class AuthenticationHelper:
             )
 
         try:
-            jwt.decode(token, rsa_key, algorithms=["RS256"], audience=audience, issuer=issuer)
+            claims = jwt.decode(token, rsa_key, algorithms=["RS256"], audience=audience, issuer=issuer)
         except jwt.ExpiredSignatureError as jwt_expired_exc:
             raise AuthError("Token is expired", 401) from jwt_expired_exc
         except (jwt.InvalidAudienceError, jwt.InvalidIssuerError) as jwt_claims_exc:
@@ -277,3 +363,7 @@ class AuthenticationHelper:
             ) from jwt_claims_exc
         except Exception as exc:
             raise AuthError("Unable to parse authorization token.", 401) from exc
+
+        if "exp" in claims:
+            _prune(self.validated_tokens, time.time(), self.TOKEN_CACHE_SIZE)
+            self.validated_tokens[token_key] = (float(claims["exp"]),)
@@ -40,6 +40,19 @@ class Settings(BaseSettings):
     # Storage Configuration
     MAIN_BUCKET_NAME: Optional[str] = None
     TEMP_UPLOADS_BUCKET: Optional[str] = None
+    STORAGE_MAX_WORKERS: int = 8
+    STORAGE_LIST_PAGE_SIZE: int = 1000
+
+    # Citations (/content): files are streamed from Cloud Storage in chunks, or redirected to a signed URL,
+    # and small files such as page images are also kept in memory (0 disables the cache)
+    CONTENT_CHUNK_SIZE: int = 1024 * 1024
+    CONTENT_SIGNED_URL_REDIRECT: bool = False
+    CONTENT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    CONTENT_CACHE_MAX_FILE_BYTES: int = 1024 * 1024
+    CONTENT_MAX_AGE_SECONDS: int = 3600
+
+    # Agent teardown: a running job that reported no progress for this long can be retried
+    TEARDOWN_STALE_SECONDS: int = 600
 
     # Application Configuration
     MAX_FILE_SIZE_MB: int = 50
@@ -54,6 +67,20 @@ class Settings(BaseSettings):
     # CORS Configuration - stored as string, converted to list
     CORS_ORIGINS: str = "*"
 
+    # Startup: initialize SDK clients in the background once the server is up
+    WARMUP_ON_STARTUP: bool = False
+    WARMUP_DELAY_SECONDS: float = 0.5
+
+    # Report per-stage durations with a Server-Timing header (or a final frame for streams)
+    ENABLE_SERVER_TIMING: bool = False
+
+    # Bearer token of the Prometheus scraper, /metrics is not served without it
+    METRICS_TOKEN: Optional[str] = None
+
+    # Log the stack of calls blocking the event loop for longer than the threshold
+    ENABLE_LOOP_LAG_MONITOR: bool = False
+    LOOP_LAG_THRESHOLD_MS: float = 250
+
     # Logging
     LOG_LEVEL: str = "INFO"
 
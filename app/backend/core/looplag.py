@@ -0,0 +1,153 @@
+"""
+Event loop lag monitor, shared by the Quart (app.py) and FastAPI (main.py) backends.
+
+A heartbeat task measures how late the event loop wakes it up (the scheduling delay) and records
+it in the rag_event_loop_lag_seconds histogram. A watchdog thread checks the heartbeat, and when
+the loop has not ticked for longer than the threshold, some code is running a blocking call on the
+loop. The watchdog then captures the stack of the loop thread while it is still blocked, and logs it
+with the route of the request that was running, so blocking hot spots can be found and fixed.
+
+The monitor can be started, stopped and reconfigured at runtime.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from contextvars import Context
+from typing import Any, Optional
+
+from core.metrics import (
+    EVENT_LOOP_BLOCKED,
+    EVENT_LOOP_LAG,
+    RequestMetrics,
+    peek_request_metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, stack_limit: int = 30):
+        """
+        Args:
+            interval: Seconds between two heartbeats, also how often the watchdog checks them
+            threshold: Seconds the loop may go without a heartbeat before the blocking stack is captured
+            stack_limit: Maximum number of frames logged for a blocking stack
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._last_tick = 0.0
+        self._previous_task_factory: Any = None
+        # Tasks don't expose their context before Python 3.12, so remember which request created each task
+        self._task_requests: weakref.WeakKeyDictionary[asyncio.Task, RequestMetrics] = weakref.WeakKeyDictionary()
+        self.blocked_count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._heartbeat_task is not None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_ms": round(self.interval * 1000),
+            "threshold_ms": round(self.threshold * 1000),
+            "blocked_count": self.blocked_count,
+        }
+
+    def configure(self, threshold: Optional[float] = None, interval: Optional[float] = None):
+        if threshold is not None:
+            if threshold <= 0:
+                raise ValueError("threshold must be positive")
+            self.threshold = threshold
+        if interval is not None:
+            if interval <= 0:
+                raise ValueError("interval must be positive")
+            self.interval = interval
+
+    def start(self):
+        """Start monitoring the running event loop, must be called from a coroutine on that loop"""
+        if self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._previous_task_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._task_factory)
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("Event loop lag monitor started (threshold %.0f ms)", self.threshold * 1000)
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._loop is not None and self._loop.get_task_factory() == self._task_factory:
+            self._loop.set_task_factory(self._previous_task_factory)
+        self._task_requests.clear()
+        logger.info("Event loop lag monitor stopped")
+
+    def _task_factory(self, loop: asyncio.AbstractEventLoop, coro, context: Optional[Context] = None):
+        # Tasks and task factories don't take a context on Python 3.10, whose loops never pass one
+        kwargs = {} if context is None else {"context": context}
+        if self._previous_task_factory is not None:
+            task = self._previous_task_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        if request_metrics := peek_request_metrics(context):
+            self._task_requests[task] = request_metrics
+        return task
+
+    async def _heartbeat(self):
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.monotonic() - self._last_tick - self.interval))
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stopped.wait(self.interval):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.interval
+            # Report each stall once, while the loop is still blocked so the stack shows the culprit
+            if blocked_for > self.threshold and last_tick != reported_tick:
+                reported_tick = last_tick
+                self._report_blocked(blocked_for)
+
+    def _report_blocked(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id) if self._loop_thread_id else None
+        if frame is None:
+            return
+        stack = "".join(traceback.format_stack(frame, limit=self.stack_limit))
+        endpoint = self._current_endpoint()
+        self.blocked_count += 1
+        EVENT_LOOP_BLOCKED.labels(endpoint=endpoint).inc()
+        logger.warning(
+            "Event loop blocked for more than %.0f ms while serving %s, stack of the loop thread:\n%s",
+            blocked_for * 1000,
+            endpoint,
+            stack,
+        )
+
+    def _current_endpoint(self) -> str:
+        # asyncio keeps the task running on each loop in this mapping, reading it from another thread is safe
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+        task = current_tasks.get(self._loop) if current_tasks is not None else None
+        request_metrics = self._task_requests.get(task) if task is not None else None
+        if request_metrics is None:
+            return "unknown"
+        return request_metrics.labels()["endpoint"]
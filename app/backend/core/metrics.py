@@ -0,0 +1,287 @@
+"""
+Prometheus metrics shared by the Quart (app.py) and FastAPI (main.py) backends.
+
+Metrics live in the default prometheus_client registry of the worker process and are
+exposed in the text format by the /metrics route of each app, so no cloud exporter is needed.
+The route is only served when a METRICS_TOKEN is configured, to scrapers sending it as a bearer
+token (Authorization: Bearer <token>), as metrics reveal the routes, agents and traffic of the app.
+Request-scoped labels (endpoint and agent) are kept in a context variable set by MetricsMiddleware,
+so code deep in the approaches and services can record metrics without threading labels through.
+
+The same context collects per-stage durations (auth, search, first token, ...) of the request.
+When server timing is enabled they are sent back as a Server-Timing header, or in a final
+frame by the streaming endpoints, so browser devtools and load tests get a latency breakdown.
+"""
+
+import hmac
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+__all__ = [
+    "CONTENT_TYPE_LATEST",
+    "MetricsMiddleware",
+    "format_server_timing",
+    "generate_latest",
+    "metrics_authorized",
+    "observe_first_token",
+    "observe_llm_tokens",
+    "record_cache_lookup",
+    "set_metrics_agent",
+    "set_metrics_endpoint",
+    "stage_timings",
+    "track_firestore",
+    "track_retrieval",
+    "track_stage",
+    "track_stream",
+]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+REQUEST_LATENCY = Histogram(
+    "rag_request_duration_seconds",
+    "Time from receiving a request until its response body has been fully sent",
+    ["endpoint", "agent", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "rag_time_to_first_token_seconds",
+    "Time from receiving a chat request until the first answer token is produced",
+    ["endpoint", "agent"],
+    buckets=LATENCY_BUCKETS,
+)
+RETRIEVAL_LATENCY = Histogram(
+    "rag_retrieval_duration_seconds",
+    "Time spent retrieving sources (Azure AI Search or Vertex AI RAG)",
+    ["endpoint", "agent"],
+    buckets=LATENCY_BUCKETS,
+)
+FIRESTORE_LATENCY = Histogram(
+    "rag_firestore_duration_seconds",
+    "Time spent in Firestore calls",
+    ["endpoint", "agent", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "rag_llm_tokens",
+    "Tokens per LLM call, by direction (input or output)",
+    ["endpoint", "agent", "direction"],
+    buckets=TOKEN_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "rag_cache_lookups_total",
+    "Cache lookups by cache name and result (hit or miss)",
+    ["cache", "result"],
+)
+STREAMS_IN_FLIGHT = Gauge(
+    "rag_streams_in_flight",
+    "Streaming responses currently being generated",
+    ["endpoint", "agent"],
+)
+EVENT_LOOP_LAG = Histogram(
+    "rag_event_loop_lag_seconds",
+    "Delay between when the event loop should run a callback and when it does",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "rag_event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the loop lag threshold",
+    ["endpoint"],
+)
+
+
+@dataclass
+class RequestMetrics:
+    """Labels and timestamps of the request being served"""
+
+    endpoint: Optional[str] = None
+    agent: str = ""
+    scope: Optional[dict[str, Any]] = field(default=None, repr=False)
+    started: float = field(default_factory=time.perf_counter)
+    first_token_observed: bool = False
+    server_timing: bool = False
+    stages: dict[str, float] = field(default_factory=dict)
+
+    def labels(self) -> dict[str, str]:
+        endpoint, agent = self.endpoint, self.agent
+        if self.scope is not None:
+            # FastAPI adds the matched route to the ASGI scope once routing is done,
+            # Quart handlers set the endpoint explicitly
+            endpoint = endpoint or getattr(self.scope.get("route"), "path", None)
+        return {"endpoint": endpoint or "unknown", "agent": agent}
+
+    def timings(self) -> dict[str, float]:
+        """Stage durations in milliseconds, empty unless server timing is enabled"""
+        if not self.server_timing:
+            return {}
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+
+_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def current_request_metrics() -> RequestMetrics:
+    """Return the metrics of the current request, or a detached one outside of a request"""
+    metrics = _request_metrics.get()
+    if metrics is None:
+        metrics = RequestMetrics()
+        _request_metrics.set(metrics)
+    return metrics
+
+
+def peek_request_metrics(context: Optional[Context] = None) -> Optional[RequestMetrics]:
+    """Return the request metrics of a context (the current one by default) without creating them"""
+    if context is not None:
+        return context.get(_request_metrics)
+    return _request_metrics.get()
+
+
+def metrics_authorized(authorization: Optional[str], token: Optional[str]) -> bool:
+    """Whether the Authorization header of a request to /metrics holds the configured bearer token"""
+    if not token or not authorization:
+        return False
+    scheme, _, credentials = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def set_metrics_endpoint(endpoint: str):
+    current_request_metrics().endpoint = endpoint
+
+
+def set_metrics_agent(agent: Optional[str]):
+    """
+    Label the metrics of the current request with an agent id.
+    Only call it with the id of an agent that was loaded, as ids coming straight from the request
+    would let clients create any number of label series.
+    """
+    current_request_metrics().agent = agent or ""
+
+
+def observe_first_token():
+    """Record the time to first token, only the first call per request is counted"""
+    metrics = current_request_metrics()
+    if metrics.first_token_observed:
+        return
+    metrics.first_token_observed = True
+    elapsed = time.perf_counter() - metrics.started
+    metrics.stages["first_token"] = elapsed
+    TIME_TO_FIRST_TOKEN.labels(**metrics.labels()).observe(elapsed)
+
+
+def observe_llm_tokens(input_tokens: Optional[int], output_tokens: Optional[int]):
+    labels = current_request_metrics().labels()
+    if input_tokens is not None:
+        LLM_TOKENS.labels(direction="input", **labels).observe(input_tokens)
+    if output_tokens is not None:
+        LLM_TOKENS.labels(direction="output", **labels).observe(output_tokens)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Add the duration of the block to the named stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = current_request_metrics().stages
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+def stage_timings() -> dict[str, float]:
+    return current_request_metrics().timings()
+
+
+def format_server_timing(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
+
+
+@contextmanager
+def track_retrieval() -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        with track_stage("search"):
+            yield
+    finally:
+        RETRIEVAL_LATENCY.labels(**current_request_metrics().labels()).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def track_firestore(operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        FIRESTORE_LATENCY.labels(operation=operation, **current_request_metrics().labels()).observe(
+            time.perf_counter() - started
+        )
+
+
+@contextmanager
+def track_stream() -> Iterator[None]:
+    """Count a streaming response as in flight for the duration of the block"""
+    gauge = STREAMS_IN_FLIGHT.labels(**current_request_metrics().labels())
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records request latency and sets up the request-scoped metric labels.
+    The endpoint label is the route template (e.g. /api/agents/{agent_id}), never the raw path,
+    to keep the label cardinality bounded.
+    With server_timing enabled, the stages completed before the response starts are sent as a
+    Server-Timing header.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics(server_timing=self.server_timing, scope=scope)
+        token = _request_metrics.set(metrics)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if timings := metrics.timings():
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            labels = metrics.labels()
+            if labels["endpoint"] == "unknown":
+                labels["endpoint"] = "unmatched"
+            REQUEST_LATENCY.labels(method=scope["method"], status=str(status_code), **labels).observe(
+                time.perf_counter() - metrics.started
+            )
+            _request_metrics.reset(token)
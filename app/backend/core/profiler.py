@@ -0,0 +1,119 @@
+"""
+On-demand sampling profiler, shared by the Quart (app.py) and FastAPI (main.py) backends.
+
+A background thread samples the stacks of every thread of the worker at a fixed interval, so the
+overhead on the request path is limited to the sampling itself. The result is written in the collapsed
+stack format ("thread;outer frame;...;inner frame count" per line) understood by flamegraph.pl,
+speedscope and most other flamegraph tools.
+
+Only one profile can run per worker at a time, and both the number of distinct stacks kept in memory
+and the size of the output are capped.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+MAX_PROFILE_SECONDS = 120
+DEFAULT_INTERVAL = 0.01
+MAX_STACKS = 20000
+MAX_STACK_DEPTH = 128
+MAX_OUTPUT_BYTES = 5 * 1024 * 1024
+
+TRUNCATED_STACK = "[truncated]"
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+def format_frame(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        interval: float = DEFAULT_INTERVAL,
+        max_stacks: int = MAX_STACKS,
+        max_depth: int = MAX_STACK_DEPTH,
+    ):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def sample_once(self, exclude_thread_id: Optional[int] = None):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude_thread_id:
+                continue
+            frames: list[str] = []
+            current: Optional[FrameType] = frame
+            while current is not None and len(frames) < self.max_depth:
+                frames.append(format_frame(current))
+                current = current.f_back
+            frames.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            stack = ";".join(reversed(frames))
+            # Once the cap is reached, new stacks are only counted, to bound memory on deep or varied code
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = TRUNCATED_STACK
+            self.stacks[stack] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """Sample every thread but the calling one for the given duration"""
+        own_thread_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while (now := time.monotonic()) < deadline:
+            if now >= next_sample:
+                self.sample_once(exclude_thread_id=own_thread_id)
+                next_sample = now + self.interval
+            time.sleep(max(0.0, min(next_sample, deadline) - time.monotonic()))
+
+    def collapsed(self, max_bytes: int = MAX_OUTPUT_BYTES) -> str:
+        """Collapsed stacks, most sampled first, with the stacks that don't fit in max_bytes folded together"""
+        lines: list[str] = []
+        size = 0
+        truncated = self.stacks.get(TRUNCATED_STACK, 0)
+        for stack, count in self.stacks.most_common():
+            if stack == TRUNCATED_STACK:
+                continue
+            line = f"{stack} {count}\n"
+            if size + len(line) > max_bytes:
+                truncated += count
+                continue
+            lines.append(line)
+            size += len(line)
+        if truncated:
+            lines.append(f"{TRUNCATED_STACK} {truncated}\n")
+        return "".join(lines)
+
+
+async def profile(seconds: float, interval: float = DEFAULT_INTERVAL) -> str:
+    """
+    Profile the current worker for the given number of seconds and return the collapsed stacks.
+    The sampling runs in a separate thread so the event loop keeps serving requests meanwhile.
+    """
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    if not 0.001 <= interval <= 1:
+        raise ValueError("interval must be between 1 ms and 1 s")
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running on this worker")
+    try:
+        profiler = SamplingProfiler(interval=interval)
+        await asyncio.to_thread(profiler.run, seconds)
+        return profiler.collapsed()
+    finally:
+        _profile_lock.release()
@@ -5,8 +5,15 @@ from typing import Any, TypeVar, cast
 
 from quart import abort, current_app, request
 
-from config import CONFIG_AUTH_CLIENT, CONFIG_SEARCH_CLIENT
+from config import (
+    CONFIG_AUTH_CLIENT,
+    CONFIG_DEBUG_ADMIN_OIDS,
+    CONFIG_DEBUG_ALLOW_UNAUTHENTICATED,
+    CONFIG_DEBUG_ENDPOINTS_ENABLED,
+    CONFIG_SEARCH_CLIENT,
+)
 from core.authentication import AuthError
+from core.metrics import track_stage
 from error import error_response
 
 
@@ -22,8 +29,9 @@ def authenticated_path(route_fn: Callable[[str, dict[str, Any]], Any]):
         search_client = current_app.config[CONFIG_SEARCH_CLIENT]
         authorized = False
         try:
-            auth_claims = await auth_helper.get_auth_claims_if_enabled(request.headers)
-            authorized = await auth_helper.check_path_auth(path, auth_claims, search_client)
+            with track_stage("auth"):
+                auth_claims = await auth_helper.get_auth_claims_if_enabled(request.headers)
+                authorized = await auth_helper.check_path_auth(path, auth_claims, search_client)
         except AuthError:
             abort(403)
         except Exception as error:
@@ -50,10 +58,38 @@ def authenticated(route_fn: _C) -> _C:
     async def auth_handler(*args, **kwargs):
         auth_helper = current_app.config[CONFIG_AUTH_CLIENT]
         try:
-            auth_claims = await auth_helper.get_auth_claims_if_enabled(request.headers)
+            with track_stage("auth"):
+                auth_claims = await auth_helper.get_auth_claims_if_enabled(request.headers)
         except AuthError:
             abort(403)
 
         return await route_fn(auth_claims, *args, **kwargs)
 
     return cast(_C, auth_handler)
+
+
+def debug_admin_required(route_fn: _C) -> _C:
+    """
+    Decorator for debugging routes. They only exist when ENABLE_DEBUG_ENDPOINTS is set, and are restricted to
+    the users whose object IDs are listed in AZURE_DEBUG_ADMIN_OIDS. When authentication is disabled, they are
+    refused unless ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS is set and the app is not running on Azure
+    """
+
+    @wraps(route_fn)
+    async def admin_handler(*args, **kwargs):
+        if not current_app.config[CONFIG_DEBUG_ENDPOINTS_ENABLED]:
+            abort(404)
+        auth_helper = current_app.config[CONFIG_AUTH_CLIENT]
+        if auth_helper.use_authentication:
+            try:
+                auth_claims = await auth_helper.get_auth_claims_if_enabled(request.headers)
+            except AuthError:
+                abort(403)
+            if auth_claims.get("oid") not in current_app.config[CONFIG_DEBUG_ADMIN_OIDS]:
+                abort(403)
+        elif not current_app.config[CONFIG_DEBUG_ALLOW_UNAUTHENTICATED]:
+            abort(403)
+
+        return await route_fn(*args, **kwargs)
+
+    return cast(_C, admin_handler)
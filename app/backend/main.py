@@ -1,15 +1,21 @@
 """
 Main FastAPI application
 """
+import asyncio
 import logging
 import sys
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Header, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response
 from typing import Optional, Any
 import json
+import mimetypes
 import uuid
+from email.utils import formatdate
 
 # Configure logging FIRST
 logging.basicConfig(
@@ -18,15 +24,23 @@ logging.basicConfig(
     stream=sys.stdout
 )
 logger = logging.getLogger(__name__)
-logger.info("=" * 50)
-logger.info("Starting Vertex AI RAG Backend...")
-logger.info(f"Python version: {sys.version}")
-logger.info(f"Working directory: {os.getcwd()}")
-logger.info("=" * 50)
+logger.info(f"Starting Vertex AI RAG Backend (Python {sys.version.split()[0]}, cwd={os.getcwd()})")
 
 # Import configuration
 try:
     from core.config import get_settings
+    from core.looplag import LoopLagMonitor
+    from core.profiler import ProfilerBusyError, profile
+    from core.metrics import (
+        CONTENT_TYPE_LATEST,
+        MetricsMiddleware,
+        generate_latest,
+        metrics_authorized,
+        set_metrics_agent,
+        stage_timings,
+        track_stage,
+        track_stream,
+    )
     logger.info("Configuration module loaded")
 except Exception as e:
     logger.error(f"Failed to load configuration: {e}")
@@ -46,10 +60,11 @@ except Exception as e:
 try:
     from services.authentication import AuthenticationService
     from services.agent_service import AgentService
-    from services.document_service import DocumentService
+    from services.document_service import AmbiguousDocumentError, DocumentService
     from services.chat_service import ChatService
     from services.vertex_ai_service import VertexAIService
-    from services.storage_service import StorageService
+    from services.storage_service import ContentCache, StorageService
+    from services.content_service import ContentService, if_range_matches, not_modified, parse_range
     logger.info("Services modules loaded (lazy init)")
 except Exception as e:
     logger.error(f"Failed to load services: {e}")
@@ -59,11 +74,49 @@ except Exception as e:
 settings = get_settings()
 logger.info(f"Settings loaded - Project: {settings.GCP_PROJECT_ID or 'NOT SET'}")
 
+
+
+async def warm_up_services():
+    """Initialize SDK clients and Vertex AI off the request path"""
+    # Give the server a moment to bind the port and answer health checks first
+    await asyncio.sleep(settings.WARMUP_DELAY_SECONDS)
+    started = time.monotonic()
+    for name, service in (
+        ("auth", auth_service),
+        ("storage", storage_service),
+        ("vertex_ai", vertex_ai_service),
+        ("agent", agent_service),
+        ("document", document_service),
+        ("chat", chat_service),
+    ):
+        try:
+            # Initialization imports SDKs and creates clients, which blocks, so run it in a thread
+            await asyncio.to_thread(service._ensure_initialized)
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} service failed: {e}")
+    logger.info(f"Warm-up completed in {time.monotonic() - started:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Schedule the optional warm-up without delaying startup"""
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(warm_up_services())
+    if settings.ENABLE_LOOP_LAG_MONITOR:
+        loop_lag_monitor.start()
+    yield
+    loop_lag_monitor.stop()
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Vertex AI RAG Demo",
     description="RAG application with Vertex AI and Google Cloud",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -76,18 +129,23 @@ app.add_middleware(
 )
 logger.info(f"CORS origins: {settings.cors_origins_list}")
 
+# Prometheus metrics middleware, added last so it wraps CORS and sees every request
+app.add_middleware(MetricsMiddleware, server_timing=settings.ENABLE_SERVER_TIMING)
+
 # Initialize services (lazy - no GCP calls at startup)
 logger.info("Creating service instances (lazy initialization)...")
 auth_service = AuthenticationService()
+# Logs the stack of calls that block the event loop, can be toggled at runtime with /debug/loop-lag
+loop_lag_monitor = LoopLagMonitor(threshold=settings.LOOP_LAG_THRESHOLD_MS / 1000)
 agent_service = AgentService()
 document_service = DocumentService()
 chat_service = ChatService()
 vertex_ai_service = VertexAIService()
 storage_service = StorageService()
+content_service = ContentService(agent_service, document_service)
+# Small cited files, such as page images, kept in memory
+content_cache = ContentCache(settings.CONTENT_CACHE_MAX_BYTES, settings.CONTENT_CACHE_MAX_FILE_BYTES)
 logger.info("All service instances created successfully")
-logger.info("=" * 50)
-logger.info("Backend ready to accept requests!")
-logger.info("=" * 50)
 
 
 # Dependency for authentication
@@ -98,12 +156,13 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> User:
 
     token = authorization.replace("Bearer ", "")
     try:
-        token_data = await auth_service.verify_token(token)
-        user = await auth_service.get_or_create_user(
-            token_data["uid"],
-            token_data["email"],
-            token_data.get("name")
-        )
+        with track_stage("auth"):
+            token_data = await auth_service.verify_token(token)
+            user = await auth_service.get_or_create_user(
+                token_data["uid"],
+                token_data["email"],
+                token_data.get("name")
+            )
         return user
     except Exception as e:
         logger.error(f"Authentication error: {e}")
@@ -143,6 +202,19 @@ async def startup_check():
     }
 
 
+# Prometheus metrics, only served to scrapers holding the METRICS_TOKEN
+@app.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus metrics in the text exposition format"""
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics_authorized(authorization, settings.METRICS_TOKEN):
+        raise HTTPException(
+            status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"}
+        )
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # Debug endpoint to check configuration
 @app.get("/debug/config")
 async def debug_config():
@@ -164,6 +236,45 @@ async def debug_config():
     }
 
 
+# Event loop lag monitor
+@app.get("/debug/loop-lag")
+async def get_loop_lag_monitor(admin: User = Depends(require_admin)):
+    """Get the event loop lag monitor status (admin only)"""
+    return loop_lag_monitor.status()
+
+
+@app.post("/debug/loop-lag")
+async def update_loop_lag_monitor(request: Request, admin: User = Depends(require_admin)):
+    """Enable, disable or reconfigure the event loop lag monitor (admin only)"""
+    body = await request.json()
+    try:
+        if "threshold_ms" in body:
+            loop_lag_monitor.configure(threshold=float(body["threshold_ms"]) / 1000)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body.get("enabled") is True:
+        loop_lag_monitor.start()
+    elif body.get("enabled") is False:
+        loop_lag_monitor.stop()
+    return loop_lag_monitor.status()
+
+
+# Sampling profiler
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 30, interval_ms: float = 10, admin: User = Depends(require_admin)):
+    """Profile this worker and return flamegraph-compatible collapsed stacks (admin only)"""
+    try:
+        collapsed = await profile(seconds, interval_ms / 1000)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="profile-{int(time.time())}.collapsed"'}
+    )
+
+
 # Auth setup endpoint - required by frontend for MSAL configuration
 @app.get("/auth_setup")
 async def auth_setup():
@@ -285,7 +396,8 @@ async def ask_endpoint(request: Request):
             return create_chat_response("Le service Vertex AI n'est pas configuré.", body.get("session_state"))
 
         try:
-            response_content = vertex_ai_service.generate_response(user_message)
+            with track_stage("answer"):
+                response_content = vertex_ai_service.generate_response(user_message)
         except Exception as e:
             logger.error(f"Vertex AI error: {e}")
             response_content = f"Erreur lors de la génération de la réponse: {str(e)}"
@@ -318,7 +430,8 @@ async def chat_endpoint(request: Request):
         try:
             # Build history from previous messages
             history = [{"role": m.get("role"), "content": m.get("content", "")} for m in messages[:-1]]
-            response_content = vertex_ai_service.generate_response(user_message, history)
+            with track_stage("answer"):
+                response_content = vertex_ai_service.generate_response(user_message, history)
         except Exception as e:
             logger.error(f"Vertex AI error: {e}")
             response_content = f"Erreur lors de la génération de la réponse: {str(e)}"
@@ -345,6 +458,14 @@ async def chat_stream_endpoint(request: Request):
         user_message = messages[-1].get("content", "") if messages else ""
 
         async def generate_stream():
+            with track_stream():
+                async for line in _generate_stream():
+                    yield line
+            # Stage timings can only be sent after the body has started, so they get a final frame
+            if timings := stage_timings():
+                yield json.dumps({"timings": timings}) + "\n"
+
+        async def _generate_stream():
             full_response = ""
             retrieved_contexts = []
             citations = []
@@ -358,7 +479,9 @@ async def chat_stream_endpoint(request: Request):
                     # If agent_id provided, use RAG with context retrieval
                     if agent_id:
                         try:
-                            agent = await agent_service.get_agent(agent_id)
+                            with track_stage("agent_lookup"):
+                                agent = await agent_service.get_agent(agent_id)
+                            set_metrics_agent(agent.id)
                             if agent.corpus_id and agent.corpus_id != f"mock-corpus-{agent_id}":
                                 # Retrieve relevant contexts from RAG
                                 retrieved_contexts = await vertex_ai_service.retrieve_contexts(
@@ -370,7 +493,8 @@ async def chat_stream_endpoint(request: Request):
                                 logger.info(f"Retrieved {len(retrieved_contexts)} contexts for agent {agent_id}")
 
                                 # Build system prompt with retrieved context
-                                system_prompt = _build_rag_system_prompt(agent, retrieved_contexts)
+                                with track_stage("prompt_render"):
+                                    system_prompt = _build_rag_system_prompt(agent, retrieved_contexts)
 
                                 # Generate response with RAG context
                                 for chunk_text in vertex_ai_service.generate_response_stream(
@@ -573,7 +697,7 @@ async def upload_endpoint(file: UploadFile = File(...), authorization: Optional[
         safe_filename = f"uploads/{file_hash}_{file.filename}"
 
         # Upload to Cloud Storage
-        gcs_path = storage_service.upload_file(
+        gcs_path = await storage_service.upload_file(
             bucket_name,
             content,
             safe_filename,
@@ -619,7 +743,7 @@ async def delete_uploaded_endpoint(request: Request, authorization: Optional[str
 
         # Delete from Cloud Storage
         blob_name = f"uploads/{filename}" if not filename.startswith("uploads/") else filename
-        storage_service.delete_file(bucket_name, blob_name)
+        await storage_service.delete_file(bucket_name, blob_name)
 
         logger.info(f"File deleted: {blob_name}")
 
@@ -642,11 +766,12 @@ async def list_uploaded_endpoint(authorization: Optional[str] = Header(None)):
             logger.warning("TEMP_UPLOADS_BUCKET not configured")
             return []
 
-        # List files with 'uploads/' prefix
-        files = storage_service.list_files(bucket_name, prefix="uploads/")
-
-        # Return just the filenames without the prefix
-        filenames = [f.replace("uploads/", "") for f in files if f != "uploads/"]
+        # List files with 'uploads/' prefix, page by page
+        filenames = [
+            f.replace("uploads/", "")
+            async for f in storage_service.list_files(bucket_name, prefix="uploads/")
+            if f != "uploads/"
+        ]
 
         return filenames
 
@@ -685,13 +810,73 @@ async def delete_chat_history(session_id: str, authorization: Optional[str] = He
 
 
 @app.get("/content/{path:path}")
-async def get_content(path: str, authorization: Optional[str] = Header(None)):
-    """Get content/citations endpoint"""
-    # TODO: Implement content retrieval from Cloud Storage
-    return JSONResponse(
-        status_code=404,
-        content={"message": f"Content '{path}' not found"}
+async def get_content(request: Request, path: str, agent_id: str, user: User = Depends(get_current_user)):
+    """
+    Serve a document or image cited by an agent, from that agent's bucket.
+    The path is a gs:// path or the file name of a document of the agent given by the agent_id query parameter.
+    Files are streamed from Cloud Storage in chunks (or redirected to a signed URL), single byte ranges
+    are served for PDF viewers, conditional requests are answered with 304 and small files are kept in memory.
+    """
+    with track_stage("content_lookup"):
+        try:
+            location = await content_service.resolve(path, agent_id)
+        except AmbiguousDocumentError as e:
+            return JSONResponse(status_code=409, content={"message": str(e)})
+        except ValueError:
+            location = None
+        if location is None:
+            return JSONResponse(status_code=404, content={"message": f"Content '{path}' not found"})
+        bucket_name, blob_name = location
+
+        if settings.CONTENT_SIGNED_URL_REDIRECT:
+            signed_url = await storage_service.generate_signed_url(bucket_name, blob_name)
+            return RedirectResponse(signed_url, status_code=307)
+
+        blob = await storage_service.get_file_metadata(bucket_name, blob_name)
+    if blob is None:
+        return JSONResponse(status_code=404, content={"message": f"Content '{path}' not found"})
+
+    etag = f'"{blob.generation}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(blob.updated.timestamp(), usegmt=True),
+        # The generation changes whenever the file does, so browsers can keep it and revalidate with the ETag
+        "Cache-Control": f"private, max-age={settings.CONTENT_MAX_AGE_SECONDS}",
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(request.headers, etag, blob.updated):
+        return Response(status_code=304, headers=headers)
+
+    media_type = blob.content_type or mimetypes.guess_type(blob_name)[0] or "application/octet-stream"
+    size = blob.size
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and if_range_matches(request.headers, etag, blob.updated):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if content_cache.accepts(size):
+        data = content_cache.get(bucket_name, blob_name, blob.generation)
+        if data is None:
+            data = b"".join([
+                chunk async for chunk in storage_service.stream_file(
+                    bucket_name, blob_name, blob.generation, 0, size - 1, settings.CONTENT_CHUNK_SIZE
+                )
+            ])
+            content_cache.put(bucket_name, blob_name, blob.generation, data)
+        return Response(data[start:end + 1], status_code=status_code, headers=headers, media_type=media_type)
+
+    chunks = storage_service.stream_file(
+        bucket_name, blob_name, blob.generation, start, end, settings.CONTENT_CHUNK_SIZE
     )
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type=media_type)
 
 
 # Public agents endpoint for frontend dropdown
@@ -747,13 +932,43 @@ async def create_agent_public(request: Request):
 async def delete_agent_public(agent_id: str):
     """Delete agent (simplified endpoint)"""
     try:
-        await agent_service.delete_agent(agent_id)
-        return {"message": f"Agent {agent_id} deleted successfully"}
+        job = await agent_service.delete_agent(agent_id)
+        return JSONResponse(
+            status_code=202,
+            content={"message": f"Agent {agent_id} deletion started", "teardown": job}
+        )
     except Exception as e:
         logger.error(f"Error deleting agent: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+# Public endpoint to follow agent deletion progress
+@app.get("/agents/{agent_id}/teardown")
+async def get_agent_teardown_public(agent_id: str):
+    """Get agent deletion progress (simplified endpoint)"""
+    try:
+        return await agent_service.get_teardown_status(agent_id)
+    except ValueError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"Error getting teardown status: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+# Public endpoint to restart a failed or stuck agent deletion
+@app.post("/agents/{agent_id}/teardown/retry")
+async def retry_agent_teardown_public(agent_id: str):
+    """Restart agent deletion (simplified endpoint)"""
+    try:
+        job = await agent_service.retry_teardown(agent_id)
+        return JSONResponse(status_code=202, content=jsonable_encoder({"teardown": job}))
+    except ValueError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"Error retrying teardown: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
 # Public endpoint to upload document to agent
 @app.post("/agents/{agent_id}/documents")
 async def upload_document_to_agent(agent_id: str, file: UploadFile = File(...)):
@@ -854,9 +1069,31 @@ async def update_agent(
 
 @app.delete("/api/agents/{agent_id}")
 async def delete_agent(agent_id: str, admin: User = Depends(require_admin)):
-    """Delete agent (admin only)"""
-    await agent_service.delete_agent(agent_id)
-    return {"message": "Agent deleted successfully"}
+    """Delete agent (admin only) - resources are removed by a background teardown job"""
+    job = await agent_service.delete_agent(agent_id)
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Agent deletion started", "teardown": job}
+    )
+
+
+@app.get("/api/agents/{agent_id}/teardown")
+async def get_agent_teardown(agent_id: str, admin: User = Depends(require_admin)):
+    """Get agent deletion progress (admin only)"""
+    try:
+        return await agent_service.get_teardown_status(agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/api/agents/{agent_id}/teardown/retry")
+async def retry_agent_teardown(agent_id: str, admin: User = Depends(require_admin)):
+    """Restart a failed agent deletion, or one that stopped reporting progress (admin only)"""
+    try:
+        job = await agent_service.retry_teardown(agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return JSONResponse(status_code=202, content=jsonable_encoder({"teardown": job}))
 
 
 # Document routes
@@ -917,18 +1154,23 @@ async def chat_stream(
 ):
     """Chat with streaming (SSE)"""
     async def event_generator():
-        async for chunk in chat_service.chat_stream(
-            agent_id,
-            request.message,
-            user.id,
-            request.conversation_id
-        ):
-            event_type = chunk["type"]
-            data = chunk["data"]
-
-            # Format as SSE
-            yield f"event: {event_type}\n"
-            yield f"data: {json.dumps(data)}\n\n"
+        with track_stream():
+            async for chunk in chat_service.chat_stream(
+                agent_id,
+                request.message,
+                user.id,
+                request.conversation_id
+            ):
+                event_type = chunk["type"]
+                data = chunk.get("data")
+
+                # Format as SSE
+                yield f"event: {event_type}\n"
+                yield f"data: {json.dumps(data)}\n\n"
+        # Stage timings can only be sent after the body has started, so they get a final event
+        if timings := stage_timings():
+            yield "event: timings\n"
+            yield f"data: {json.dumps(timings)}\n\n"
 
     return StreamingResponse(
         event_generator(),
@@ -13,6 +13,20 @@ class AgentStatus(str, Enum):
     INDEXING = "indexing"
     ERROR = "error"
     ARCHIVED = "archived"
+    DELETING = "deleting"
+
+
+# Firestore field name -> model field name
+FIRESTORE_FIELDS = {
+    "createdBy": "created_by",
+    "createdAt": "created_at",
+    "updatedAt": "updated_at",
+    "bucketName": "bucket_name",
+    "corpusId": "corpus_id",
+    "dataStoreId": "data_store_id",
+    "documentCount": "document_count",
+}
+MODEL_FIELDS = {model_field: firestore_field for firestore_field, model_field in FIRESTORE_FIELDS.items()}
 
 
 class AgentSettings(BaseModel):
@@ -45,6 +59,17 @@ class Agent(BaseModel):
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_firestore(cls, data: dict) -> "Agent":
+        """Build an agent from its Firestore record, which uses camelCase field names"""
+        return cls(**{FIRESTORE_FIELDS.get(key, key): value for key, value in data.items()})
+
+    def to_firestore(self) -> dict:
+        """Get the Firestore record of the agent"""
+        data = {MODEL_FIELDS.get(key, key): value for key, value in self.dict().items()}
+        data["status"] = self.status.value
+        return data
+
 
 class AgentCreate(BaseModel):
     """Agent creation model"""
@@ -4,7 +4,8 @@ Document models
 from datetime import datetime
 from enum import Enum
 from typing import Optional
-from pydantic import BaseModel, Field
+
+from pydantic import BaseModel
 
 
 class DocumentStatus(str, Enum):
@@ -15,6 +16,20 @@ class DocumentStatus(str, Enum):
     ERROR = "error"
 
 
+# Firestore field name -> model field name
+FIRESTORE_FIELDS = {
+    "agentId": "agent_id",
+    "fileName": "file_name",
+    "originalName": "original_name",
+    "gcsPath": "gcs_path",
+    "contentType": "content_type",
+    "uploadedBy": "uploaded_by",
+    "uploadedAt": "uploaded_at",
+    "errorMessage": "error_message",
+    "chunksCount": "chunks_count",
+}
+
+
 class Document(BaseModel):
     """Document model"""
     id: str
@@ -33,6 +48,11 @@ class Document(BaseModel):
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_firestore(cls, data: dict) -> "Document":
+        """Build a document from its Firestore record, which uses camelCase field names"""
+        return cls(**{FIRESTORE_FIELDS.get(key, key): value for key, value in data.items()})
+
 
 class DocumentCreate(BaseModel):
     """Document creation model"""
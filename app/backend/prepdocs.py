@@ -11,7 +11,11 @@ from openai import AsyncOpenAI
 from rich.logging import RichHandler
 
 from load_azd_env import load_azd_env
+from prepdocslib.embeddingcache import EmbeddingCache
+from prepdocslib.figurecache import FigureCache
+from prepdocslib.figureprocessor import FigureLimits
 from prepdocslib.filestrategy import FileStrategy
+from prepdocslib.ingestionpipeline import IngestionConcurrency
 from prepdocslib.integratedvectorizerstrategy import (
     IntegratedVectorizerStrategy,
 )
@@ -21,6 +25,7 @@ from prepdocslib.listfilestrategy import (
     LocalListFileStrategy,
 )
 from prepdocslib.servicesetup import (
+    LocalPdfParserLibrary,
     OpenAIHost,
     build_file_processors,
     clean_key_if_exists,
@@ -87,6 +92,8 @@ def setup_file_processors(
     document_intelligence_key: Optional[str] = None,
     local_pdf_parser: bool = False,
     local_html_parser: bool = False,
+    local_pdf_parser_library: LocalPdfParserLibrary = LocalPdfParserLibrary.PYPDF,
+    local_pdf_parser_processes: int = 1,
     use_content_understanding: bool = False,
     use_multimodal: bool = False,
     openai_client: Optional[AsyncOpenAI] = None,
@@ -106,6 +113,8 @@ def setup_file_processors(
         use_local_pdf_parser=local_pdf_parser,
         use_local_html_parser=local_html_parser,
         process_figures=use_multimodal,
+        local_pdf_parser_library=local_pdf_parser_library,
+        local_pdf_parser_processes=local_pdf_parser_processes,
     )
 
     figure_processor = setup_figure_processor(
@@ -122,10 +131,13 @@ def setup_file_processors(
 
 
 async def main(strategy: Strategy, setup_index: bool = True):
-    if setup_index:
-        await strategy.setup()
+    try:
+        if setup_index:
+            await strategy.setup()
 
-    await strategy.run()
+        await strategy.run()
+    finally:
+        await strategy.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -143,6 +155,70 @@ if __name__ == "__main__":  # pragma: no cover
     parser.add_argument(
         "--disablebatchvectors", action="store_true", help="Don't compute embeddings in batch for the sections"
     )
+    parser.add_argument(
+        "--disablediffupdate",
+        action="store_true",
+        help="Upload all the sections of each file, instead of only the new or changed sections while removing the sections that are gone",
+    )
+    parser.add_argument(
+        "--embeddingcache",
+        default=os.path.join(".cache", "embeddings.sqlite"),
+        help="Path of the local cache of embeddings, texts found in it are not embedded again",
+    )
+    parser.add_argument(
+        "--embeddingcachedtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Type of the values of the vectors stored in the embedding cache, float16 halves its size",
+    )
+    parser.add_argument(
+        "--disableembeddingcache", action="store_true", help="Compute all embeddings without the local cache"
+    )
+    parser.add_argument(
+        "--pruneembeddingcache",
+        type=float,
+        metavar="DAYS",
+        help="Remove the embeddings not used for this many days from the local cache, then exit",
+    )
+    parser.add_argument(
+        "--figurecache",
+        default=os.path.join(".cache", "figures.sqlite"),
+        help="Path of the local cache of figure descriptions and embeddings, images found in it are not processed again",
+    )
+    parser.add_argument(
+        "--disablefigurecache",
+        action="store_true",
+        help="Process every occurrence of repeated images, without the figure cache",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help="Ingest files one at a time instead of in a pipeline of parallel stages",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes used to parse and split files (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--figuredescriptions",
+        type=int,
+        metavar="N",
+        help="Number of figures described at once (default: MAX_CONCURRENT_FIGURE_DESCRIPTIONS, or 4)",
+    )
+    parser.add_argument(
+        "--figureuploads",
+        type=int,
+        metavar="N",
+        help="Number of figures uploaded to blob storage at once (default: MAX_CONCURRENT_FIGURE_UPLOADS, or 8)",
+    )
+    parser.add_argument(
+        "--figureembeddings",
+        type=int,
+        metavar="N",
+        help="Number of figures embedded at once (default: MAX_CONCURRENT_FIGURE_EMBEDDINGS, or 4)",
+    )
     parser.add_argument(
         "--remove",
         action="store_true",
@@ -183,6 +259,13 @@ if __name__ == "__main__":  # pragma: no cover
         # to avoid seeing the noisy INFO level logs from the Azure SDKs
         logger.setLevel(logging.DEBUG)
 
+    if args.pruneembeddingcache is not None:
+        embedding_cache = EmbeddingCache(args.embeddingcache)
+        removed = embedding_cache.prune(args.pruneembeddingcache)
+        embedding_cache.close()
+        logger.info("Removed %d embeddings from the embedding cache", removed)
+        exit(0)
+
     load_azd_env()
 
     if os.getenv("USE_CLOUD_INGESTION", "").lower() == "true":
@@ -295,7 +378,11 @@ if __name__ == "__main__":  # pragma: no cover
         openai_organization=os.getenv("OPENAI_ORGANIZATION"),
     )
     openai_embeddings_service = None
+    embedding_cache = None
+    figure_cache = None
     if not dont_use_vectors:
+        if not args.disableembeddingcache:
+            embedding_cache = EmbeddingCache(args.embeddingcache, dtype=args.embeddingcachedtype)
         openai_embeddings_service = setup_embeddings_service(
             OPENAI_HOST,
             openai_client,
@@ -304,6 +391,7 @@ if __name__ == "__main__":  # pragma: no cover
             azure_openai_deployment=os.getenv("AZURE_OPENAI_EMB_DEPLOYMENT"),
             azure_openai_endpoint=azure_openai_endpoint,
             disable_batch=args.disablebatchvectors,
+            cache=embedding_cache,
         )
 
     ingestion_strategy: Strategy
@@ -332,6 +420,8 @@ if __name__ == "__main__":  # pragma: no cover
             document_intelligence_key=clean_key_if_exists(args.documentintelligencekey),
             local_pdf_parser=os.getenv("USE_LOCAL_PDF_PARSER") == "true",
             local_html_parser=os.getenv("USE_LOCAL_HTML_PARSER") == "true",
+            local_pdf_parser_library=LocalPdfParserLibrary(os.getenv("LOCAL_PDF_PARSER_LIBRARY") or "pypdf"),
+            local_pdf_parser_processes=int(os.getenv("LOCAL_PDF_PARSER_PROCESSES") or 1),
             use_content_understanding=use_content_understanding,
             use_multimodal=use_multimodal,
             content_understanding_endpoint=os.getenv("AZURE_CONTENTUNDERSTANDING_ENDPOINT"),
@@ -340,6 +430,9 @@ if __name__ == "__main__":  # pragma: no cover
             openai_deployment=os.getenv("AZURE_OPENAI_CHATGPT_DEPLOYMENT") if OPENAI_HOST == OpenAIHost.AZURE else None,
         )
 
+        if not args.disablefigurecache:
+            figure_cache = FigureCache(args.figurecache)
+
         image_embeddings_service = setup_image_embeddings_service(
             azure_credential=azd_credential,
             vision_endpoint=os.getenv("AZURE_VISION_ENDPOINT"),
@@ -363,6 +456,14 @@ if __name__ == "__main__":  # pragma: no cover
             enforce_access_control=enforce_access_control,
             use_web_source=use_web_source,
             use_sharepoint_source=use_sharepoint_source,
+            concurrency=None if args.sequential else IngestionConcurrency(processes=args.processes),
+            diff_update=not args.disablediffupdate,
+            figure_cache=figure_cache,
+            figure_limits=FigureLimits(
+                descriptions=args.figuredescriptions or int(os.getenv("MAX_CONCURRENT_FIGURE_DESCRIPTIONS") or 4),
+                uploads=args.figureuploads or int(os.getenv("MAX_CONCURRENT_FIGURE_UPLOADS") or 8),
+                embeddings=args.figureembeddings or int(os.getenv("MAX_CONCURRENT_FIGURE_EMBEDDINGS") or 4),
+            ),
         )
 
     try:
@@ -373,6 +474,10 @@ if __name__ == "__main__":  # pragma: no cover
             loop.run_until_complete(blob_manager.close_clients())
             loop.run_until_complete(openai_client.close())
             loop.run_until_complete(azd_credential.close())
+            if embedding_cache:
+                embedding_cache.close()
+            if figure_cache:
+                figure_cache.close()
         except Exception as e:
             logger.debug(f"Failed to close async clients cleanly: {e}")
         loop.close()
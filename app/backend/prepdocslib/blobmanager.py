@@ -1,14 +1,23 @@
+import asyncio
+import functools
 import io
 import logging
 import os
 import re
+import struct
+import threading
+import time
+import zlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime
 from pathlib import Path
-from typing import IO, Any, Optional, TypedDict
+from typing import IO, Any, Optional, TypedDict, TypeVar
 from urllib.parse import unquote
 
+from azure.core import MatchConditions
 from azure.core.credentials_async import AsyncTokenCredential
-from azure.core.exceptions import ResourceNotFoundError
-from azure.storage.blob.aio import BlobServiceClient
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient
 from azure.storage.filedatalake.aio import (
     DataLakeDirectoryClient,
     FileSystemClient,
@@ -19,11 +28,153 @@ from .listfilestrategy import File
 
 logger = logging.getLogger("scripts")
 
+T = TypeVar("T")
+
+
+CITATION_LINE_HEIGHT = 30
+CITATION_HEIGHT = CITATION_LINE_HEIGHT * 2  # Two lines of text
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Downloads are streamed in chunks of this size, so that serving a large file doesn't hold all of it in memory
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# FreeType fonts can't be used by several threads at once, and images are stamped in worker threads
+_citation_font_lock = threading.Lock()
+
+
+@functools.cache
+def load_citation_font() -> ImageFont.FreeTypeFont:
+    # Load the Jupiteroid font which is included in the repo, once
+    font_path = Path(__file__).parent / "Jupiteroid-Regular.ttf"
+    return ImageFont.truetype(str(font_path), 20)  # Slightly smaller font for better fit
+
+
+def draw_citation(image: Image.Image, sourcepage: str, figure_text: str):
+    """Draw the source page and figure name in the top CITATION_HEIGHT pixels of an image"""
+    draw = ImageDraw.Draw(image)
+    padding = 20  # Padding from edges
+    with _citation_font_lock:
+        font = load_citation_font()
+        # Calculate text widths for right alignment
+        fig_width = draw.textlength(figure_text, font=font)
+        # Left align document name, right align figure name
+        draw.text((padding, 5), sourcepage, font=font, fill="black")  # Left aligned
+        draw.text(
+            (image.width - fig_width - padding, CITATION_LINE_HEIGHT + 5), figure_text, font=font, fill="black"
+        )  # Right aligned
+
+
+def read_rgb_png(data: bytes) -> Optional[tuple[int, int, bytes]]:
+    """Return the width, height and zlib compressed image data of a non-interlaced 8-bit RGB PNG.
+
+    Returns None for any other image, and for PNGs whose first row is filtered based on the row above it,
+    since the citation rows put in front of it would change its pixels.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    header: Optional[tuple[int, ...]] = None
+    image_data = []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        (length,) = struct.unpack(">I", data[position : position + 4])
+        chunk_type = data[position + 4 : position + 8]
+        body = data[position + 8 : position + 8 + length]
+        position += 12 + length
+        if chunk_type == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif chunk_type == b"IDAT":
+            image_data.append(body)
+        elif chunk_type == b"IEND":
+            break
+    # Bit depth 8, color type 2 (RGB), default compression and filter methods, no interlacing
+    if header is None or header[2:] != (8, 2, 0, 0, 0) or not image_data:
+        return None
+    compressed = b"".join(image_data)
+    try:
+        first_filter = zlib.decompressobj().decompress(compressed, 1)
+    except zlib.error:
+        return None
+    # Filter types None (0) and Sub (1) don't depend on the row above
+    if first_filter not in (b"\x00", b"\x01"):
+        return None
+    return header[0], header[1], compressed
+
+
+def adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+    """Combine the Adler-32 checksums of two byte strings, given the length of the second one (as zlib does)"""
+    base = 65521
+    remainder = length2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % base
+    sum1 = (sum1 + (adler2 & 0xFFFF) + base - 1) % base
+    sum2 = (sum2 + ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + base - remainder) % base
+    return sum1 | (sum2 << 16)
+
+
+def png_chunk(chunk_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def prepend_rows_to_png(width: int, height: int, image_data: bytes, rows: Image.Image) -> bytes:
+    """Build an RGB PNG of the rows followed by the image, reusing the compressed data of the image as is.
+
+    A deflate stream can be continued by another one once flushed to a byte boundary, so the rows are compressed
+    into a flushed stream followed by the blocks of the image, and only the checksum is computed again.
+    """
+    raw_rows = rows.tobytes()
+    row_size = width * 3
+    # Each row of a PNG starts with its filter type, None (0)
+    filtered = b"".join(b"\x00" + raw_rows[start : start + row_size] for start in range(0, len(raw_rows), row_size))
+    compressor = zlib.compressobj(wbits=-15)
+    deflated_rows = compressor.compress(filtered) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    # The image data is a zlib stream: a 2 bytes header, deflate blocks, then the Adler-32 of the raw image data
+    (image_adler,) = struct.unpack(">I", image_data[-4:])
+    adler = adler32_combine(zlib.adler32(filtered), image_adler, height * (row_size + 1))
+    compressed = image_data[:2] + deflated_rows + image_data[2:-4] + struct.pack(">I", adler)
+    header = struct.pack(">IIBBBBB", width, height + rows.height, 8, 2, 0, 0, 0)
+    return PNG_SIGNATURE + png_chunk(b"IHDR", header) + png_chunk(b"IDAT", compressed) + png_chunk(b"IEND", b"")
+
+
+def is_container_not_found(error: ResourceNotFoundError) -> bool:
+    """Whether a not found error is about the container, rather than a blob in it"""
+    return getattr(error, "error_code", None) == "ContainerNotFound"
+
+
+class ExistenceCache:
+    """
+    Remembers for a while the containers or directories found to exist, with the owner of directories,
+    so that they are not checked again on every operation.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._entries: dict[str, tuple[float, Optional[str]]] = {}
+
+    def get(self, path: str) -> tuple[bool, Optional[str]]:
+        """Return whether the path is known to exist, and its owner"""
+        entry = self._entries.get(path)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self._entries[path]
+            return False, None
+        return True, entry[1]
+
+    def add(self, path: str, owner: Optional[str] = None):
+        self._entries[path] = (time.monotonic() + self.ttl, owner)
+
+    def discard(self, path: str):
+        """Forget the path and, for a directory, everything below it"""
+        for cached in [cached for cached in self._entries if cached == path or cached.startswith(path + "/")]:
+            del self._entries[cached]
+
 
 class BlobProperties(TypedDict, total=False):
     """Properties of a blob, with optional fields for content settings"""
 
     content_settings: dict[str, Any]
+    size: int
+    etag: str
+    last_modified: datetime
 
 
 class BaseBlobManager:
@@ -44,44 +195,34 @@ class BaseBlobManager:
 
     @classmethod
     def add_image_citation(
-        cls, image_bytes: bytes, document_filename: str, image_filename: str, page_num: int
+        cls, image_bytes: bytes, document_filename: str, image_filename: str, page_num: int, reencode: bool = False
     ) -> bytes:
         """
         Adds citation text to an image from a document.
+        Unless reencode is set, 8-bit RGB PNGs (the format of the figures cropped by the PDF parsers) are not
+        decoded and re-encoded: the citation is compressed on its own and put in front of the original image data,
+        which gives the same pixels in a fraction of the time.
         Args:
             image_bytes: The original image bytes
             document_filename: The name of the document containing the image
             image_filename: The name of the image file
             page_num: The page number where the image appears
+            reencode: Whether to always decode and re-encode the whole image
         Returns:
-            A tuple containing (BytesIO of the modified image, format of the image)
+            The bytes of the image with the citation above it
         """
-        # Load and modify the image to add text
-        image = Image.open(io.BytesIO(image_bytes))
-        line_height = 30
-        text_height = line_height * 2  # Two lines of text
-        new_img = Image.new("RGB", (image.width, image.height + text_height), "white")
-        new_img.paste(image, (0, text_height))
-
-        # Add text
-        draw = ImageDraw.Draw(new_img)
         sourcepage = cls.sourcepage_from_file_page(document_filename, page=page_num)
-        text = sourcepage
-        figure_text = image_filename
-
-        # Load the Jupiteroid font which is included in the repo
-        font_path = Path(__file__).parent / "Jupiteroid-Regular.ttf"
-        font = ImageFont.truetype(str(font_path), 20)  # Slightly smaller font for better fit
+        if not reencode and (png := read_rgb_png(image_bytes)) is not None:
+            width, height, image_data = png
+            citation = Image.new("RGB", (width, CITATION_HEIGHT), "white")
+            draw_citation(citation, sourcepage, image_filename)
+            return prepend_rows_to_png(width, height, image_data, citation)
 
-        # Calculate text widths for right alignment
-        fig_width = draw.textlength(figure_text, font=font)
-
-        # Left align document name, right align figure name
-        padding = 20  # Padding from edges
-        draw.text((padding, 5), text, font=font, fill="black")  # Left aligned
-        draw.text(
-            (new_img.width - fig_width - padding, line_height + 5), figure_text, font=font, fill="black"
-        )  # Right aligned
+        # Load and modify the image to add text
+        image = Image.open(io.BytesIO(image_bytes))
+        new_img = Image.new("RGB", (image.width, image.height + CITATION_HEIGHT), "white")
+        new_img.paste(image, (0, CITATION_HEIGHT))
+        draw_citation(new_img, sourcepage, image_filename)
 
         # Convert back to bytes
         output = io.BytesIO()
@@ -118,6 +259,33 @@ class BaseBlobManager:
         """
         raise NotImplementedError("Subclasses must implement this method")
 
+    async def get_blob_properties(self, blob_path: str, user_oid: Optional[str] = None) -> Optional[BlobProperties]:
+        """
+        Gets the content type, size, ETag and last modified time of a blob without downloading it.
+
+        Returns:
+            The blob properties, or None if blob not found or access denied
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
+    async def stream_blob(
+        self, blob_path: str, offset: int, length: int, etag: str, user_oid: Optional[str] = None
+    ) -> Optional[AsyncIterator[bytes]]:
+        """
+        Starts downloading a range of a blob, to be read in chunks of DOWNLOAD_CHUNK_SIZE bytes.
+
+        Args:
+            blob_path: The path to the blob in the storage
+            offset: The first byte of the range
+            length: The number of bytes of the range
+            etag: The ETag returned by get_blob_properties, so that the range is read from that version of the blob
+            user_oid: The user's object ID (optional)
+
+        Returns:
+            An iterator over the chunks of the range, or None if blob not found, changed since or access denied
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
 
 class AdlsBlobManager(BaseBlobManager):
     """
@@ -126,7 +294,7 @@ class AdlsBlobManager(BaseBlobManager):
     Images are stored in a separate images subdirectory for better organization.
     """
 
-    def __init__(self, endpoint: str, container: str, credential: AsyncTokenCredential):
+    def __init__(self, endpoint: str, container: str, credential: AsyncTokenCredential, cache_ttl: float = 300):
         """
         Initializes the AdlsBlobManager with the necessary parameters.
 
@@ -134,14 +302,18 @@ class AdlsBlobManager(BaseBlobManager):
             endpoint: The ADLS endpoint URL
             container: The name of the container (file system)
             credential: The credential for accessing ADLS
+            cache_ttl: How long, in seconds, a directory and its owner are remembered without checking them again
         """
         self.endpoint = endpoint
         self.container = container
         self.credential = credential
+        self.directories = ExistenceCache(cache_ttl)
         self.file_system_client = FileSystemClient(
             account_url=self.endpoint,
             file_system_name=self.container,
             credential=self.credential,
+            max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+            max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
         )
 
     async def close_clients(self):
@@ -157,17 +329,40 @@ class AdlsBlobManager(BaseBlobManager):
             user_oid: The owner to set for all created directories
         """
         directory_client = self.file_system_client.get_directory_client(directory_path)
+        exists, owner = self.directories.get(directory_path)
+        if not exists:
+            try:
+                await directory_client.get_directory_properties()
+                # Check directory properties to ensure it has the correct owner
+                props = await directory_client.get_access_control()
+                owner = props.get("owner")
+            except ResourceNotFoundError:
+                logger.info("Creating directory path %s", directory_path)
+                await directory_client.create_directory()
+                await directory_client.set_access_control(owner=user_oid)
+                owner = user_oid
+            self.directories.add(directory_path, owner)
+        if owner != user_oid:
+            raise PermissionError(f"User {user_oid} does not have permission to access {directory_path}")
+        return directory_client
+
+    async def _in_directory(
+        self, directory_path: str, user_oid: str, operation: Callable[[DataLakeDirectoryClient], Awaitable[T]]
+    ) -> T:
+        """
+        Runs an operation in a directory, after ensuring it exists.
+        If the directory was remembered but is not found anymore, it is checked again and the operation retried once.
+        """
+        cached, _ = self.directories.get(directory_path)
+        directory_client = await self._ensure_directory(directory_path=directory_path, user_oid=user_oid)
         try:
-            await directory_client.get_directory_properties()
-            # Check directory properties to ensure it has the correct owner
-            props = await directory_client.get_access_control()
-            if props.get("owner") != user_oid:
-                raise PermissionError(f"User {user_oid} does not have permission to access {directory_path}")
+            return await operation(directory_client)
         except ResourceNotFoundError:
-            logger.info("Creating directory path %s", directory_path)
-            await directory_client.create_directory()
-            await directory_client.set_access_control(owner=user_oid)
-        return directory_client
+            if not cached:
+                raise
+            self.directories.discard(directory_path)
+            directory_client = await self._ensure_directory(directory_path=directory_path, user_oid=user_oid)
+            return await operation(directory_client)
 
     async def upload_blob(self, file: File | IO, filename: str, user_oid: str) -> str:
         """
@@ -181,28 +376,29 @@ class AdlsBlobManager(BaseBlobManager):
         Returns:
             str: The URL of the uploaded file, with forward slashes (not URL-encoded)
         """
-        # Ensure user directory exists but don't create a subdirectory
-        user_directory_client = await self._ensure_directory(directory_path=user_oid, user_oid=user_oid)
-
-        # Create file directly in user directory
-        file_client = user_directory_client.get_file_client(filename)
-
         # Handle both File and IO objects
         if isinstance(file, File):
             file_io = file.content
         else:
             file_io = file
 
-        # Ensure the file is at the beginning
-        file_io.seek(0)
+        async def upload(user_directory_client: DataLakeDirectoryClient) -> str:
+            # Create file directly in user directory
+            file_client = user_directory_client.get_file_client(filename)
+
+            # Ensure the file is at the beginning
+            file_io.seek(0)
 
-        await file_client.upload_data(file_io, overwrite=True)
+            await file_client.upload_data(file_io, overwrite=True)
 
-        # Reset the file position for any subsequent reads
-        file_io.seek(0)
+            # Reset the file position for any subsequent reads
+            file_io.seek(0)
 
-        # Decode the URL to convert %2F back to / and other escaped characters
-        return unquote(file_client.url)
+            # Decode the URL to convert %2F back to / and other escaped characters
+            return unquote(file_client.url)
+
+        # Ensure user directory exists but don't create a subdirectory
+        return await self._in_directory(user_oid, user_oid, upload)
 
     def _get_image_directory_path(self, document_filename: str, user_oid: str, page_num: Optional[int] = None) -> str:
         """
@@ -247,12 +443,18 @@ class AdlsBlobManager(BaseBlobManager):
             raise ValueError("user_oid must be provided for user-specific operations.")
         await self._ensure_directory(directory_path=user_oid, user_oid=user_oid)
         image_directory_path = self._get_image_directory_path(document_filename, user_oid, image_page_num)
-        image_directory_client = await self._ensure_directory(directory_path=image_directory_path, user_oid=user_oid)
-        file_client = image_directory_client.get_file_client(image_filename)
-        image_bytes = BaseBlobManager.add_image_citation(image_bytes, document_filename, image_filename, image_page_num)
-        logger.info("Uploading document image '%s' to '%s'", image_filename, image_directory_path)
-        await file_client.upload_data(image_bytes, overwrite=True, metadata={"UploadedBy": user_oid})
-        return unquote(file_client.url)
+        # Stamping decodes and encodes images, so it runs in a worker thread instead of blocking the event loop
+        image_bytes = await asyncio.to_thread(
+            self.add_image_citation, image_bytes, document_filename, image_filename, image_page_num
+        )
+
+        async def upload(image_directory_client: DataLakeDirectoryClient) -> str:
+            file_client = image_directory_client.get_file_client(image_filename)
+            logger.info("Uploading document image '%s' to '%s'", image_filename, image_directory_path)
+            await file_client.upload_data(image_bytes, overwrite=True, metadata={"UploadedBy": user_oid})
+            return unquote(file_client.url)
+
+        return await self._in_directory(image_directory_path, user_oid, upload)
 
     async def download_blob(
         self, blob_path: str, user_oid: Optional[str] = None
@@ -269,29 +471,12 @@ class AdlsBlobManager(BaseBlobManager):
                 - A tuple containing the blob content as bytes and the blob properties as a dictionary
                 - None if blob not found or access denied
         """
-        if user_oid is None:
-            logger.warning("user_oid must be provided for Data Lake Storage operations.")
+        user_path = self._user_path(blob_path, user_oid)
+        if user_path is None:
             return None
+        directory_path, filename = user_path
 
-        # Get the directory path and file name from the blob path
-        path_parts = blob_path.split("/")
-        if len(path_parts) < 2:
-            # If no slashes in path, we assume it's a file in the user's root directory
-            filename = blob_path
-            directory_path = user_oid
-        else:
-            # First verify that the root directory matches the user_oid
-            root_dir = path_parts[0]
-            if root_dir != user_oid:
-                logger.warning(f"User {user_oid} does not have permission to access {blob_path}")
-                return None
-
-            # Get the directory client for the full path except the filename
-            directory_path = "/".join(path_parts[:-1])
-            filename = path_parts[-1]
-
-        try:
-            user_directory_client = await self._ensure_directory(directory_path=directory_path, user_oid=user_oid)
+        async def download(user_directory_client: DataLakeDirectoryClient) -> tuple[bytes, BlobProperties]:
             file_client = user_directory_client.get_file_client(filename)
             download_response = await file_client.download_file()
             content = await download_response.readall()
@@ -304,6 +489,9 @@ class AdlsBlobManager(BaseBlobManager):
             }
 
             return content, properties
+
+        try:
+            return await self._in_directory(directory_path, user_oid, download)
         except ResourceNotFoundError:
             logger.warning(f"Directory or file not found: {directory_path}/{filename}")
             return None
@@ -311,6 +499,81 @@ class AdlsBlobManager(BaseBlobManager):
             logging.error(f"Error accessing directory {directory_path}: {str(e)}")
             return None
 
+    def _user_path(self, blob_path: str, user_oid: Optional[str]) -> Optional[tuple[str, str]]:
+        """
+        Splits a blob path into the directory path and the file name, if the path belongs to the user.
+        Paths without slashes are files in the user's root directory.
+        """
+        if user_oid is None:
+            logger.warning("user_oid must be provided for Data Lake Storage operations.")
+            return None
+
+        # Get the directory path and file name from the blob path
+        path_parts = blob_path.split("/")
+        if len(path_parts) < 2:
+            # If no slashes in path, we assume it's a file in the user's root directory
+            return user_oid, blob_path
+
+        # First verify that the root directory matches the user_oid
+        root_dir = path_parts[0]
+        if root_dir != user_oid:
+            logger.warning(f"User {user_oid} does not have permission to access {blob_path}")
+            return None
+
+        # Get the directory client for the full path except the filename
+        return "/".join(path_parts[:-1]), path_parts[-1]
+
+    async def get_blob_properties(self, blob_path: str, user_oid: Optional[str] = None) -> Optional[BlobProperties]:
+        user_path = self._user_path(blob_path, user_oid)
+        if user_path is None:
+            return None
+        directory_path, filename = user_path
+        assert user_oid is not None
+
+        async def get_properties(user_directory_client: DataLakeDirectoryClient) -> BlobProperties:
+            file_properties = await user_directory_client.get_file_client(filename).get_file_properties()
+            return {
+                "content_settings": {
+                    "content_type": file_properties.content_settings.content_type or "application/octet-stream"
+                },
+                "size": file_properties.size,
+                "etag": file_properties.etag,
+                "last_modified": file_properties.last_modified,
+            }
+
+        try:
+            return await self._in_directory(directory_path, user_oid, get_properties)
+        except ResourceNotFoundError:
+            logger.warning(f"Directory or file not found: {directory_path}/{filename}")
+            return None
+        except PermissionError as e:
+            logger.warning(str(e))
+            return None
+
+    async def stream_blob(
+        self, blob_path: str, offset: int, length: int, etag: str, user_oid: Optional[str] = None
+    ) -> Optional[AsyncIterator[bytes]]:
+        user_path = self._user_path(blob_path, user_oid)
+        if user_path is None:
+            return None
+        directory_path, filename = user_path
+        assert user_oid is not None
+
+        async def download(user_directory_client: DataLakeDirectoryClient) -> AsyncIterator[bytes]:
+            download_response = await user_directory_client.get_file_client(filename).download_file(
+                offset=offset, length=length, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+            return download_response.chunks()
+
+        try:
+            return await self._in_directory(directory_path, user_oid, download)
+        except (ResourceNotFoundError, ResourceModifiedError):
+            logger.warning(f"File removed or changed while it was downloaded: {directory_path}/{filename}")
+            return None
+        except PermissionError as e:
+            logger.warning(str(e))
+            return None
+
     async def remove_blob(self, filename: str, user_oid: str) -> None:
         """
         Deletes a file from the user's directory in ADLS and any associated image directories.
@@ -325,11 +588,12 @@ class AdlsBlobManager(BaseBlobManager):
         Raises:
             ResourceNotFoundError: If the file does not exist
         """
-        # Ensure the user directory exists
-        user_directory_client = await self._ensure_directory(directory_path=user_oid, user_oid=user_oid)
-        # Delete the main document file
-        file_client = user_directory_client.get_file_client(filename)
-        await file_client.delete_file()
+
+        # Delete the main document file from the user directory, after ensuring it exists
+        async def delete_file(user_directory_client: DataLakeDirectoryClient):
+            await user_directory_client.get_file_client(filename).delete_file()
+
+        await self._in_directory(user_oid, user_oid, delete_file)
 
         # Try to delete any associated image directories
         image_directory_path = self._get_image_directory_path(filename, user_oid)
@@ -337,6 +601,7 @@ class AdlsBlobManager(BaseBlobManager):
             image_directory_client = await self._ensure_directory(
                 directory_path=image_directory_path, user_oid=user_oid
             )
+            self.directories.discard(image_directory_path)
             await image_directory_client.delete_directory()
             logger.info(f"Deleted associated image directory: {image_directory_path}")
         except ResourceNotFoundError:
@@ -398,6 +663,7 @@ class BlobManager(BaseBlobManager):
         account: Optional[str] = None,
         resource_group: Optional[str] = None,
         subscription_id: Optional[str] = None,
+        cache_ttl: float = 300,
     ):
         self.endpoint = endpoint
         self.credential = credential
@@ -407,8 +673,14 @@ class BlobManager(BaseBlobManager):
         self.subscription_id = subscription_id
         self.image_container = image_container
         self.blob_service_client = BlobServiceClient(
-            account_url=self.endpoint, credential=self.credential, max_single_put_size=4 * 1024 * 1024
+            account_url=self.endpoint,
+            credential=self.credential,
+            max_single_put_size=4 * 1024 * 1024,
+            max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+            max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
         )
+        # Containers found to exist, so that they are not checked again on every upload or download
+        self.containers = ExistenceCache(cache_ttl)
 
     async def close_clients(self):
         await self.blob_service_client.close()
@@ -418,19 +690,44 @@ class BlobManager(BaseBlobManager):
             raise ValueError("Account, resource group, and subscription ID must be set to generate connection string.")
         return f"ResourceId=/subscriptions/{self.subscription_id}/resourceGroups/{self.resource_group}/providers/Microsoft.Storage/storageAccounts/{self.account};"
 
+    async def _container_exists(self, container_client: ContainerClient) -> bool:
+        exists, _ = self.containers.get(container_client.container_name)
+        if not exists and await container_client.exists():
+            self.containers.add(container_client.container_name)
+            exists = True
+        return exists
+
+    async def _in_container(self, container_client: ContainerClient, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs an operation in a container, after creating it if it doesn't exist.
+        If the container was remembered but is not found anymore, it is created again and the operation retried once.
+        """
+        cached, _ = self.containers.get(container_client.container_name)
+        if not await self._container_exists(container_client):
+            await container_client.create_container()
+            self.containers.add(container_client.container_name)
+        try:
+            return await operation()
+        except ResourceNotFoundError:
+            if not cached:
+                raise
+            self.containers.discard(container_client.container_name)
+            return await self._in_container(container_client, operation)
+
     async def upload_blob(self, file: File) -> str:
         container_client = self.blob_service_client.get_container_client(self.container)
-        if not await container_client.exists():
-            await container_client.create_container()
 
-        # Re-open and upload the original file
-        # URL may be a path to a local file or already set to a blob URL
-        if file.url is None or os.path.exists(file.url):
-            with open(file.content.name, "rb") as reopened_file:
-                blob_name = self.blob_name_from_file_name(file.content.name)
-                logger.info("Uploading blob for document '%s'", blob_name)
-                blob_client = await container_client.upload_blob(blob_name, reopened_file, overwrite=True)
-                file.url = blob_client.url
+        async def upload():
+            # Re-open and upload the original file
+            # URL may be a path to a local file or already set to a blob URL
+            if file.url is None or os.path.exists(file.url):
+                with open(file.content.name, "rb") as reopened_file:
+                    blob_name = self.blob_name_from_file_name(file.content.name)
+                    logger.info("Uploading blob for document '%s'", blob_name)
+                    blob_client = await container_client.upload_blob(blob_name, reopened_file, overwrite=True)
+                    file.url = blob_client.url
+
+        await self._in_container(container_client, upload)
 
         if file.url is None:
             raise ValueError("file.url must be set after upload")
@@ -453,13 +750,18 @@ class BlobManager(BaseBlobManager):
                 "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
             )
         container_client = self.blob_service_client.get_container_client(self.image_container)
-        if not await container_client.exists():
-            await container_client.create_container()
-        image_bytes = self.add_image_citation(image_bytes, document_filename, image_filename, image_page_num)
+        # Stamping decodes and encodes images, so it runs in a worker thread instead of blocking the event loop
+        image_bytes = await asyncio.to_thread(
+            self.add_image_citation, image_bytes, document_filename, image_filename, image_page_num
+        )
         blob_name = f"{self.blob_name_from_file_name(document_filename)}/page{image_page_num}/{image_filename}"
-        logger.info("Uploading blob for document image '%s'", blob_name)
-        blob_client = await container_client.upload_blob(blob_name, image_bytes, overwrite=True)
-        return blob_client.url
+
+        async def upload() -> str:
+            logger.info("Uploading blob for document image '%s'", blob_name)
+            blob_client = await container_client.upload_blob(blob_name, image_bytes, overwrite=True)
+            return blob_client.url
+
+        return await self._in_container(container_client, upload)
 
     async def download_blob(
         self, blob_path: str, user_oid: Optional[str] = None
@@ -484,7 +786,7 @@ class BlobManager(BaseBlobManager):
                 "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
             )
         container_client = self.blob_service_client.get_container_client(self.container)
-        if not await container_client.exists():
+        if not await self._container_exists(container_client):
             return None
         if len(blob_path) == 0:
             logger.warning("Blob path is empty")
@@ -516,13 +818,61 @@ class BlobManager(BaseBlobManager):
             }
 
             return content, properties
-        except ResourceNotFoundError:
+        except ResourceNotFoundError as error:
+            logger.warning("Blob not found: %s", blob_path)
+            # The container is gone too, check it again next time
+            if is_container_not_found(error):
+                self.containers.discard(self.container)
+            return None
+
+    async def get_blob_properties(self, blob_path: str, user_oid: Optional[str] = None) -> Optional[BlobProperties]:
+        if user_oid is not None:
+            raise ValueError(
+                "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
+            )
+        container_client = self.blob_service_client.get_container_client(self.container)
+        if not await self._container_exists(container_client):
+            return None
+        if len(blob_path) == 0:
+            logger.warning("Blob path is empty")
+            return None
+
+        try:
+            blob_properties = await container_client.get_blob_client(blob_path).get_blob_properties()
+        except ResourceNotFoundError as error:
             logger.warning("Blob not found: %s", blob_path)
+            if is_container_not_found(error):
+                self.containers.discard(self.container)
+            return None
+        return {
+            "content_settings": {
+                "content_type": blob_properties.content_settings.content_type or "application/octet-stream"
+            },
+            "size": blob_properties.size,
+            "etag": blob_properties.etag,
+            "last_modified": blob_properties.last_modified,
+        }
+
+    async def stream_blob(
+        self, blob_path: str, offset: int, length: int, etag: str, user_oid: Optional[str] = None
+    ) -> Optional[AsyncIterator[bytes]]:
+        if user_oid is not None:
+            raise ValueError(
+                "user_oid is not supported for BlobManager. Use AdlsBlobManager for user-specific operations."
+            )
+        container_client = self.blob_service_client.get_container_client(self.container)
+        try:
+            download_response = await container_client.get_blob_client(blob_path).download_blob(
+                offset=offset, length=length, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+        except (ResourceNotFoundError, ResourceModifiedError):
+            logger.warning("Blob removed or changed while it was downloaded: %s", blob_path)
             return None
+        return download_response.chunks()
 
     async def remove_blob(self, path: Optional[str] = None):
         container_client = self.blob_service_client.get_container_client(self.container)
-        if not await container_client.exists():
+        if not await self._container_exists(container_client):
             return
         if path is None:
             prefix = None
@@ -11,6 +11,8 @@ class CsvParser(Parser):
     Concrete parser that can parse CSV into Page objects. Each row becomes a Page object.
     """
 
+    cpu_bound = True
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         # Check if content is in bytes (binary file) and decode to string
         content_str: str
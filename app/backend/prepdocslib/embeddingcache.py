@@ -0,0 +1,147 @@
+"""
+Persistent cache of text embeddings, shared by ingestion (OpenAIEmbeddings) and query embeddings (Approach).
+
+Embeddings are stored in a local SQLite database, keyed by a SHA-256 hash of the model, the dimensions and
+the text, so a text is only embedded again when it or the model changes. Vectors are packed as float32, or
+float16 to halve the size of the cache, and the least recently used ones are evicted once the cache grows
+above its size limit.
+
+SQLite calls run in a worker thread, so the cache can be used from the event loop of the app.
+The async methods are best-effort: a locked, corrupt or unwritable database is logged and treated as
+a cache miss, so callers fall back to the embeddings API.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections.abc import Iterable
+from typing import Optional
+
+logger = logging.getLogger("scripts")
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# struct format character of each supported vector type
+VECTOR_FORMATS = {"float32": "f", "float16": "e"}
+
+
+def pack_vector(vector: list[float], dtype: str) -> bytes:
+    return struct.pack(f"<{len(vector)}{VECTOR_FORMATS[dtype]}", *vector)
+
+
+def unpack_vector(data: bytes, dtype: str) -> list[float]:
+    fmt = VECTOR_FORMATS[dtype]
+    return list(struct.unpack(f"<{len(data) // struct.calcsize(fmt)}{fmt}", data))
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, dtype: str = "float32"):
+        if dtype not in VECTOR_FORMATS:
+            raise ValueError(f"Unsupported vector type {dtype}, expected one of {', '.join(VECTOR_FORMATS)}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._size = self._stored_bytes()
+
+    @staticmethod
+    def key(model: str, dimensions: Optional[int], text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{dimensions or ''}\0{text}".encode()).digest()
+
+    def _stored_bytes(self) -> int:
+        return self._connection.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: Iterable[bytes]) -> dict[bytes, list[float]]:
+        """Return the cached vectors of the keys that are in the cache, and mark them as used"""
+        keys = list(dict.fromkeys(keys))
+        found: dict[bytes, list[float]] = {}
+        with self._lock:
+            # SQLite limits the number of parameters of a statement
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, dtype, vector in rows:
+                    found[key] = unpack_vector(vector, dtype)
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._connection.commit()
+        return found
+
+    def put_many(self, items: Iterable[tuple[bytes, list[float]]]):
+        """Store vectors, then evict the least recently used ones if the cache is above its size limit"""
+        now = time.time()
+        rows = [(key, self.dtype, pack_vector(vector, self.dtype), now) for key, vector in items]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, vector, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._connection.commit()
+            self._size += sum(len(row[2]) for row in rows)
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes: int):
+        self._size = self._stored_bytes()
+        while self._size > target_bytes:
+            rows = self._connection.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if self._size <= target_bytes:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self._connection.commit()
+            logger.info("Evicted %d embeddings from the embedding cache", len(evicted))
+
+    def prune(self, max_age_days: float) -> int:
+        """Remove the embeddings not used for max_age_days, and return how many were removed"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM embeddings WHERE last_used < ?", (time.time() - max_age_days * 86400,)
+            )
+            self._connection.commit()
+            self._connection.execute("VACUUM")
+            self._size = self._stored_bytes()
+            return cursor.rowcount
+
+    async def aget_many(self, keys: Iterable[bytes]) -> dict[bytes, list[float]]:
+        try:
+            return await asyncio.to_thread(self.get_many, list(keys))
+        except sqlite3.Error as error:
+            logger.warning("Could not read from the embedding cache %s: %s", self.path, error)
+            return {}
+
+    async def aput_many(self, items: Iterable[tuple[bytes, list[float]]]):
+        try:
+            await asyncio.to_thread(self.put_many, list(items))
+        except sqlite3.Error as error:
+            logger.warning("Could not write to the embedding cache %s: %s", self.path, error)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,6 +1,11 @@
+import asyncio
+import contextlib
+import functools
 import logging
+import time
 from abc import ABC
-from collections.abc import Awaitable, Callable
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from typing import Any, Optional
 from urllib.parse import urljoin
 
 import aiohttp
@@ -8,12 +13,16 @@ import tiktoken
 from openai import AsyncOpenAI, RateLimitError
 from tenacity import (
     AsyncRetrying,
+    RetryCallState,
     retry_if_exception_type,
     stop_after_attempt,
     wait_random_exponential,
 )
+from tenacity.wait import wait_base
 from typing_extensions import TypedDict
 
+from .embeddingcache import EmbeddingCache
+
 logger = logging.getLogger("scripts")
 
 
@@ -29,6 +38,142 @@ class ExtraArgs(TypedDict, total=False):
     dimensions: int
 
 
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Delay asked for by the retry-after-ms or retry-after header of a response, if any"""
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:  # retry-after may also be an HTTP date, which the fallback wait covers
+                continue
+    return None
+
+
+def _rate_limit_headers(exception: Optional[BaseException]) -> Mapping[str, str]:
+    response = getattr(exception, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+class wait_retry_after(wait_base):
+    """Wait for the delay the server asked for when rate limited, or as the fallback wait says otherwise"""
+
+    def __init__(self, fallback: wait_base):
+        self.fallback = fallback
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        delay = retry_after_seconds(_rate_limit_headers(exception))
+        return delay if delay is not None else self.fallback(retry_state)
+
+
+class _MinuteBudget:
+    """Token bucket for a per-minute limit, refilled continuously. A budget without a limit never waits."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.available = float(limit or 0)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.limit:
+            self.available = min(float(self.limit), self.available + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def delay(self, amount: int, now: float) -> float:
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        if not self.limit:
+            return 0.0
+        return max(0.0, (min(amount, self.limit) - self.available) * 60 / self.limit)
+
+    def take(self, amount: int):
+        if self.limit:
+            self.available -= amount
+
+    def update(self, limit: Optional[int], remaining: Optional[int]):
+        """Adjust to the limit and remaining amount reported by the server"""
+        self._refill(time.monotonic())
+        if limit:
+            if not self.limit:
+                self.available = float(limit)
+            self.limit = limit
+        if self.limit and remaining is not None:
+            self.available = min(self.available, float(remaining))
+
+
+class EmbeddingRateLimiter:
+    """
+    Limits the embedding requests in flight, and the requests and tokens sent per minute.
+
+    The per-minute limits start from the configured values, if any, and follow the x-ratelimit-* headers of
+    the responses. The number of requests in flight is halved after every 429 response, and grows back by
+    one after every successful response, up to max_concurrency.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.tokens = _MinuteBudget(tokens_per_minute)
+        self.requests = _MinuteBudget(requests_per_minute)
+        self.paused_until = 0.0
+        self._slots = asyncio.Condition()
+        self._budget_lock = asyncio.Lock()
+
+    @contextlib.asynccontextmanager
+    async def request(self, token_count: int) -> AsyncIterator[None]:
+        """Wait until a request of token_count tokens can be sent, and hold a slot while it is in flight"""
+        async with self._slots:
+            await self._slots.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+        try:
+            async with self._budget_lock:
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self.paused_until - now, self.tokens.delay(token_count, now), self.requests.delay(1, now)
+                    )
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.tokens.take(token_count)
+                self.requests.take(1)
+            yield
+        finally:
+            async with self._slots:
+                self.in_flight -= 1
+                self._slots.notify_all()
+
+    def on_success(self, headers: Mapping[str, str]):
+        self.tokens.update(
+            _int_header(headers, "x-ratelimit-limit-tokens"), _int_header(headers, "x-ratelimit-remaining-tokens")
+        )
+        self.requests.update(
+            _int_header(headers, "x-ratelimit-limit-requests"), _int_header(headers, "x-ratelimit-remaining-requests")
+        )
+        if self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+
+    def on_rate_limited(self, headers: Mapping[str, str]):
+        self.concurrency = max(1, self.concurrency // 2)
+        if (delay := retry_after_seconds(headers)) is not None:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.info("Embeddings API returned 429, lowering the requests in flight to %d", self.concurrency)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
 class OpenAIEmbeddings(ABC):
     """Client wrapper that handles batching, retries, and token accounting."""
 
@@ -52,6 +197,10 @@ class OpenAIEmbeddings(ABC):
         disable_batch: bool = False,
         azure_deployment_name: str | None = None,
         azure_endpoint: str | None = None,
+        max_concurrency: int = 4,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
     ):
         self.open_ai_client = open_ai_client
         self.open_ai_model_name = open_ai_model_name
@@ -59,6 +208,8 @@ class OpenAIEmbeddings(ABC):
         self.disable_batch = disable_batch
         self.azure_deployment_name = azure_deployment_name
         self.azure_endpoint = azure_endpoint.rstrip("/") if azure_endpoint else None
+        self.rate_limiter = EmbeddingRateLimiter(max_concurrency, tokens_per_minute, requests_per_minute)
+        self.cache = cache
 
     @property
     def _api_model(self) -> str:
@@ -67,9 +218,12 @@ class OpenAIEmbeddings(ABC):
     def before_retry_sleep(self, retry_state):
         logger.info("Rate limited on the OpenAI embeddings API, sleeping before retrying...")
 
+    @functools.cached_property
+    def encoding(self) -> tiktoken.Encoding:
+        return tiktoken.encoding_for_model(self.open_ai_model_name)
+
     def calculate_token_length(self, text: str):
-        encoding = tiktoken.encoding_for_model(self.open_ai_model_name)
-        return len(encoding.encode(text))
+        return len(self.encoding.encode(text))
 
     def split_text_into_batches(self, texts: list[str]) -> list[EmbeddingBatch]:
         batch_info = OpenAIEmbeddings.SUPPORTED_BATCH_MODEL.get(self.open_ai_model_name)
@@ -102,44 +256,72 @@ class OpenAIEmbeddings(ABC):
 
         return batches
 
-    async def create_embedding_batch(self, texts: list[str], dimensions_args: ExtraArgs) -> list[list[float]]:
-        batches = self.split_text_into_batches(texts)
-        embeddings = []
-        for batch in batches:
-            async for attempt in AsyncRetrying(
-                retry=retry_if_exception_type(RateLimitError),
-                wait=wait_random_exponential(min=15, max=60),
-                stop=stop_after_attempt(15),
-                before_sleep=self.before_retry_sleep,
-            ):
-                with attempt:
-                    emb_response = await self.open_ai_client.embeddings.create(
-                        model=self._api_model, input=batch.texts, **dimensions_args
-                    )
-                    embeddings.extend([data.embedding for data in emb_response.data])
-                    logger.info(
-                        "Computed embeddings in batch. Batch size: %d, Token count: %d",
-                        len(batch.texts),
-                        batch.token_length,
-                    )
-
-        return embeddings
-
-    async def create_embedding_single(self, text: str, dimensions_args: ExtraArgs) -> list[float]:
+    async def _create(self, input: str | list[str], token_count: int, dimensions_args: ExtraArgs) -> Any:
+        """Send one embeddings request under the rate limiter, retrying when rate limited"""
         async for attempt in AsyncRetrying(
             retry=retry_if_exception_type(RateLimitError),
-            wait=wait_random_exponential(min=15, max=60),
+            wait=wait_retry_after(wait_random_exponential(min=1, max=60)),
             stop=stop_after_attempt(15),
             before_sleep=self.before_retry_sleep,
         ):
             with attempt:
-                emb_response = await self.open_ai_client.embeddings.create(
-                    model=self._api_model, input=text, **dimensions_args
-                )
-                logger.info("Computed embedding for text section. Character count: %d", len(text))
+                async with self.rate_limiter.request(token_count):
+                    try:
+                        # The raw response exposes the rate limit headers, clients without it are used as is
+                        raw_embeddings = getattr(self.open_ai_client.embeddings, "with_raw_response", None)
+                        if raw_embeddings is None:
+                            emb_response = await self.open_ai_client.embeddings.create(
+                                model=self._api_model, input=input, **dimensions_args
+                            )
+                            headers: Mapping[str, str] = {}
+                        else:
+                            raw_response = await raw_embeddings.create(
+                                model=self._api_model, input=input, **dimensions_args
+                            )
+                            emb_response = raw_response.parse()
+                            headers = raw_response.headers
+                    except RateLimitError as error:
+                        self.rate_limiter.on_rate_limited(_rate_limit_headers(error))
+                        raise
+                    self.rate_limiter.on_success(headers)
+        return emb_response
+
+    async def _gather(self, requests: list[Awaitable[Any]]) -> list[Any]:
+        """Run the requests concurrently and return their results in order, cancelling the others on error"""
+        tasks = [asyncio.ensure_future(request) for request in requests]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def _create_batch(self, batch: EmbeddingBatch, dimensions_args: ExtraArgs) -> list[list[float]]:
+        emb_response = await self._create(batch.texts, batch.token_length, dimensions_args)
+        logger.info(
+            "Computed embeddings in batch. Batch size: %d, Token count: %d",
+            len(batch.texts),
+            batch.token_length,
+        )
+        return [data.embedding for data in emb_response.data]
+
+    async def create_embedding_batch(self, texts: list[str], dimensions_args: ExtraArgs) -> list[list[float]]:
+        batches = self.split_text_into_batches(texts)
+        results = await self._gather([self._create_batch(batch, dimensions_args) for batch in batches])
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
 
+    async def create_embedding_single(self, text: str, dimensions_args: ExtraArgs) -> list[float]:
+        emb_response = await self._create(text, self._estimated_token_length(text), dimensions_args)
+        logger.info("Computed embedding for text section. Character count: %d", len(text))
         return emb_response.data[0].embedding
 
+    def _estimated_token_length(self, text: str) -> int:
+        # Models without a known encoding are budgeted at about 4 characters per token
+        try:
+            return self.calculate_token_length(text)
+        except KeyError:
+            return len(text) // 4 + 1
+
     async def create_embeddings(self, texts: list[str]) -> list[list[float]]:
 
         dimensions_args: ExtraArgs = (
@@ -148,10 +330,26 @@ class OpenAIEmbeddings(ABC):
             else {}
         )
 
+        if self.cache is None:
+            return await self._create_embeddings(texts, dimensions_args)
+
+        # Only the texts missing from the cache are embedded, each of them once
+        keys = [self.cache.key(self.open_ai_model_name, dimensions_args.get("dimensions"), text) for text in texts]
+        cached = await self.cache.aget_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        logger.info("Found %d of %d embeddings in the embedding cache", sum(key in cached for key in keys), len(texts))
+        if missing:
+            computed = await self._create_embeddings(list(missing.values()), dimensions_args)
+            new_embeddings = dict(zip(missing.keys(), computed))
+            await self.cache.aput_many(new_embeddings.items())
+            cached.update(new_embeddings)
+        return [cached[key] for key in keys]
+
+    async def _create_embeddings(self, texts: list[str], dimensions_args: ExtraArgs) -> list[list[float]]:
         if not self.disable_batch and self.open_ai_model_name in OpenAIEmbeddings.SUPPORTED_BATCH_MODEL:
             return await self.create_embedding_batch(texts, dimensions_args)
 
-        return [await self.create_embedding_single(text, dimensions_args) for text in texts]
+        return await self._gather([self.create_embedding_single(text, dimensions_args) for text in texts])
 
 
 class ImageEmbeddings:
@@ -160,42 +358,55 @@ class ImageEmbeddings:
     To learn more, please visit https://learn.microsoft.com/azure/ai-services/computer-vision/how-to/image-retrieval#call-the-vectorize-image-api
     """
 
+    MODEL_VERSION = "2023-04-15"
+
     def __init__(self, endpoint: str, token_provider: Callable[[], Awaitable[str]]):
+        # The token provider is expected to cache the token until it nears expiry, as get_bearer_token_provider does
         self.token_provider = token_provider
         self.endpoint = endpoint
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created on first use so it belongs to the running event loop, then reused to keep connections alive
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(keepalive_timeout=60))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def create_embedding_for_image(self, image_bytes: bytes) -> list[float]:
         endpoint = urljoin(self.endpoint, "computervision/retrieval:vectorizeImage")
-        params = {"api-version": "2024-02-01", "model-version": "2023-04-15"}
-        headers = {"Authorization": "Bearer " + await self.token_provider()}
-
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async for attempt in AsyncRetrying(
-                retry=retry_if_exception_type(Exception),
-                wait=wait_random_exponential(min=15, max=60),
-                stop=stop_after_attempt(15),
-                before_sleep=self.before_retry_sleep,
-            ):
-                with attempt:
-                    async with session.post(url=endpoint, params=params, data=image_bytes) as resp:
-                        resp_json = await resp.json()
-                        return resp_json["vector"]
+        params = {"api-version": "2024-02-01", "model-version": self.MODEL_VERSION}
+
+        session = self._get_session()
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception_type(Exception),
+            wait=wait_random_exponential(min=15, max=60),
+            stop=stop_after_attempt(15),
+            before_sleep=self.before_retry_sleep,
+        ):
+            with attempt:
+                headers = {"Authorization": "Bearer " + await self.token_provider()}
+                async with session.post(url=endpoint, params=params, headers=headers, data=image_bytes) as resp:
+                    resp_json = await resp.json()
+                    return resp_json["vector"]
         raise ValueError("Failed to get image embedding after multiple retries.")
 
     async def create_embedding_for_text(self, q: str):
         endpoint = urljoin(self.endpoint, "computervision/retrieval:vectorizeText")
         headers = {"Content-Type": "application/json"}
-        params = {"api-version": "2024-02-01", "model-version": "2023-04-15"}
+        params = {"api-version": "2024-02-01", "model-version": self.MODEL_VERSION}
         data = {"text": q}
         headers["Authorization"] = "Bearer " + await self.token_provider()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url=endpoint, params=params, headers=headers, json=data, raise_for_status=True
-            ) as response:
-                json = await response.json()
-                return json["vector"]
-        raise ValueError("Failed to get text embedding after multiple retries.")
+        async with self._get_session().post(
+            url=endpoint, params=params, headers=headers, json=data, raise_for_status=True
+        ) as response:
+            json = await response.json()
+            return json["vector"]
 
     def before_retry_sleep(self, retry_state):
         logger.info("Rate limited on the Vision embeddings API, sleeping before retrying...")
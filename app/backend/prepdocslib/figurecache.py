@@ -0,0 +1,115 @@
+"""
+Cache of the results of figure processing, keyed by a SHA-256 hash of the image bytes.
+
+Documents often repeat the same logos, headers and diagrams on many pages, so an image that was already
+described, embedded or uploaded reuses the earlier result instead of calling the service again. Results are
+kept in memory for the run, and descriptions and embeddings can also be stored in a local SQLite database
+to be reused by later runs. Concurrent requests for the same image share a single call to the service.
+
+Images are matched by their exact bytes: the same figure extracted at another size or resolution is a
+different image.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional, TypeVar
+
+logger = logging.getLogger("scripts")
+
+T = TypeVar("T")
+
+
+class FigureCache:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._values: dict[tuple[str, str], Any] = {}
+        self._pending: dict[tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS figures ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._connection.commit()
+
+    @staticmethod
+    def image_hash(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _load(self, namespace: str, key: str) -> tuple[bool, Any]:
+        assert self._connection is not None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM figures WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return (False, None) if row is None else (True, json.loads(row[0]))
+
+    def _store(self, namespace: str, key: str, value: Any):
+        assert self._connection is not None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO figures (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value)),
+            )
+            self._connection.commit()
+
+    async def get_or_create(
+        self, namespace: str, key: str, create: Callable[[], Awaitable[T]], persist: bool = True
+    ) -> T:
+        """Return the cached value of the key, or create it once however many callers ask for it at the same time.
+
+        Values are stored in the database when persist is True and the cache has a path. Failures are not cached.
+        """
+        cache_key = (namespace, key)
+        if cache_key in self._values:
+            self.hits += 1
+            return self._values[cache_key]
+        if cache_key in self._pending:
+            self.hits += 1
+            # Shielded so that a cancelled caller doesn't cancel the call the other callers are waiting for
+            return await asyncio.shield(self._pending[cache_key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[cache_key] = future
+        try:
+            persistent = persist and self._connection is not None
+            found, value = (await asyncio.to_thread(self._load, namespace, key)) if persistent else (False, None)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                value = await create()
+                if persistent:
+                    await asyncio.to_thread(self._store, namespace, key, value)
+            self._values[cache_key] = value
+            future.set_result(value)
+            return value
+        except BaseException as error:
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+                # The exception is raised to this caller, don't warn that the future's one was never retrieved
+                future.exception()
+            raise
+        finally:
+            del self._pending[cache_key]
+
+    def close(self):
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
+            self._connection = None
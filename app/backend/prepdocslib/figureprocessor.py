@@ -1,23 +1,29 @@
 """Utilities for describing and enriching figures extracted from documents."""
 
+import asyncio
 import logging
+from collections.abc import Awaitable, Callable
+from contextlib import nullcontext
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Optional, TypeVar
 
 from azure.core.credentials import AzureKeyCredential
 from azure.core.credentials_async import AsyncTokenCredential
 
 from .blobmanager import BaseBlobManager
 from .embeddings import ImageEmbeddings
+from .figurecache import FigureCache
 from .mediadescriber import (
     ContentUnderstandingDescriber,
     MediaDescriber,
     MultimodalModelDescriber,
 )
-from .page import ImageOnPage
+from .page import ImageOnPage, Page
 
 logger = logging.getLogger("scripts")
 
+T = TypeVar("T")
+
 
 class MediaDescriptionStrategy(Enum):
     """Supported mechanisms for describing images extracted from documents."""
@@ -48,6 +54,8 @@ class FigureProcessor:
         self.content_understanding_endpoint = content_understanding_endpoint
         self.media_describer: MediaDescriber | None = None
         self.content_understanding_ready = False
+        # Figures are described concurrently, the analyzer must only be created once
+        self.analyzer_lock = asyncio.Lock()
 
     async def get_media_describer(self) -> MediaDescriber | None:
         """Return (and lazily create) the media describer for this processor."""
@@ -81,6 +89,19 @@ class FigureProcessor:
         logger.warning("Unknown media description strategy '%s'; skipping description", self.strategy)
         return None
 
+    def cache_namespace(self) -> str:
+        """Name the describer in the FigureCache, so descriptions made by another model are not reused."""
+
+        if self.strategy == MediaDescriptionStrategy.CONTENTUNDERSTANDING:
+            return f"description:{self.strategy.value}:{self.content_understanding_endpoint}"
+        return f"description:{self.strategy.value}:{self.openai_model}"
+
+    async def close(self) -> None:
+        """Close the media describer, if one was created."""
+
+        if self.media_describer is not None:
+            await self.media_describer.close()
+
     def mark_content_understanding_ready(self) -> None:
         """Record that the Content Understanding analyzer exists to avoid recreating it."""
 
@@ -93,11 +114,22 @@ class FigureProcessor:
         if describer is None:
             return None
         if isinstance(describer, ContentUnderstandingDescriber) and not self.content_understanding_ready:
-            await describer.create_analyzer()
-            self.content_understanding_ready = True
+            async with self.analyzer_lock:
+                if not self.content_understanding_ready:
+                    await describer.create_analyzer()
+                    self.content_understanding_ready = True
         return await describer.describe_image(image_bytes)
 
 
+class FigureLimits:
+    """Limits on the calls made at once to each service while processing figures, shared by all documents"""
+
+    def __init__(self, descriptions: int = 4, uploads: int = 8, embeddings: int = 4) -> None:
+        self.descriptions = asyncio.Semaphore(descriptions)
+        self.uploads = asyncio.Semaphore(uploads)
+        self.embeddings = asyncio.Semaphore(embeddings)
+
+
 def build_figure_markup(image: "ImageOnPage", description: Optional[str] = None) -> str:
     """Create consistent HTML markup for a figure description on demand."""
 
@@ -118,29 +150,116 @@ async def process_page_image(
     image_embeddings_client: Optional[ImageEmbeddings],
     figure_processor: Optional[FigureProcessor] = None,
     user_oid: Optional[str] = None,
+    limits: Optional[FigureLimits] = None,
+    cache: Optional[FigureCache] = None,
 ) -> "ImageOnPage":
-    """Generate description, upload image, and optionally compute embedding for a figure."""
+    """Generate description, upload image, and optionally compute embedding for a figure.
+
+    With a cache, an image already seen reuses its description and embedding, and its uploaded URL
+    when it was seen earlier in the same document.
+    """
 
     if blob_manager is None:
         raise ValueError("BlobManager must be provided to process images.")
 
+    def limited(
+        semaphore: Optional[asyncio.Semaphore], create: Callable[[], Awaitable[T]]
+    ) -> Callable[[], Awaitable[T]]:
+        async def call() -> T:
+            async with semaphore if semaphore is not None else nullcontext():
+                return await create()
+
+        return call
+
+    image_hash = FigureCache.image_hash(image.bytes) if cache is not None else ""
+
+    async def cached(
+        namespace: Callable[[], str], key: str, create: Callable[[], Awaitable[T]], persist: bool = True
+    ) -> T:
+        if cache is None:
+            return await create()
+        return await cache.get_or_create(namespace(), key, create, persist=persist)
+
     # Generate plain (model) description text only; do not wrap in HTML markup here.
     description_text: str | None = None
     if figure_processor is not None:
-        description_text = await figure_processor.describe(image.bytes)
+        description_text = await cached(
+            lambda: figure_processor.cache_namespace(),
+            image_hash,
+            limited(limits.descriptions if limits else None, lambda: figure_processor.describe(image.bytes)),
+        )
 
     # Store plain descriptive text (can be None). HTML rendering is deferred to build_figure_markup.
     image.description = description_text
 
     if image.url is None:
-        image.url = await blob_manager.upload_document_image(
-            document_filename, image.bytes, image.filename, image.page_num, user_oid=user_oid
+        # The uploaded image is captioned with its document, so its URL is only reused within that document,
+        # and only during this run since the blob may be removed afterwards
+        image.url = await cached(
+            lambda: "url",
+            f"{user_oid or ''}/{document_filename}/{image_hash}",
+            limited(
+                limits.uploads if limits else None,
+                lambda: blob_manager.upload_document_image(
+                    document_filename, image.bytes, image.filename, image.page_num, user_oid=user_oid
+                ),
+            ),
+            persist=False,
         )
 
     if image_embeddings_client is not None:
         try:
-            image.embedding = await image_embeddings_client.create_embedding_for_image(image.bytes)
+            image.embedding = await cached(
+                lambda: f"image-embedding:{image_embeddings_client.MODEL_VERSION}",
+                image_hash,
+                limited(
+                    limits.embeddings if limits else None,
+                    lambda: image_embeddings_client.create_embedding_for_image(image.bytes),
+                ),
+            )
         except Exception:  # pragma: no cover - embedding failures shouldn't abort figure processing
             logger.warning("Image embedding generation failed for figure %s", image.figure_id, exc_info=True)
 
     return image
+
+
+async def process_page_images(
+    *,
+    pages: list[Page],
+    document_filename: str,
+    blob_manager: Optional[BaseBlobManager],
+    image_embeddings_client: Optional[ImageEmbeddings],
+    figure_processor: Optional[FigureProcessor] = None,
+    user_oid: Optional[str] = None,
+    limits: Optional[FigureLimits] = None,
+    cache: Optional[FigureCache] = None,
+) -> None:
+    """Process all the figures of a document concurrently, within the limits of each service.
+
+    The figures are updated in place, so they stay attached to their pages in order.
+    """
+
+    limits = limits or FigureLimits()
+
+    async def process(page: Page, image: ImageOnPage):
+        logger.info("Processing image '%s' on page %d", image.filename, page.page_num)
+        await process_page_image(
+            image=image,
+            document_filename=document_filename,
+            blob_manager=blob_manager,
+            image_embeddings_client=image_embeddings_client,
+            figure_processor=figure_processor,
+            user_oid=user_oid,
+            limits=limits,
+            cache=cache,
+        )
+
+    tasks = [asyncio.create_task(process(page, image)) for page in pages for image in page.images]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave the other figures running after the first error
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
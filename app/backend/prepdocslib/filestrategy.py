@@ -3,12 +3,15 @@ from typing import Optional
 
 from .blobmanager import AdlsBlobManager, BaseBlobManager, BlobManager
 from .embeddings import ImageEmbeddings, OpenAIEmbeddings
+from .figurecache import FigureCache
 from .figureprocessor import (
+    FigureLimits,
     FigureProcessor,
     MediaDescriptionStrategy,
-    process_page_image,
+    process_page_images,
 )
 from .fileprocessor import FileProcessor
+from .ingestionpipeline import IngestionConcurrency, IngestionPipeline
 from .listfilestrategy import File, ListFileStrategy
 from .mediadescriber import ContentUnderstandingDescriber
 from .searchmanager import SearchManager, Section
@@ -26,6 +29,8 @@ async def parse_file(
     image_embeddings_client: Optional[ImageEmbeddings] = None,
     figure_processor: Optional[FigureProcessor] = None,
     user_oid: Optional[str] = None,
+    figure_limits: Optional[FigureLimits] = None,
+    figure_cache: Optional[FigureCache] = None,
 ) -> list[Section]:
 
     key = file.file_extension().lower()
@@ -35,17 +40,16 @@ async def parse_file(
         return []
     logger.info("Ingesting '%s'", file.filename())
     pages = [page async for page in processor.parser.parse(content=file.content)]
-    for page in pages:
-        for image in page.images:
-            logger.info("Processing image '%s' on page %d", image.filename, page.page_num)
-            await process_page_image(
-                image=image,
-                document_filename=file.filename(),
-                blob_manager=blob_manager,
-                image_embeddings_client=image_embeddings_client,
-                figure_processor=figure_processor,
-                user_oid=user_oid,
-            )
+    await process_page_images(
+        pages=pages,
+        document_filename=file.filename(),
+        blob_manager=blob_manager,
+        image_embeddings_client=image_embeddings_client,
+        figure_processor=figure_processor,
+        user_oid=user_oid,
+        limits=figure_limits,
+        cache=figure_cache,
+    )
     sections = process_text(pages, file, processor.splitter, category)
     return sections
 
@@ -53,6 +57,7 @@ async def parse_file(
 class FileStrategy(Strategy):
     """
     Strategy for ingesting documents into a search service from files stored either locally or in a data lake storage account
+    Files are ingested one at a time, or through an IngestionPipeline when a concurrency is given
     """
 
     def __init__(
@@ -72,6 +77,10 @@ class FileStrategy(Strategy):
         enforce_access_control: bool = False,
         use_web_source: bool = False,
         use_sharepoint_source: bool = False,
+        concurrency: Optional[IngestionConcurrency] = None,
+        diff_update: bool = False,
+        figure_cache: Optional[FigureCache] = None,
+        figure_limits: Optional[FigureLimits] = None,
     ):
         self.list_file_strategy = list_file_strategy
         self.blob_manager = blob_manager
@@ -88,6 +97,11 @@ class FileStrategy(Strategy):
         self.enforce_access_control = enforce_access_control
         self.use_web_source = use_web_source
         self.use_sharepoint_source = use_sharepoint_source
+        self.concurrency = concurrency
+        self.diff_update = diff_update
+        self.figure_cache = figure_cache
+        # The limits are shared by the figures of all the files
+        self.figure_limits = figure_limits or FigureLimits()
 
     def setup_search_manager(self):
         self.search_manager = SearchManager(
@@ -101,6 +115,7 @@ class FileStrategy(Strategy):
             enforce_access_control=self.enforce_access_control,
             use_web_source=self.use_web_source,
             use_sharepoint_source=self.use_sharepoint_source,
+            diff_update=self.diff_update,
         )
 
     async def setup(self):
@@ -118,7 +133,20 @@ class FileStrategy(Strategy):
 
     async def run(self):
         self.setup_search_manager()
-        if self.document_action == DocumentAction.Add:
+        if self.document_action == DocumentAction.Add and self.concurrency is not None:
+            pipeline = IngestionPipeline(
+                blob_manager=self.blob_manager,
+                search_manager=self.search_manager,
+                file_processors=self.file_processors,
+                concurrency=self.concurrency,
+                category=self.category,
+                image_embeddings=self.image_embeddings,
+                figure_processor=self.figure_processor,
+                figure_cache=self.figure_cache,
+                figure_limits=self.figure_limits,
+            )
+            await pipeline.run(self.list_file_strategy.list())
+        elif self.document_action == DocumentAction.Add:
             files = self.list_file_strategy.list()
             async for file in files:
                 try:
@@ -130,6 +158,8 @@ class FileStrategy(Strategy):
                         self.blob_manager,
                         self.image_embeddings,
                         figure_processor=self.figure_processor,
+                        figure_limits=self.figure_limits,
+                        figure_cache=self.figure_cache,
                     )
                     if sections:
                         await self.search_manager.update_content(sections, url=blob_url)
@@ -144,6 +174,16 @@ class FileStrategy(Strategy):
         elif self.document_action == DocumentAction.RemoveAll:
             await self.blob_manager.remove_blob()
             await self.search_manager.remove_content()
+        if self.figure_cache is not None and self.figure_cache.hits:
+            logger.info("Reused the results of %d repeated figures from the figure cache", self.figure_cache.hits)
+
+    async def close(self):
+        if self.image_embeddings is not None:
+            await self.image_embeddings.close()
+        if self.figure_processor is not None:
+            await self.figure_processor.close()
+        for file_processor in self.file_processors.values():
+            await file_processor.parser.close()
 
 
 class UploadUserFileStrategy:
@@ -161,6 +201,7 @@ class UploadUserFileStrategy:
         image_embeddings: Optional[ImageEmbeddings] = None,
         enforce_access_control: bool = False,
         figure_processor: Optional[FigureProcessor] = None,
+        figure_limits: Optional[FigureLimits] = None,
     ):
         self.file_processors = file_processors
         self.embeddings = embeddings
@@ -168,6 +209,8 @@ class UploadUserFileStrategy:
         self.search_info = search_info
         self.blob_manager = blob_manager
         self.figure_processor = figure_processor
+        # The limits are shared by the figures of all the files uploaded at once
+        self.figure_limits = figure_limits or FigureLimits()
         self.search_manager = SearchManager(
             search_info=self.search_info,
             search_analyzer_name=None,
@@ -177,6 +220,8 @@ class UploadUserFileStrategy:
             field_name_embedding=search_field_name_embedding,
             search_images=image_embeddings is not None,
             enforce_access_control=enforce_access_control,
+            # Uploading a file again replaces the sections of the previous upload
+            diff_update=True,
         )
         self.search_field_name_embedding = search_field_name_embedding
 
@@ -189,10 +234,21 @@ class UploadUserFileStrategy:
             self.image_embeddings,
             figure_processor=self.figure_processor,
             user_oid=user_oid,
+            figure_limits=self.figure_limits,
+            # Repeated images are only processed once within the uploaded file
+            figure_cache=FigureCache(),
         )
         if sections:
             await self.search_manager.update_content(sections, url=file.url)
 
+    async def close(self):
+        if self.image_embeddings is not None:
+            await self.image_embeddings.close()
+        if self.figure_processor is not None:
+            await self.figure_processor.close()
+        for file_processor in self.file_processors.values():
+            await file_processor.parser.close()
+
     async def remove_file(self, filename: str, oid: str):
         if filename is None or filename == "":
             logging.warning("Filename is required to remove a file")
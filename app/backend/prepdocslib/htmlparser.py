@@ -31,6 +31,8 @@ def cleanup_data(data: str) -> str:
 class LocalHTMLParser(Parser):
     """Parses HTML text into Page objects."""
 
+    cpu_bound = True
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         """Parses the given content.
         To learn more, please visit https://pypi.org/project/beautifulsoup4/
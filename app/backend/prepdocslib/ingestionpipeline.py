@@ -0,0 +1,200 @@
+"""
+Pipelined ingestion of files, used by FileStrategy when it is given an IngestionConcurrency.
+
+Files flow through three stages connected by bounded queues, so only a few files are held in memory at
+once whatever the size of the listing:
+
+1. upload: the file is uploaded to blob storage.
+2. parse: local parsers and the text splitter, which only use the CPU, run in a process pool, while
+   remote parsers (Document Intelligence) and figure processing run on the event loop.
+3. index: the sections are embedded and uploaded to the search index.
+
+Each stage runs a fixed number of workers, and the calls to the remote parsers and to each figure
+service (descriptions, uploads, embeddings) are limited by a semaphore each.
+"""
+
+import asyncio
+import io
+import logging
+import os
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .blobmanager import BaseBlobManager
+from .embeddings import ImageEmbeddings
+from .figurecache import FigureCache
+from .figureprocessor import FigureLimits, FigureProcessor, process_page_images
+from .fileprocessor import FileProcessor
+from .listfilestrategy import File
+from .page import Chunk, Page
+from .parser import Parser
+from .searchmanager import SearchManager, Section
+from .textprocessor import build_sections, combine_text_with_figures
+from .textsplitter import TextSplitter
+
+logger = logging.getLogger("scripts")
+
+# Put on a queue once per worker of the next stage when a stage is done
+_DONE = object()
+
+
+@dataclass
+class IngestionConcurrency:
+    """Concurrency limits of the ingestion pipeline"""
+
+    processes: int = field(default_factory=lambda: os.cpu_count() or 1)  # worker processes for parsing and splitting
+    uploads: int = 8  # files uploaded to blob storage at once
+    remote_parsers: int = 4  # files parsed by a remote service (Document Intelligence) at once
+    indexing: int = 4  # files embedded and uploaded to the search index at once
+    queue_size: int = 16  # files buffered between two stages
+
+
+def parse_pages(parser: Parser, filename: str, data: bytes) -> list[Page]:
+    """Parse the content of a file in a worker process"""
+    content = io.BytesIO(data)
+    content.name = filename
+
+    async def collect() -> list[Page]:
+        return [page async for page in parser.parse(content=content)]
+
+    return asyncio.run(collect())
+
+
+def split_pages(splitter: TextSplitter, pages: list[Page]) -> list[Chunk]:
+    """Split pages into chunks in a worker process"""
+    return list(splitter.split_pages(pages))
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        blob_manager: BaseBlobManager,
+        search_manager: SearchManager,
+        file_processors: dict[str, FileProcessor],
+        concurrency: IngestionConcurrency,
+        category: Optional[str] = None,
+        image_embeddings: Optional[ImageEmbeddings] = None,
+        figure_processor: Optional[FigureProcessor] = None,
+        figure_cache: Optional[FigureCache] = None,
+        figure_limits: Optional[FigureLimits] = None,
+    ):
+        self.blob_manager = blob_manager
+        self.search_manager = search_manager
+        self.file_processors = file_processors
+        self.concurrency = concurrency
+        self.category = category
+        self.image_embeddings = image_embeddings
+        self.figure_processor = figure_processor
+        self.figure_cache = figure_cache
+        self.remote_parser_limit = asyncio.Semaphore(concurrency.remote_parsers)
+        self.figure_limits = figure_limits or FigureLimits()
+        self.open_files: set[File] = set()
+        self.executor: Optional[Executor] = None
+
+    async def run(self, files: AsyncGenerator[File, None]):
+        """Ingest the listed files, stopping at the first error"""
+        uploads, parses, indexing = self.concurrency.uploads, self.concurrency.processes, self.concurrency.indexing
+        listed: asyncio.Queue = asyncio.Queue(self.concurrency.queue_size)
+        uploaded: asyncio.Queue = asyncio.Queue(self.concurrency.queue_size)
+        parsed: asyncio.Queue = asyncio.Queue(self.concurrency.queue_size)
+        with ProcessPoolExecutor(max_workers=self.concurrency.processes) as executor:
+            self.executor = executor
+            tasks = [
+                asyncio.create_task(self._list(files, listed, uploads)),
+                asyncio.create_task(self._stage(self._upload, listed, uploaded, uploads, parses)),
+                asyncio.create_task(self._stage(self._parse, uploaded, parsed, parses, indexing)),
+                asyncio.create_task(self._stage(self._index, parsed, None, indexing, 0)),
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                for file in self.open_files:
+                    file.close()
+                self.open_files.clear()
+                self.executor = None
+
+    async def _list(self, files: AsyncGenerator[File, None], outbox: asyncio.Queue, next_workers: int):
+        async for file in files:
+            self.open_files.add(file)
+            await outbox.put(file)
+        for _ in range(next_workers):
+            await outbox.put(_DONE)
+
+    async def _stage(
+        self,
+        handle: Callable[[Any], Awaitable[Any]],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        workers: int,
+        next_workers: int,
+    ):
+        async def worker():
+            while (item := await inbox.get()) is not _DONE:
+                result = await handle(item)
+                if outbox is not None and result is not None:
+                    await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(_DONE)
+
+    def _close(self, file: File):
+        self.open_files.discard(file)
+        file.close()
+
+    async def _upload(self, file: File) -> tuple[File, Optional[str]]:
+        blob_url = await self.blob_manager.upload_blob(file)
+        return file, blob_url
+
+    async def _parse(self, item: tuple[File, Optional[str]]) -> Optional[tuple[list[Section], Optional[str], File]]:
+        file, blob_url = item
+        processor = self.file_processors.get(file.file_extension().lower())
+        if processor is None:
+            logger.info("Skipping '%s', no parser found.", file.filename())
+            self._close(file)
+            return None
+        logger.info("Ingesting '%s'", file.filename())
+        loop = asyncio.get_running_loop()
+        if processor.parser.cpu_bound:
+            pages = await loop.run_in_executor(
+                self.executor, parse_pages, processor.parser, file.filename(), file.content.read()
+            )
+        else:
+            async with self.remote_parser_limit:
+                pages = [page async for page in processor.parser.parse(content=file.content)]
+        await process_page_images(
+            pages=pages,
+            document_filename=file.filename(),
+            blob_manager=self.blob_manager,
+            image_embeddings_client=self.image_embeddings,
+            figure_processor=self.figure_processor,
+            limits=self.figure_limits,
+            cache=self.figure_cache,
+        )
+        for page in pages:
+            combine_text_with_figures(page)
+
+        logger.info("Splitting '%s' into sections", file.filename())
+        # Only the text is sent to the worker process, the images are added back to the sections after
+        text_pages = [Page(page_num=page.page_num, offset=page.offset, text=page.text) for page in pages]
+        chunks = await loop.run_in_executor(self.executor, split_pages, processor.splitter, text_pages)
+        sections = build_sections(chunks, pages, file, self.category)
+        if not sections:
+            self._close(file)
+            return None
+        return sections, blob_url, file
+
+    async def _index(self, item: tuple[list[Section], Optional[str], File]):
+        sections, blob_url, file = item
+        try:
+            await self.search_manager.update_content(sections, url=blob_url)
+        finally:
+            self._close(file)
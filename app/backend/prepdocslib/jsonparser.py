@@ -11,6 +11,8 @@ class JsonParser(Parser):
     Concrete parser that can parse JSON into Page objects. A top-level object becomes a single Page, while a top-level array becomes multiple Page objects.
     """
 
+    cpu_bound = True
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         offset = 0
         data = json.loads(content.read())
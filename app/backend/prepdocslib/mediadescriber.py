@@ -25,6 +25,9 @@ class MediaDescriber(ABC):
     async def describe_image(self, image_bytes) -> str:
         raise NotImplementedError  # pragma: no cover
 
+    async def close(self):
+        """Release the connections held by the describer"""
+
 
 class ContentUnderstandingDescriber(MediaDescriber):
     CU_API_VERSION = "2024-12-01-preview"
@@ -51,6 +54,20 @@ class ContentUnderstandingDescriber(MediaDescriber):
     def __init__(self, endpoint: str, credential: AsyncTokenCredential):
         self.endpoint = endpoint
         self.credential = credential
+        # Caches the token and only asks the credential for a new one when it nears expiry
+        self.token_provider = get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default")
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created on first use so it belongs to the running event loop, then reused to keep connections alive
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(keepalive_timeout=60))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def poll_api(self, session, poll_url, headers):
 
@@ -70,50 +87,47 @@ class ContentUnderstandingDescriber(MediaDescriber):
     async def create_analyzer(self):
         logger.info("Creating analyzer '%s'...", self.analyzer_schema["analyzerId"])
 
-        token_provider = get_bearer_token_provider(self.credential, "https://cognitiveservices.azure.com/.default")
-        token = await token_provider()
+        token = await self.token_provider()
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
         params = {"api-version": self.CU_API_VERSION}
         analyzer_id = self.analyzer_schema["analyzerId"]
         cu_endpoint = f"{self.endpoint}/contentunderstanding/analyzers/{analyzer_id}"
-        async with aiohttp.ClientSession() as session:
-            async with session.put(
-                url=cu_endpoint, params=params, headers=headers, json=self.analyzer_schema
-            ) as response:
-                if response.status == 409:
-                    logger.info("Analyzer '%s' already exists.", analyzer_id)
-                    return
-                elif response.status != 201:
-                    data = await response.text()
-                    raise Exception("Error creating analyzer", data)
-                else:
-                    poll_url = response.headers.get("Operation-Location")
-
-            with Progress() as progress:
-                progress.add_task("Creating analyzer...", total=None, start=False)
-                await self.poll_api(session, poll_url, headers)
+        session = self._get_session()
+        async with session.put(url=cu_endpoint, params=params, headers=headers, json=self.analyzer_schema) as response:
+            if response.status == 409:
+                logger.info("Analyzer '%s' already exists.", analyzer_id)
+                return
+            elif response.status != 201:
+                data = await response.text()
+                raise Exception("Error creating analyzer", data)
+            else:
+                poll_url = response.headers.get("Operation-Location")
+
+        with Progress() as progress:
+            progress.add_task("Creating analyzer...", total=None, start=False)
+            await self.poll_api(session, poll_url, headers)
 
     async def describe_image(self, image_bytes: bytes) -> str:
-        async with aiohttp.ClientSession() as session:
-            token = await self.credential.get_token("https://cognitiveservices.azure.com/.default")
-            headers = {"Authorization": "Bearer " + token.token}
-            params = {"api-version": self.CU_API_VERSION}
-            analyzer_name = self.analyzer_schema["analyzerId"]
-            async with session.post(
-                url=f"{self.endpoint}/contentunderstanding/analyzers/{analyzer_name}:analyze",
-                params=params,
-                headers=headers,
-                data=image_bytes,
-            ) as response:
-                response.raise_for_status()
-                poll_url = response.headers["Operation-Location"]
-
-                with Progress() as progress:
-                    progress.add_task("Processing...", total=None, start=False)
-                    results = await self.poll_api(session, poll_url, headers)
-
-                fields = results["result"]["contents"][0]["fields"]
-                return fields["Description"]["valueString"]
+        session = self._get_session()
+        token = await self.token_provider()
+        headers = {"Authorization": "Bearer " + token}
+        params = {"api-version": self.CU_API_VERSION}
+        analyzer_name = self.analyzer_schema["analyzerId"]
+        async with session.post(
+            url=f"{self.endpoint}/contentunderstanding/analyzers/{analyzer_name}:analyze",
+            params=params,
+            headers=headers,
+            data=image_bytes,
+        ) as response:
+            response.raise_for_status()
+            poll_url = response.headers["Operation-Location"]
+
+        # No live progress display here, figures are described concurrently
+        logger.debug("Waiting for the description of an image from '%s'", analyzer_name)
+        results = await self.poll_api(session, poll_url, headers)
+
+        fields = results["result"]["contents"][0]["fields"]
+        return fields["Description"]["valueString"]
 
 
 class MultimodalModelDescriber(MediaDescriber):
@@ -10,6 +10,12 @@ class Parser(ABC):
     Abstract parser that parses content into Page objects
     """
 
+    # Parsers that only use the CPU (no remote service) can be run in a worker process during ingestion
+    cpu_bound: bool = False
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         if False:
             yield  # pragma: no cover - this is necessary for mypy to type check
+
+    async def close(self) -> None:
+        """Release the resources kept by the parser between documents"""
@@ -1,8 +1,12 @@
+import asyncio
+import heapq
 import html
 import io
 import logging
 import uuid
+from collections import defaultdict
 from collections.abc import AsyncGenerator
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from typing import IO, Optional
 
@@ -26,12 +30,23 @@ from .parser import Parser
 logger = logging.getLogger("scripts")
 
 
+class ObjectType(Enum):
+    TABLE = 0
+    FIGURE = 1
+
+
+# A table or figure of a page, by its index among the tables or figures of the page
+ObjectEntry = tuple[ObjectType, int]
+
+
 class LocalPdfParser(Parser):
     """
     Concrete parser backed by PyPDF that can parse PDFs into pages
     To learn more, please visit https://pypi.org/project/pypdf/
     """
 
+    cpu_bound = True
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         logger.info("Extracting text from '%s' using local PDF parser (pypdf)", content.name)
 
@@ -44,6 +59,74 @@ class LocalPdfParser(Parser):
             offset += len(page_text)
 
 
+def extract_page_texts(data: bytes, start: int, stop: int) -> list[str]:
+    """Extract the text of pages [start, stop) of a PDF, in a worker process of PyMuPdfParser"""
+    with pymupdf.open(stream=data, filetype="pdf") as doc:
+        return [doc[page_num].get_text() for page_num in range(start, stop)]
+
+
+class PyMuPdfParser(Parser):
+    """
+    Concrete parser backed by PyMuPDF that can parse PDFs into pages, much faster than LocalPdfParser
+    To learn more, please visit https://pymupdf.readthedocs.io/
+
+    With more than one process, the pages of documents of at least parallel_min_pages pages are
+    extracted in a process pool, in contiguous ranges so the pages keep their order.
+    The pool is kept for the next documents until the parser is closed.
+    """
+
+    cpu_bound = True
+
+    def __init__(self, processes: int = 1, parallel_min_pages: int = 100):
+        self.processes = processes
+        self.parallel_min_pages = parallel_min_pages
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __getstate__(self) -> dict:
+        # A copy sent to a worker process, as by the ingestion pipeline, extracts the pages in that process:
+        # a pool in every worker would start workers × processes processes
+        return {**self.__dict__, "processes": 1, "_executor": None}
+
+    async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
+        logger.info("Extracting text from '%s' using local PDF parser (PyMuPDF)", content.name)
+
+        data = content.read()
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            page_count = doc.page_count
+            parallel = self.processes > 1 and page_count >= self.parallel_min_pages
+            if not parallel:
+                page_texts = [page.get_text() for page in doc]
+        if parallel:
+            page_texts = await self.extract_in_parallel(data, page_count)
+
+        offset = 0
+        for page_num, page_text in enumerate(page_texts):
+            yield Page(page_num=page_num, offset=offset, text=page_text)
+            offset += len(page_text)
+
+    async def extract_in_parallel(self, data: bytes, page_count: int) -> list[str]:
+        # A few ranges per process, so that a slow range doesn't hold up the other processes
+        range_size = max(1, -(-page_count // (self.processes * 4)))
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        ranges = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._executor, extract_page_texts, data, start, min(start + range_size, page_count)
+                )
+                for start in range(0, page_count, range_size)
+            )
+        )
+        return [page_text for page_texts in ranges for page_text in page_texts]
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            # Waiting for the worker processes to exit would block the event loop
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
 class DocumentAnalysisParser(Parser):
     """
     Concrete parser backed by Azure AI Document Intelligence that can parse many document formats into pages
@@ -107,79 +190,68 @@ class DocumentAnalysisParser(Parser):
                 )
             analyze_result: AnalyzeResult = await poller.result()
 
-            offset = 0
+            # Index the tables and figures by the page they start on, keeping their order in the result
+            tables_by_page: dict[int, list[DocumentTable]] = defaultdict(list)
+            for table in analyze_result.tables or []:
+                if table.bounding_regions:
+                    tables_by_page[table.bounding_regions[0].page_number].append(table)
+            figures_by_page: dict[int, list[DocumentFigure]] = defaultdict(list)
+            if self.process_figures:
+                for figure in analyze_result.figures or []:
+                    if figure.bounding_regions:
+                        figures_by_page[figure.bounding_regions[0].page_number].append(figure)
 
+            offset = 0
             for page in analyze_result.pages:
-                tables_on_page = [
-                    table
-                    for table in (analyze_result.tables or [])
-                    if table.bounding_regions and table.bounding_regions[0].page_number == page.page_number
-                ]
-                figures_on_page = []
-                if self.process_figures:
-                    figures_on_page = [
-                        figure
-                        for figure in (analyze_result.figures or [])
-                        if figure.bounding_regions and figure.bounding_regions[0].page_number == page.page_number
-                    ]
+                tables_on_page = tables_by_page.get(page.page_number, [])
+                figures_on_page = figures_by_page.get(page.page_number, [])
                 page_images: list[ImageOnPage] = []
                 page_tables: list[str] = []
 
-                class ObjectType(Enum):
-                    NONE = -1
-                    TABLE = 0
-                    FIGURE = 1
-
-                MaskEntry = tuple[ObjectType, Optional[int]]
-
                 page_offset = page.spans[0].offset
                 page_length = page.spans[0].length
-                mask_chars: list[MaskEntry] = [(ObjectType.NONE, None)] * page_length
-                # mark all positions of the table spans in the page
-                for table_idx, table in enumerate(tables_on_page):
-                    for span in table.spans:
-                        # replace all table spans with "table_id" in table_chars array
-                        for i in range(span.length):
-                            idx = span.offset - page_offset + i
-                            if idx >= 0 and idx < page_length:
-                                mask_chars[idx] = (ObjectType.TABLE, table_idx)
-                # mark all positions of the figure spans in the page
-                for figure_idx, figure in enumerate(figures_on_page):
-                    for span in figure.spans:
-                        # replace all figure spans with "figure_id" in figure_chars array
-                        for i in range(span.length):
-                            idx = span.offset - page_offset + i
-                            if idx >= 0 and idx < page_length:
-                                mask_chars[idx] = (ObjectType.FIGURE, figure_idx)
-
-                # build page text by replacing characters in table spans with table html
-                page_text = ""
-                added_objects: set[MaskEntry] = set()
-                for idx, mask_char in enumerate(mask_chars):
-                    object_type, object_idx = mask_char
-                    if object_type == ObjectType.NONE:
-                        page_text += analyze_result.content[page_offset + idx]
-                    elif object_type == ObjectType.TABLE:
-                        if object_idx is None:
-                            raise ValueError("Expected object_idx to be set")
-                        if mask_char not in added_objects:
+                # Objects covering overlapping spans are painted over each other, tables first and then
+                # figures, so the last object covering a character wins it, as if each character was marked
+                painted: list[tuple[int, int, ObjectEntry]] = [
+                    (span.offset - page_offset, span.offset - page_offset + span.length, (ObjectType.TABLE, table_idx))
+                    for table_idx, table in enumerate(tables_on_page)
+                    for span in table.spans
+                ]
+                painted += [
+                    (
+                        span.offset - page_offset,
+                        span.offset - page_offset + span.length,
+                        (ObjectType.FIGURE, figure_idx),
+                    )
+                    for figure_idx, figure in enumerate(figures_on_page)
+                    for span in figure.spans
+                ]
+
+                # build page text by replacing the text in table spans with table html, and in figure spans
+                # with the figure placeholder, where each object is added where its first character is
+                page_parts: list[str] = []
+                added_objects: set[ObjectEntry] = set()
+                for segment_start, segment_end, entry in DocumentAnalysisParser.paint_segments(painted, page_length):
+                    if entry is None:
+                        page_parts.append(
+                            analyze_result.content[page_offset + segment_start : page_offset + segment_end]
+                        )
+                    elif entry not in added_objects:
+                        object_type, object_idx = entry
+                        if object_type == ObjectType.TABLE:
                             table_html = DocumentAnalysisParser.table_to_html(tables_on_page[object_idx])
                             page_tables.append(table_html)
-                            page_text += table_html
-                            added_objects.add(mask_char)
-                    elif object_type == ObjectType.FIGURE:
-                        if object_idx is None:
-                            raise ValueError("Expected object_idx to be set")
-                        if mask_char not in added_objects:
+                            page_parts.append(table_html)
+                        else:
                             image_on_page = await DocumentAnalysisParser.figure_to_image(
                                 doc_for_pymupdf, figures_on_page[object_idx]
                             )
                             page_images.append(image_on_page)
-                            page_text += image_on_page.placeholder
-                            added_objects.add(mask_char)
+                            page_parts.append(image_on_page.placeholder)
+                        added_objects.add(entry)
 
                 # We remove these comments since they are not needed and skew the page numbers
-                page_text = page_text.replace("<!-- PageBreak -->", "")
+                page_text = "".join(page_parts).replace("<!-- PageBreak -->", "")
                 # We remove excess newlines at the beginning and end of the page
                 page_text = page_text.strip()
                 yield Page(
@@ -191,6 +263,39 @@ class DocumentAnalysisParser(Parser):
                 )
                 offset += len(page_text)
 
+    @staticmethod
+    def paint_segments(
+        painted: list[tuple[int, int, ObjectEntry]], length: int
+    ) -> list[tuple[int, int, Optional[ObjectEntry]]]:
+        """
+        Split [0, length) into segments owned by the last painted interval covering them, or None where
+        no interval does. Intervals are (start, end, entry) in painting order and are clipped to [0, length).
+        """
+        intervals = [
+            (max(start, 0), min(end, length), order, entry)
+            for order, (start, end, entry) in enumerate(painted)
+            if max(start, 0) < min(end, length)
+        ]
+        intervals.sort()
+        boundaries = sorted({0, length, *(start for start, *_ in intervals), *(end for _, end, *_ in intervals)})
+        segments: list[tuple[int, int, Optional[ObjectEntry]]] = []
+        # Heap of the intervals covering the current segment, the last painted one on top
+        covering: list[tuple[int, int, ObjectEntry]] = []
+        next_interval = 0
+        for segment_start, segment_end in zip(boundaries, boundaries[1:]):
+            while next_interval < len(intervals) and intervals[next_interval][0] == segment_start:
+                _, end, order, entry = intervals[next_interval]
+                heapq.heappush(covering, (-order, end, entry))
+                next_interval += 1
+            while covering and covering[0][1] <= segment_start:
+                heapq.heappop(covering)
+            entry = covering[0][2] if covering else None
+            if segments and segments[-1][2] == entry:
+                segments[-1] = (segments[-1][0], segment_end, entry)
+            else:
+                segments.append((segment_start, segment_end, entry))
+        return segments
+
     @staticmethod
     async def figure_to_image(doc: pymupdf.Document, figure: DocumentFigure) -> ImageOnPage:
         figure_title = (figure.caption and figure.caption.content) or ""
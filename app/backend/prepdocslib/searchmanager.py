@@ -1,8 +1,11 @@
 import asyncio
+import hashlib
+import json
 import logging
 import os
-from typing import Optional
+from typing import Any, Optional
 
+from azure.search.documents.aio import SearchClient
 from azure.search.documents.indexes.models import (
     AIServicesVisionParameters,
     AIServicesVisionVectorizer,
@@ -43,6 +46,7 @@ from azure.search.documents.indexes.models import (
 
 from .blobmanager import BlobManager
 from .embeddings import OpenAIEmbeddings
+from .figurecache import FigureCache
 from .listfilestrategy import File
 from .strategy import SearchInfo
 from .textsplitter import Chunk
@@ -80,6 +84,7 @@ class SearchManager:
         enforce_access_control: bool = False,
         use_web_source: bool = False,
         use_sharepoint_source: bool = False,
+        diff_update: bool = False,
     ):
         self.search_info = search_info
         self.search_analyzer_name = search_analyzer_name
@@ -92,6 +97,8 @@ class SearchManager:
         self.enforce_access_control = enforce_access_control
         self.use_web_source = use_web_source
         self.use_sharepoint_source = use_sharepoint_source
+        # Only upload the new or changed sections of a file and remove the ones that are gone from it
+        self.diff_update = diff_update
 
     async def create_index(self):
         logger.info("Checking whether search index %s exists...", self.search_info.index_name)
@@ -592,57 +599,116 @@ class SearchManager:
                     ", ".join(created_kb_names),
                 )
 
+    def create_document(self, section: Section, url: Optional[str] = None) -> dict[str, Any]:
+        image_fields = {}
+        if self.search_images:
+            image_fields = {
+                "images": [
+                    {
+                        "url": image.url,
+                        "description": image.description,
+                        "boundingbox": image.bbox,
+                        "embedding": image.embedding,
+                    }
+                    for image in section.chunk.images
+                ]
+            }
+        document = {
+            "content": section.chunk.text,
+            "category": section.category,
+            "sourcepage": BlobManager.sourcepage_from_file_page(
+                filename=section.content.filename(), page=section.chunk.page_num
+            ),
+            "sourcefile": section.content.filename(),
+            **image_fields,
+            **section.content.acls,
+        }
+        if url:
+            document["storageUrl"] = url
+        return document
+
+    def content_hash(self, section: Section) -> str:
+        """
+        Hash of the inputs of a section: its text, source, category and ACLs, its images and the embedding model.
+        Values derived from them, like image descriptions, image embeddings and storage URLs, are left out,
+        as they can change between runs without the content changing.
+        """
+        fingerprint = self.create_document(section)
+        if self.search_images:
+            fingerprint["images"] = [FigureCache.image_hash(image.bytes) for image in section.chunk.images]
+        if self.embeddings:
+            fingerprint["embedding_model"] = [
+                self.embeddings.open_ai_model_name,
+                self.embedding_dimensions,
+                self.field_name_embedding,
+            ]
+        return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+    async def get_existing_ids(self, search_client: SearchClient, files: dict[str, str]) -> set[str]:
+        """Return the ids of the documents in the index for the given files, mapped from filename to id prefix"""
+        existing_ids = set()
+        for filename, id_prefix in files.items():
+            # Other files with the same name, such as files uploaded by other users, have a different id prefix
+            filter = "sourcefile eq '{}'".format(filename.replace("'", "''"))
+            results = await search_client.search(search_text="", filter=filter, select=["id"])
+            async for document in results:
+                if document["id"].startswith(f"{id_prefix}-"):
+                    existing_ids.add(document["id"])
+        return existing_ids
+
     async def update_content(self, sections: list[Section], url: Optional[str] = None):
         MAX_BATCH_SIZE = 1000
-        section_batches = [sections[i : i + MAX_BATCH_SIZE] for i in range(0, len(sections), MAX_BATCH_SIZE)]
+
+        # The id of a section is the hash of its content, plus its ordinal among the sections of the file
+        # with the same hash, so that sections keep their id when other sections are added or removed
+        documents = []
+        ordinals: dict[str, int] = {}
+        for section in sections:
+            document = self.create_document(section, url)
+            hash_id = f"{section.content.filename_to_id()}-{self.content_hash(section)}"
+            ordinals[hash_id] = ordinals.get(hash_id, -1) + 1
+            documents.append({"id": f"{hash_id}-{ordinals[hash_id]}", **document})
 
         async with self.search_info.create_search_client() as search_client:
-            for batch_index, batch in enumerate(section_batches):
-                documents = []
-                for section_index, section in enumerate(batch):
-                    image_fields = {}
-                    if self.search_images:
-                        image_fields = {
-                            "images": [
-                                {
-                                    "url": image.url,
-                                    "description": image.description,
-                                    "boundingbox": image.bbox,
-                                    "embedding": image.embedding,
-                                }
-                                for image in section.chunk.images
-                            ]
-                        }
-                    document = {
-                        "id": f"{section.content.filename_to_id()}-page-{section_index + batch_index * MAX_BATCH_SIZE}",
-                        "content": section.chunk.text,
-                        "category": section.category,
-                        "sourcepage": BlobManager.sourcepage_from_file_page(
-                            filename=section.content.filename(), page=section.chunk.page_num
-                        ),
-                        "sourcefile": section.content.filename(),
-                        **image_fields,
-                        **section.content.acls,
-                    }
-                    documents.append(document)
-                if url:
-                    for document in documents:
-                        document["storageUrl"] = url
+            removed_ids: list[str] = []
+            if self.diff_update:
+                existing_ids = await self.get_existing_ids(
+                    search_client,
+                    {section.content.filename(): section.content.filename_to_id() for section in sections},
+                )
+                current_ids = {document["id"] for document in documents}
+                removed_ids = sorted(existing_ids - current_ids)
+                documents = [document for document in documents if document["id"] not in existing_ids]
+                logger.info(
+                    "Skipping %d unchanged sections, uploading %d new or changed sections, removing %d sections",
+                    len(current_ids) - len(documents),
+                    len(documents),
+                    len(removed_ids),
+                )
+
+            document_batches = [documents[i : i + MAX_BATCH_SIZE] for i in range(0, len(documents), MAX_BATCH_SIZE)]
+            for batch_index, batch in enumerate(document_batches):
                 if self.embeddings:
                     if self.field_name_embedding is None:
                         raise ValueError("Embedding field name must be set")
                     embeddings = await self.embeddings.create_embeddings(
-                        texts=[section.chunk.text for section in batch]
+                        texts=[document["content"] for document in batch]
                     )
-                    for i, document in enumerate(documents):
+                    for i, document in enumerate(batch):
                         document[self.field_name_embedding] = embeddings[i]
                 logger.info(
                     "Uploading batch %d with %d sections to search index '%s'",
                     batch_index + 1,
-                    len(documents),
+                    len(batch),
                     self.search_info.index_name,
                 )
-                await search_client.upload_documents(documents)
+                await search_client.upload_documents(batch)
+
+            # Sections are only removed once their replacements are uploaded
+            for i in range(0, len(removed_ids), MAX_BATCH_SIZE):
+                await search_client.delete_documents(
+                    [{"id": removed_id} for removed_id in removed_ids[i : i + MAX_BATCH_SIZE]]
+                )
 
     async def remove_content(self, path: Optional[str] = None, only_oid: Optional[str] = None):
         logger.info(
@@ -64,3 +64,6 @@ class Strategy(ABC):
 
     async def run(self):
         raise NotImplementedError
+
+    async def close(self):
+        """Close the clients opened by the strategy, once it has run"""
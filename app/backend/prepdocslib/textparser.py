@@ -24,6 +24,8 @@ def cleanup_data(data: str) -> str:
 class TextParser(Parser):
     """Parses simple text into a Page object."""
 
+    cpu_bound = True
+
     async def parse(self, content: IO) -> AsyncGenerator[Page, None]:
         data = content.read()
         decoded_data = data.decode("utf-8")
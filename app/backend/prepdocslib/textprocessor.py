@@ -4,7 +4,7 @@ import logging
 
 from .figureprocessor import build_figure_markup
 from .listfilestrategy import File
-from .page import Page
+from .page import Chunk, Page
 from .searchmanager import Section
 from .textsplitter import TextSplitter
 
@@ -40,9 +40,17 @@ def process_text(
 
     # Step 2: Split combined text into chunks
     logger.info("Splitting '%s' into sections", file.filename())
-    sections = [Section(chunk, content=file, category=category) for chunk in splitter.split_pages(pages)]
+    return build_sections(list(splitter.split_pages(pages)), pages, file, category)
 
-    # Step 3: Add images back to each section based on page number
+
+def build_sections(
+    chunks: list["Chunk"],
+    pages: list["Page"],
+    file: "File",
+    category: str | None = None,
+) -> list["Section"]:
+    """Wrap the chunks split from the pages into sections, with the images of the page each chunk starts on."""
+    sections = [Section(chunk, content=file, category=category) for chunk in chunks]
     for section in sections:
         section.chunk.images = [
             image for page in pages if page.page_num == section.chunk.page_num for image in page.images
@@ -1,10 +1,13 @@
+import functools
 import logging
 import re
 from abc import ABC
-from collections.abc import Generator
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Generator
 from dataclasses import dataclass, field
 from typing import Optional
 
+import regex
 import tiktoken
 
 from .page import Chunk, Page
@@ -84,6 +87,119 @@ bpe = tiktoken.encoding_for_model(ENCODING_MODEL)
 DEFAULT_OVERLAP_PERCENT = 10  # See semantic search article for 10% overlap performance
 DEFAULT_SECTION_LENGTH = 1000  # Roughly 400-500 tokens for English
 
+# Pre-tokenization pattern of the encoding, BPE then encodes each piece it matches independently.
+# The pattern and the piece encoder are private to tiktoken, without them substrings are encoded directly.
+_pretokenizer: Optional[regex.Pattern] = (
+    regex.compile(bpe._pat_str) if hasattr(bpe, "_pat_str") and hasattr(bpe, "_encode_single_piece") else None
+)
+
+
+@functools.lru_cache(maxsize=65536)
+def _piece_token_count(piece: str) -> int:
+    return len(bpe._encode_single_piece(piece))
+
+
+def _char_class(chars: list[str]) -> re.Pattern:
+    return re.compile("[" + "".join(re.escape(ch) for ch in chars) + "]")
+
+
+class _TokenOffsets:
+    """Exact token counts of any substring of a text, which is pre-tokenized only once.
+
+    The encoder splits a text into pieces with a regex and encodes every piece on its own, so a substring
+    has the tokens of the pieces it contains, except near its ends: a cut inside a piece changes how the
+    text around the cut is split. Those few pieces are matched again, the others come from prefix sums.
+    """
+
+    # Matching a piece can look ahead through a whitespace run, which spans at most 3 pieces
+    LOOKAHEAD_PIECES = 4
+
+    def __init__(self, text: str, token_count: int):
+        self.text = text
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.prefix: list[int] = [0]
+        if _pretokenizer is None:
+            self.piece_at: dict[int, int] = {}
+            self.exact = False
+            return
+        for match in _pretokenizer.finditer(text):
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+            self.prefix.append(self.prefix[-1] + _piece_token_count(match.group()))
+        self.piece_at = {start: index for index, start in enumerate(self.starts)}
+        # The regex engine of the encoder may classify some characters differently, in which case the
+        # substrings are encoded directly to keep the counts exact
+        self.exact = self.prefix[-1] == token_count
+
+    def count(self, start: int, end: int) -> int:
+        if not self.exact:
+            return len(bpe.encode(self.text[start:end]))
+        count = 0
+        index = self.piece_at.get(start)
+        if index is None:
+            # Match from the cut until the pieces line up with the pieces of the whole text
+            for match in _pretokenizer.finditer(self.text, start, end):
+                count += _piece_token_count(match.group())
+                index = self.piece_at.get(match.end())
+                if index is not None:
+                    break
+            else:
+                return count
+        position = self.starts[index] if index < len(self.starts) else end
+        last = len(self.ends) if end == len(self.text) else bisect_right(self.ends, end) - self.LOOKAHEAD_PIECES
+        if last > index:
+            count += self.prefix[last] - self.prefix[index]
+            position = self.starts[last] if last < len(self.starts) else end
+        for match in _pretokenizer.finditer(self.text, position, end):
+            count += _piece_token_count(match.group())
+        return count
+
+    def _stable_pieces(self, end: int) -> int:
+        """Number of leading pieces matched the same way in any text that starts with text[:end]"""
+        return max(0, bisect_right(self.ends, end) - self.LOOKAHEAD_PIECES) if self.exact else 0
+
+    def lower_bound(self, end: int) -> int:
+        """A lower bound of the token count of any text that starts with text[:end], non-decreasing in end"""
+        return self.prefix[self._stable_pieces(end)]
+
+    def count_joined(self, end: int, following: "_TokenOffsets") -> int:
+        """Exact token count of text[:end] + following.text"""
+        if not (self.exact and following.exact):
+            return len(bpe.encode(self.text[:end] + following.text))
+        stable = self._stable_pieces(end)
+        count = self.prefix[stable]
+        head = self.text[self.starts[stable] if stable < len(self.starts) else end : end]
+        # Match across the junction until the pieces line up with the pieces of the following text
+        for match in _pretokenizer.finditer(head + following.text):
+            if match.start() >= len(head):
+                index = following.piece_at.get(match.start() - len(head))
+                if index is not None:
+                    return count + following.prefix[-1] - following.prefix[index]
+            count += _piece_token_count(match.group())
+        return count
+
+
+def _first_fit(lengths: list[int], too_long: Callable[[int], bool], fits: Callable[[int], bool]) -> int:
+    """Return the first of the decreasing candidate lengths that fits, or 0 when none does.
+
+    too_long must only reject lengths that don't fit, and reject every length above any length it
+    rejects, so the lengths it rejects are skipped with a binary search before the others are tried in order.
+    """
+    low, high = 0, len(lengths)
+    while low < high:
+        mid = (low + high) // 2
+        if too_long(lengths[mid]):
+            low = mid + 1
+        else:
+            high = mid
+    for length in lengths[low:]:
+        if not length:
+            break
+        if fits(length):
+            return length
+    return 0
+
 
 def _safe_concat(a: str, b: str) -> str:
     """Concatenate two non-empty segments, inserting a space only when both sides
@@ -142,6 +258,7 @@ class _ChunkBuilder:
     Notes:
     - Character limit is soft (exact enforcement + later normalization); token limit is hard.
     - Token counts are computed by the caller and passed to `add`; this class stays agnostic of the encoder.
+    - Character and token lengths are kept as running totals, so checking a span is O(1).
     """
 
     page_num: int
@@ -149,24 +266,25 @@ class _ChunkBuilder:
     max_tokens: int
     parts: list[str] = field(default_factory=list)
     token_len: int = 0
+    char_len: int = 0
 
     def can_fit(self, text: str, token_count: int) -> bool:
         if not self.parts:  # always allow first span
             return token_count <= self.max_tokens and len(text) <= self.max_chars
         # Character + token constraints
-        return (len("".join(self.parts)) + len(text) <= self.max_chars) and (
-            self.token_len + token_count <= self.max_tokens
-        )
+        return (self.char_len + len(text) <= self.max_chars) and (self.token_len + token_count <= self.max_tokens)
 
     def add(self, text: str, token_count: int) -> bool:
         if not self.can_fit(text, token_count):
             return False
         self.parts.append(text)
         self.token_len += token_count
+        self.char_len += len(text)
         return True
 
     def force_append(self, text: str):
         self.parts.append(text)
+        self.char_len += len(text)
 
     def flush_into(self, out: list[Chunk]):
         if self.parts:
@@ -175,6 +293,7 @@ class _ChunkBuilder:
                 out.append(Chunk(page_num=self.page_num, text=chunk))
         self.parts.clear()
         self.token_len = 0
+        self.char_len = 0
 
     # Convenience helpers for readability at call sites
     def has_content(self) -> bool:
@@ -194,6 +313,8 @@ class SentenceTextSplitter(TextSplitter):
     def __init__(self, max_tokens_per_section: int = 500):
         self.sentence_endings = STANDARD_SENTENCE_ENDINGS + CJK_SENTENCE_ENDINGS
         self.word_breaks = STANDARD_WORD_BREAKS + CJK_WORD_BREAKS
+        self._sentence_ending_pattern = _char_class(self.sentence_endings)
+        self._word_break_pattern = _char_class(self.word_breaks)
         self.max_section_length = DEFAULT_SECTION_LENGTH
         self.sentence_search_limit = 100
         self.max_tokens_per_section = max_tokens_per_section
@@ -203,43 +324,35 @@ class SentenceTextSplitter(TextSplitter):
         # - Across page boundary ONLY if semantic continuation heuristics pass.
         self.semantic_overlap_percent = 10
 
-    def _find_split_pos(self, text: str) -> tuple[int, bool]:
-        """Find a good split position near midpoint.
+    def _find_split_pos(self, split_points: tuple[list[int], list[int]], start: int, end: int) -> tuple[int, bool]:
+        """Find a good split position near the midpoint of text[start:end].
 
-        Returns (index, use_overlap_fallback).
+        Returns (index relative to start, use_overlap_fallback).
 
         Priority:
-        1. Sentence-ending punctuation near midpoint (scan outward within central third).
-        2. Word-break character near midpoint (space / punctuation) within same window.
+        1. Sentence-ending punctuation nearest to the midpoint, within the central third.
+        2. Word-break character nearest to the midpoint (space / punctuation) within same window.
         3. Fallback: caller should use midpoint + overlap strategy.
+
+        split_points holds the sorted positions of sentence endings and of word breaks in the text,
+        so the nearest ones are found by bisection. On a tie the left one wins.
         """
-        length = len(text)
+        length = end - start
         if length < 4:
             return -1, True
-        mid = length // 2
-        window_limit = length // 3  # defines central region scan boundary
-
-        # 1. Sentence endings
-        pos = 0
-        while mid - pos > window_limit:
-            left = mid - pos
-            right = mid + pos
-            if left >= 0 and text[left] in self.sentence_endings:
-                return left, False
-            if right < length and text[right] in self.sentence_endings:
-                return right, False
-            pos += 1
-
-        # 2. Word breaks
-        pos = 0
-        while mid - pos > window_limit:
-            left = mid - pos
-            right = mid + pos
-            if left >= 0 and text[left] in self.word_breaks:
-                return left, False
-            if right < length and text[right] in self.word_breaks:
-                return right, False
-            pos += 1
+        mid = start + length // 2
+        reach = length // 2 - length // 3  # distance from the midpoint to the central region boundary
+        for positions in split_points:
+            left_index = bisect_right(positions, mid) - 1
+            left = positions[left_index] if left_index >= 0 and mid - positions[left_index] < reach else None
+            right_index = bisect_left(positions, mid)
+            right = None
+            if right_index < len(positions) and positions[right_index] - mid < reach and positions[right_index] < end:
+                right = positions[right_index]
+            if left is not None and (right is None or mid - left <= right - mid):
+                return left - start, False
+            if right is not None:
+                return right - start, False
 
         # 3. Fallback
         return -1, True
@@ -251,24 +364,45 @@ class SentenceTextSplitter(TextSplitter):
         1. Sentence-ending punctuation near midpoint.
         2. Word-break character near midpoint (space/punctuation) to avoid mid-word cuts.
         3. Midpoint split with symmetric overlap (DEFAULT_OVERLAP_PERCENT).
+
+        The text is encoded once: the token counts of the halves come from its token offsets and the
+        split points from the precomputed positions of sentence endings and word breaks.
         """
-        tokens = bpe.encode(text)
-        if len(tokens) <= self.max_tokens_per_section:
+        token_count = len(bpe.encode(text))
+        if token_count <= self.max_tokens_per_section:
             yield Chunk(page_num=page_num, text=text)
             return
 
-        split_pos, use_overlap = self._find_split_pos(text)
+        tokens = _TokenOffsets(text, token_count)
+        split_points = (
+            [match.start() for match in self._sentence_ending_pattern.finditer(text)],
+            [match.start() for match in self._word_break_pattern.finditer(text)],
+        )
+        yield from self._split_range(page_num, tokens, split_points, 0, len(text))
+
+    def _split_range(
+        self,
+        page_num: int,
+        tokens: _TokenOffsets,
+        split_points: tuple[list[int], list[int]],
+        start: int,
+        end: int,
+    ) -> Generator[Chunk, None, None]:
+        if tokens.count(start, end) <= self.max_tokens_per_section:
+            yield Chunk(page_num=page_num, text=tokens.text[start:end])
+            return
+
+        split_pos, use_overlap = self._find_split_pos(split_points, start, end)
         if not use_overlap and split_pos > 0:
-            first_half = text[: split_pos + 1]
-            second_half = text[split_pos + 1 :]
+            first_end = second_start = start + split_pos + 1
         else:
-            middle = len(text) // 2
-            overlap = int(len(text) * (DEFAULT_OVERLAP_PERCENT / 100))
-            first_half = text[: middle + overlap]
-            second_half = text[middle - overlap :]
+            middle = (end - start) // 2
+            overlap = int((end - start) * (DEFAULT_OVERLAP_PERCENT / 100))
+            first_end = start + middle + overlap
+            second_start = start + middle - overlap
 
-        yield from self.split_page_by_max_tokens(page_num, first_half)
-        yield from self.split_page_by_max_tokens(page_num, second_half)
+        yield from self._split_range(page_num, tokens, split_points, start, first_end)
+        yield from self._split_range(page_num, tokens, split_points, second_start, end)
 
     def _is_heading_like(self, line: str) -> bool:
         """Heuristic heading detector used to suppress cross-page semantic overlap when a new section starts."""
@@ -357,26 +491,39 @@ class SentenceTextSplitter(TextSplitter):
 
         candidate = prev_chunk.text + prefix
         max_chars = int(self.max_section_length * 1.2)
-        if len(candidate) > max_chars or len(bpe.encode(candidate)) > self.max_tokens_per_section:
-            # Attempt to shrink prefix at word / sentence boundaries from its start
-            shrink = prefix
-            while shrink and (
-                len(prev_chunk.text + shrink) > max_chars
-                or len(bpe.encode(prev_chunk.text + shrink)) > self.max_tokens_per_section
-            ):
-                cut_index = 1
-                for i, ch in enumerate(shrink):
-                    if ch in self.word_breaks or ch in self.sentence_endings:
-                        cut_index = i + 1
-                        break
-                shrink = shrink[:-cut_index] if cut_index < len(shrink) else ""
-            if not shrink:
-                return prev_chunk
-            candidate = prev_chunk.text + shrink
-            if len(candidate) > max_chars or len(bpe.encode(candidate)) > self.max_tokens_per_section:
+        candidate_tokens = len(bpe.encode(candidate))
+        if len(candidate) > max_chars or candidate_tokens > self.max_tokens_per_section:
+            # Attempt to shrink prefix at word / sentence boundaries from its start. Every shrunk candidate
+            # is a prefix of the full one, so its token count comes from the offsets of the full candidate.
+            tokens = _TokenOffsets(candidate, candidate_tokens)
+            prev_len = len(prev_chunk.text)
+            shrink_len = _first_fit(
+                self._overlap_shrink_lengths(prefix),
+                too_long=lambda n: prev_len + n > max_chars
+                or tokens.lower_bound(prev_len + n) > self.max_tokens_per_section,
+                fits=lambda n: tokens.count(0, prev_len + n) <= self.max_tokens_per_section,
+            )
+            if not shrink_len:
                 return prev_chunk
+            candidate = candidate[: prev_len + shrink_len]
         return Chunk(page_num=prev_chunk.page_num, text=candidate)
 
+    def _overlap_shrink_lengths(self, prefix: str) -> list[int]:
+        """Lengths an overlap prefix is shrunk to, longest first and ending with 0.
+
+        Each step cuts as many characters from the end as the prefix has up to and including its first
+        word break or sentence ending, or a single character once that boundary has been cut off.
+        """
+        first_break = next(
+            (i for i, ch in enumerate(prefix) if ch in self.word_breaks or ch in self.sentence_endings), None
+        )
+        lengths = [len(prefix)]
+        while lengths[-1]:
+            length = lengths[-1]
+            cut = first_break + 1 if first_break is not None and first_break < length else 1
+            lengths.append(length - cut if cut < length else 0)
+        return lengths
+
     def split_pages(self, pages: list[Page]) -> Generator[Chunk, None, None]:
         """Split each page into semantic chunks using token-aware accumulation with atomic figures.
 
@@ -428,16 +575,14 @@ class SentenceTextSplitter(TextSplitter):
                             page_chunks.append(Chunk(page_num=page.page_num, text=btext))
                     continue
 
-                # Process text block: split into sentence-like spans
+                # Process text block: split into sentence-like spans, each ending with its punctuation
                 spans: list[str] = []
-                current_chars: list[str] = []
-                for ch in btext:
-                    current_chars.append(ch)
-                    if ch in self.sentence_endings:
-                        spans.append("".join(current_chars))
-                        current_chars = []
-                if current_chars:  # remaining tail
-                    spans.append("".join(current_chars))
+                span_start = 0
+                for match in self._sentence_ending_pattern.finditer(btext):
+                    spans.append(btext[span_start : match.end()])
+                    span_start = match.end()
+                if span_start < len(btext):  # remaining tail
+                    spans.append(btext[span_start:])
 
                 for span in spans:
                     span_tokens = len(bpe.encode(span))
@@ -503,17 +648,23 @@ class SentenceTextSplitter(TextSplitter):
                             move_fragment = fragment_full
                             if not fits(move_fragment):
                                 # Hard trim path: fragment begins after the last sentence-ending punctuation
-                                # of the previous chunk. Reduce to remaining character budget, then iteratively
-                                # shrink until token constraints are satisfied.
+                                # of the previous chunk. Reduce to remaining character budget, then shrink by
+                                # 50 characters (1 below 50) until token constraints are satisfied.
                                 remaining_chars = max_chars - len(first_new_text)  # always > 0 given builder invariants
                                 move_fragment = move_fragment[:remaining_chars]
-                                while (
-                                    move_fragment
-                                    and len(bpe.encode(move_fragment + first_new_text)) > self.max_tokens_per_section
-                                ):
-                                    move_fragment = (
-                                        move_fragment[:-50] if len(move_fragment) > 50 else move_fragment[:-1]
+                                fragment_tokens = _TokenOffsets(move_fragment, len(bpe.encode(move_fragment)))
+                                first_new_tokens = _TokenOffsets(first_new_text, len(bpe.encode(first_new_text)))
+                                lengths = [len(move_fragment)]
+                                while lengths[-1]:
+                                    lengths.append(lengths[-1] - 50 if lengths[-1] > 50 else lengths[-1] - 1)
+                                move_fragment = move_fragment[
+                                    : _first_fit(
+                                        lengths,
+                                        too_long=lambda n: fragment_tokens.lower_bound(n) > self.max_tokens_per_section,
+                                        fits=lambda n: fragment_tokens.count_joined(n, first_new_tokens)
+                                        <= self.max_tokens_per_section,
                                     )
+                                ]
                             leftover_fragment = fragment_full[len(move_fragment) :]
                             # Prepend the allowed fragment
                             if move_fragment:
@@ -6,6 +6,7 @@ from .vertex_ai_service import VertexAIService
 from .storage_service import StorageService
 from .agent_service import AgentService
 from .document_service import DocumentService
+from .content_service import ContentService
 from .chat_service import ChatService
 
 __all__ = [
@@ -14,5 +15,6 @@ __all__ = [
     "StorageService",
     "AgentService",
     "DocumentService",
+    "ContentService",
     "ChatService",
 ]
@@ -1,12 +1,14 @@
 """Agent service for multi-tenant management"""
+import asyncio
 import logging
 import uuid
-from datetime import datetime
-from firebase_admin import firestore
-from models.agent import Agent, AgentCreate, AgentUpdate, AgentStatus, AgentSettings
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from models.agent import Agent, AgentCreate, AgentUpdate, AgentStatus
 from services.storage_service import StorageService
 from services.vertex_ai_service import VertexAIService
 from core.config import get_settings
+from core.metrics import track_firestore
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -17,8 +19,11 @@ class AgentService:
 
     def __init__(self):
         self.firestore_client = None
+        self._firestore = None
         self.storage_service = None
         self.vertex_service = None
+        self._sync_firestore_client = None
+        self._teardown_tasks: dict[str, asyncio.Task] = {}
         self._initialized = False
 
     def _ensure_initialized(self):
@@ -26,6 +31,9 @@ class AgentService:
         if self._initialized:
             return
         try:
+            # Imported here so the Firestore SDK is not loaded at startup
+            from firebase_admin import firestore
+            self._firestore = firestore
             self.firestore_client = firestore.AsyncClient()
             self.storage_service = StorageService()
             self.vertex_service = VertexAIService()
@@ -41,63 +49,216 @@ class AgentService:
         bucket_name = f"{settings.GCP_PROJECT_ID}-agent-{agent_id}"
 
         # Create GCS bucket
-        self.storage_service.create_bucket(bucket_name)
+        await self.storage_service.create_bucket(bucket_name)
 
         # Create RAG corpus
         corpus_id = await self.vertex_service.create_rag_corpus(agent_id, agent_create.name)
 
         # Create agent in Firestore
+        now = datetime.utcnow()
+        agent = Agent(
+            id=agent_id,
+            name=agent_create.name,
+            description=agent_create.description,
+            created_by=created_by,
+            created_at=now,
+            updated_at=now,
+            bucket_name=bucket_name,
+            corpus_id=corpus_id,
+        )
+        # The timestamps are set by Firestore, the returned agent uses the local time
         agent_data = {
-            "id": agent_id,
-            "name": agent_create.name,
-            "description": agent_create.description,
-            "createdBy": created_by,
-            "createdAt": firestore.SERVER_TIMESTAMP,
-            "updatedAt": firestore.SERVER_TIMESTAMP,
-            "bucketName": bucket_name,
-            "corpusId": corpus_id,
-            "dataStoreId": None,
-            "status": AgentStatus.ACTIVE.value,
-            "settings": AgentSettings().dict(),
-            "documentCount": 0
+            **agent.to_firestore(),
+            "createdAt": self._firestore.SERVER_TIMESTAMP,
+            "updatedAt": self._firestore.SERVER_TIMESTAMP,
         }
 
         await self.firestore_client.collection("agents").document(agent_id).set(agent_data)
 
-        return Agent(**agent_data, created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+        return agent
 
     async def get_agent(self, agent_id: str) -> Agent:
         """Get agent by ID"""
         self._ensure_initialized()
-        doc = await self.firestore_client.collection("agents").document(agent_id).get()
+        with track_firestore("get_agent"):
+            doc = await self.firestore_client.collection("agents").document(agent_id).get()
         if not doc.exists:
             raise ValueError(f"Agent {agent_id} not found")
-        return Agent(**doc.to_dict())
+        return Agent.from_firestore(doc.to_dict())
 
     async def list_agents(self) -> list[Agent]:
         """List all agents"""
         self._ensure_initialized()
         agents = []
-        async for doc in self.firestore_client.collection("agents").stream():
-            agents.append(Agent(**doc.to_dict()))
+        with track_firestore("list_agents"):
+            async for doc in self.firestore_client.collection("agents").stream():
+                agents.append(Agent.from_firestore(doc.to_dict()))
         return agents
 
     async def update_agent(self, agent_id: str, agent_update: AgentUpdate) -> Agent:
         """Update agent"""
         self._ensure_initialized()
         update_data = agent_update.dict(exclude_none=True)
-        update_data["updatedAt"] = firestore.SERVER_TIMESTAMP
+        update_data["updatedAt"] = self._firestore.SERVER_TIMESTAMP
 
         await self.firestore_client.collection("agents").document(agent_id).update(update_data)
         return await self.get_agent(agent_id)
 
-    async def delete_agent(self, agent_id: str):
-        """Delete agent and all resources"""
+    async def delete_agent(self, agent_id: str) -> dict:
+        """Start background teardown of agent and all resources"""
         self._ensure_initialized()
+        job_ref = self.firestore_client.collection("agentTeardowns").document(agent_id)
+        doc = await job_ref.get()
+        if doc.exists:
+            # Deleting again must not reset the progress of a job, nor start a second one
+            existing = doc.to_dict()
+            if existing["status"] == "completed" or self._teardown_running(existing):
+                return existing
+
         agent = await self.get_agent(agent_id)
+        # The job keeps what the teardown needs, so it can be retried once the agent is deleted
+        job = {
+            "agentId": agent_id,
+            "bucketName": agent.bucket_name,
+            "corpusId": agent.corpus_id,
+            "status": "running",
+            "objectsDeleted": 0,
+            "bucketDeleted": False,
+            "corpusDeleted": False,
+            "documentsDeleted": 0,
+            "conversationsDeleted": 0,
+            "error": None,
+        }
+        await job_ref.set({
+            **job,
+            "startedAt": self._firestore.SERVER_TIMESTAMP,
+            "updatedAt": self._firestore.SERVER_TIMESTAMP,
+        })
+        await self.firestore_client.collection("agents").document(agent_id).update({
+            "status": AgentStatus.DELETING.value,
+            "updatedAt": self._firestore.SERVER_TIMESTAMP,
+        })
+
+        self._start_teardown(job, job_ref)
+        return job
+
+    async def retry_teardown(self, agent_id: str) -> dict:
+        """
+        Restart a failed teardown job, or a running one that stopped reporting progress,
+        as when the instance running it was stopped. Every step can be run again.
+        """
+        self._ensure_initialized()
+        job_ref = self.firestore_client.collection("agentTeardowns").document(agent_id)
+        doc = await job_ref.get()
+        if not doc.exists:
+            raise ValueError(f"No teardown job for agent {agent_id}")
+        job = doc.to_dict()
+        if job["status"] == "completed" or self._teardown_running(job):
+            return job
+
+        if "bucketName" not in job:
+            # Jobs started before the job kept the agent's resources
+            agent = await self.get_agent(agent_id)
+            job.update({"bucketName": agent.bucket_name, "corpusId": agent.corpus_id})
+        job.update({"status": "running", "error": None})
+        await self._update_job(job_ref, {
+            "bucketName": job["bucketName"],
+            "corpusId": job["corpusId"],
+            "status": "running",
+            "error": None,
+        })
+        logger.info(f"Agent {agent_id} teardown restarted")
+        self._start_teardown(job, job_ref)
+        return job
+
+    async def get_teardown_status(self, agent_id: str) -> dict:
+        """Get progress of an agent teardown job"""
+        self._ensure_initialized()
+        doc = await self.firestore_client.collection("agentTeardowns").document(agent_id).get()
+        if not doc.exists:
+            raise ValueError(f"No teardown job for agent {agent_id}")
+        return doc.to_dict()
+
+    def _start_teardown(self, job: dict, job_ref):
+        agent_id = job["agentId"]
+        # Keep a reference so the task is not garbage collected before it finishes
+        task = asyncio.create_task(self._teardown_agent(job, job_ref))
+        self._teardown_tasks[agent_id] = task
+        task.add_done_callback(lambda _: self._forget_teardown(agent_id, task))
 
-        # Delete bucket
-        self.storage_service.delete_bucket(agent.bucket_name, force=True)
+    def _forget_teardown(self, agent_id: str, task: asyncio.Task):
+        # A retry may have started another task for the agent in the meantime
+        if self._teardown_tasks.get(agent_id) is task:
+            del self._teardown_tasks[agent_id]
+
+    def _teardown_running(self, job: dict) -> bool:
+        """Whether a teardown job is running, on this instance or on another one that still reports progress"""
+        if job["agentId"] in self._teardown_tasks:
+            return True
+        updated_at: Optional[datetime] = job.get("updatedAt")
+        return (
+            job["status"] == "running"
+            and updated_at is not None
+            and datetime.now(timezone.utc) - updated_at < timedelta(seconds=settings.TEARDOWN_STALE_SECONDS)
+        )
+
+    async def _update_job(self, job_ref, fields: dict):
+        """Update a teardown job, its update time tells whether it is still running"""
+        await job_ref.update({**fields, "updatedAt": self._firestore.SERVER_TIMESTAMP})
+
+    async def _teardown_agent(self, job: dict, job_ref):
+        """Delete bucket objects, RAG corpus and Firestore data of an agent, reporting progress"""
+        from google.api_core.exceptions import NotFound
+
+        agent_id, bucket_name, corpus_id = job["agentId"], job["bucketName"], job["corpusId"]
+        agent_ref = self.firestore_client.collection("agents").document(agent_id)
+        try:
+            # Delete bucket objects in batches, then the empty bucket
+            # The counts of a restarted job add to those of the previous attempts
+            objects_deleted = job["objectsDeleted"]
+            try:
+                async for count in self.storage_service.delete_all_files(bucket_name):
+                    objects_deleted += count
+                    await self._update_job(job_ref, {"objectsDeleted": objects_deleted})
+                await self.storage_service.delete_bucket(bucket_name, force=False)
+            except NotFound:
+                logger.warning(f"Bucket {bucket_name} already deleted")
+            await self._update_job(job_ref, {"bucketDeleted": True})
+
+            # Delete RAG corpus
+            if corpus_id and corpus_id != f"mock-corpus-{agent_id}":
+                try:
+                    await self.vertex_service.delete_rag_corpus(corpus_id)
+                except NotFound:
+                    logger.warning(f"RAG corpus {corpus_id} already deleted")
+            await self._update_job(job_ref, {"corpusDeleted": True})
+
+            # Recursively delete subcollections with the Firestore BulkWriter
+            for subcollection in ("documents", "conversations"):
+                deleted = await self._recursive_delete(f"agents/{agent_id}/{subcollection}")
+                field = f"{subcollection}Deleted"
+                await self._update_job(job_ref, {field: job[field] + deleted})
+
+            await agent_ref.delete()
+            await self._update_job(job_ref, {
+                "status": "completed",
+                "completedAt": self._firestore.SERVER_TIMESTAMP,
+            })
+            logger.info(f"Agent {agent_id} teardown completed")
+
+        except Exception as e:
+            logger.error(f"Agent {agent_id} teardown failed: {e}")
+            await self._update_job(job_ref, {"status": "failed", "error": str(e)})
+            try:
+                await agent_ref.update({"status": AgentStatus.ERROR.value})
+            except NotFound:
+                # The agent was already deleted, only the job remains to be retried
+                pass
 
-        # Delete from Firestore
-        await self.firestore_client.collection("agents").document(agent_id).delete()
+    async def _recursive_delete(self, collection_path: str) -> int:
+        """Delete a collection and all nested subcollections, returning the number of documents deleted"""
+        # BulkWriter blocks while flushing, so drive it from a worker thread with the sync client
+        if self._sync_firestore_client is None:
+            self._sync_firestore_client = self._firestore.Client()
+        collection_ref = self._sync_firestore_client.collection(collection_path)
+        return await asyncio.to_thread(self._sync_firestore_client.recursive_delete, collection_ref)
@@ -5,12 +5,9 @@ import logging
 from typing import Optional
 from datetime import datetime
 
-import firebase_admin
-from firebase_admin import auth, credentials, firestore
-from google.cloud.firestore_v1 import AsyncClient
-
 from models.user import User, UserCreate, UserRole
 from core.config import get_settings
+from core.metrics import track_firestore
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -22,6 +19,8 @@ class AuthenticationService:
     def __init__(self):
         """Initialize Firebase Admin SDK"""
         self.firestore_client = None
+        self._auth = None
+        self._firestore = None
         self._initialized = False
 
     def _ensure_initialized(self):
@@ -29,9 +28,15 @@ class AuthenticationService:
         if self._initialized:
             return
         try:
+            # Imported here so the Firebase SDK is not loaded at startup
+            import firebase_admin
+            from firebase_admin import auth, firestore
+
             if not firebase_admin._apps:
                 # Initialize with default credentials in Cloud Run
                 firebase_admin.initialize_app()
+            self._auth = auth
+            self._firestore = firestore
             self.firestore_client = firestore.AsyncClient()
             self._initialized = True
             logger.info("Firebase initialized successfully")
@@ -54,7 +59,7 @@ class AuthenticationService:
         """
         self._ensure_initialized()
         try:
-            decoded = auth.verify_id_token(token)
+            decoded = self._auth.verify_id_token(token)
             return {
                 "uid": decoded["uid"],
                 "email": decoded.get("email"),
@@ -81,11 +86,13 @@ class AuthenticationService:
         self._ensure_initialized()
         # Check if user exists
         user_ref = self.firestore_client.collection("users").document(firebase_uid)
-        user_doc = await user_ref.get()
+        with track_firestore("get_user"):
+            user_doc = await user_ref.get()
 
         if user_doc.exists:
             # Update last login
-            await user_ref.update({"lastLogin": firestore.SERVER_TIMESTAMP})
+            with track_firestore("update_last_login"):
+                await user_ref.update({"lastLogin": self._firestore.SERVER_TIMESTAMP})
             user_data = user_doc.to_dict()
             return User(
                 id=firebase_uid,
@@ -109,8 +116,8 @@ class AuthenticationService:
                 "role": role.value,
                 "firebaseUid": firebase_uid,
                 "displayName": display_name,
-                "createdAt": firestore.SERVER_TIMESTAMP,
-                "lastLogin": firestore.SERVER_TIMESTAMP,
+                "createdAt": self._firestore.SERVER_TIMESTAMP,
+                "lastLogin": self._firestore.SERVER_TIMESTAMP,
             }
 
             await user_ref.set(user_data)
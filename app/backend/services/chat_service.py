@@ -2,10 +2,10 @@
 import logging
 import re
 from typing import AsyncGenerator
-from firebase_admin import firestore
 from models.chat import Message, MessageRole, Citation, RetrievalContext
 from services.vertex_ai_service import VertexAIService
 from services.agent_service import AgentService
+from core.metrics import set_metrics_agent, track_firestore, track_stage
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +15,7 @@ class ChatService:
 
     def __init__(self):
         self.firestore_client = None
+        self._firestore = None
         self.vertex_service = None
         self.agent_service = None
         self._initialized = False
@@ -24,6 +25,9 @@ class ChatService:
         if self._initialized:
             return
         try:
+            # Imported here so the Firestore SDK is not loaded at startup
+            from firebase_admin import firestore
+            self._firestore = firestore
             self.firestore_client = firestore.AsyncClient()
             self.vertex_service = VertexAIService()
             self.agent_service = AgentService()
@@ -43,12 +47,15 @@ class ChatService:
         """Stream chat response with RAG"""
         self._ensure_initialized()
         try:
-            agent = await self.agent_service.get_agent(agent_id)
+            with track_stage("agent_lookup"):
+                agent = await self.agent_service.get_agent(agent_id)
+            set_metrics_agent(agent.id)
 
             # Get conversation history
             history = []
             if conversation_id:
-                history = await self._get_conversation_history(agent_id, conversation_id)
+                with track_stage("history_load"):
+                    history = await self._get_conversation_history(agent_id, conversation_id)
 
             # Retrieve contexts
             contexts = await self.vertex_service.retrieve_contexts(
@@ -103,14 +110,15 @@ class ChatService:
     async def _get_conversation_history(self, agent_id: str, conversation_id: str) -> list[dict]:
         """Get conversation history"""
         messages = []
-        async for msg_doc in self.firestore_client.collection("agents").document(agent_id)\
-                .collection("conversations").document(conversation_id)\
-                .collection("messages").order_by("timestamp").limit(20).stream():
-            msg_data = msg_doc.to_dict()
-            messages.append({
-                "role": msg_data["role"],
-                "content": msg_data["content"]
-            })
+        with track_firestore("load_history"):
+            async for msg_doc in self.firestore_client.collection("agents").document(agent_id)\
+                    .collection("conversations").document(conversation_id)\
+                    .collection("messages").order_by("timestamp").limit(20).stream():
+                msg_data = msg_doc.to_dict()
+                messages.append({
+                    "role": msg_data["role"],
+                    "content": msg_data["content"]
+                })
         return messages
 
     def _extract_citations(self, response: str, contexts: list[dict]) -> list[dict]:
@@ -144,24 +152,25 @@ class ChatService:
         conv_ref = self.firestore_client.collection("agents").document(agent_id)\
             .collection("conversations").document(conversation_id)
 
-        await conv_ref.set({
-            "userId": user_id,
-            "lastMessageAt": firestore.SERVER_TIMESTAMP,
-        }, merge=True)
-
-        messages_ref = conv_ref.collection("messages")
-        await messages_ref.add({
-            "role": "user",
-            "content": user_message,
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
-
-        await messages_ref.add({
-            "role": "assistant",
-            "content": assistant_response,
-            "citations": citations,
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
+        with track_firestore("save_messages"):
+            await conv_ref.set({
+                "userId": user_id,
+                "lastMessageAt": self._firestore.SERVER_TIMESTAMP,
+            }, merge=True)
+
+            messages_ref = conv_ref.collection("messages")
+            await messages_ref.add({
+                "role": "user",
+                "content": user_message,
+                "timestamp": self._firestore.SERVER_TIMESTAMP
+            })
+
+            await messages_ref.add({
+                "role": "assistant",
+                "content": assistant_response,
+                "citations": citations,
+                "timestamp": self._firestore.SERVER_TIMESTAMP
+            })
 
     async def clear_history(self, agent_id: str, user_id: str):
         """Clear conversation history"""
@@ -0,0 +1,92 @@
+"""Content service resolving cited files and the HTTP range and conditional requests for them"""
+
+import logging
+from collections.abc import Mapping
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from services.agent_service import AgentService
+from services.document_service import DocumentService
+from services.storage_service import parse_gcs_path
+
+logger = logging.getLogger(__name__)
+
+
+class ContentService:
+    """Service resolving the paths cited in answers to files of an agent's bucket"""
+
+    def __init__(self, agent_service: AgentService, document_service: DocumentService):
+        self.agent_service = agent_service
+        self.document_service = document_service
+
+    async def resolve(self, path: str, agent_id: str) -> Optional[tuple[str, str]]:
+        """
+        Get the bucket and object name of a gs:// path or document file name cited by an agent,
+        None if it is not a file of that agent's bucket.
+        Raises ValueError if the agent does not exist, AmbiguousDocumentError if the name matches several documents.
+        """
+        # Remove page number from path, filename.pdf#page=2 -> filename.pdf
+        # This shouldn't typically be necessary as browsers don't send hash fragments to servers
+        path = path.split("#", 1)[0]
+        agent = await self.agent_service.get_agent(agent_id)
+        location = parse_gcs_path(path)
+        if location is None:
+            location = await self.document_service.find_document_file(agent_id, path.rsplit("/", 1)[-1])
+        # Only the bucket of the agent can be read
+        if location is None or location[0] != agent.bucket_name:
+            return None
+        return location
+
+
+def not_modified(headers: Mapping[str, str], etag: str, updated: datetime) -> bool:
+    """Whether the client's copy, named by If-None-Match or If-Modified-Since, is still current"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    return _not_modified_since(headers.get("if-modified-since"), updated)
+
+
+def if_range_matches(headers: Mapping[str, str], etag: str, updated: datetime) -> bool:
+    """Whether the If-Range header, if any, names the current version of the file"""
+    if_range = headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return _not_modified_since(if_range, updated)
+
+
+def _not_modified_since(http_date: Optional[str], updated: datetime) -> bool:
+    if not http_date:
+        return False
+    try:
+        since = parsedate_to_datetime(http_date)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a precision of one second
+    return since.tzinfo is not None and updated.replace(microsecond=0) <= since
+
+
+def parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Return the first and last byte of a single byte range, or None to serve the whole file,
+    as for multiple or malformed ranges. Raises ValueError if the range can't be satisfied.
+    """
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+    first, _, last = byte_range.strip().partition("-")
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # A suffix range, the last bytes of the file
+        if int(last) == 0 or size == 0:
+            raise ValueError(range_header)
+        return max(size - int(last), 0), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise ValueError(range_header)
+    return int(first), min(int(last), size - 1) if last else size - 1
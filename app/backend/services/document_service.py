@@ -1,12 +1,14 @@
 """Document service for file management"""
 import logging
+import time
 import uuid
 import hashlib
+from datetime import datetime
 from pathlib import Path
-from firebase_admin import firestore
+from typing import Optional
 from fastapi import UploadFile
 from models.document import Document, DocumentCreate, DocumentStatus
-from services.storage_service import StorageService
+from services.storage_service import StorageService, parse_gcs_path
 from services.vertex_ai_service import VertexAIService
 from services.agent_service import AgentService
 from core.config import get_settings
@@ -15,24 +17,35 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+class AmbiguousDocumentError(ValueError):
+    """Raised when a cited file name matches several documents"""
+
+
 class DocumentService:
     """Service for document management"""
 
     MAX_FILE_SIZE = settings.MAX_FILE_SIZE_MB * 1024 * 1024
     ALLOWED_EXTENSIONS = settings.ALLOWED_EXTENSIONS
+    # How long the location of a cited document is remembered
+    FILE_LOCATION_TTL = 300
 
     def __init__(self):
         self.firestore_client = None
+        self._firestore = None
         self.storage_service = None
         self.vertex_service = None
         self.agent_service = None
         self._initialized = False
+        self._file_locations: dict[tuple[str, str], tuple[float, tuple[str, str]]] = {}
 
     def _ensure_initialized(self):
         """Lazy initialization of services"""
         if self._initialized:
             return
         try:
+            # Imported here so the Firestore SDK is not loaded at startup
+            from firebase_admin import firestore
+            self._firestore = firestore
             self.firestore_client = firestore.AsyncClient()
             self.storage_service = StorageService()
             self.vertex_service = VertexAIService()
@@ -64,7 +77,7 @@ class DocumentService:
         gcs_path = f"documents/{safe_filename}"
 
         # Upload to GCS
-        full_gcs_path = self.storage_service.upload_file(
+        full_gcs_path = await self.storage_service.upload_file(
             agent.bucket_name,
             content,
             gcs_path,
@@ -82,7 +95,7 @@ class DocumentService:
             "contentType": file.content_type,
             "size": len(content),
             "uploadedBy": uploaded_by,
-            "uploadedAt": firestore.SERVER_TIMESTAMP,
+            "uploadedAt": self._firestore.SERVER_TIMESTAMP,
             "status": DocumentStatus.UPLOADED.value,
             "chunksCount": 0
         }
@@ -93,7 +106,8 @@ class DocumentService:
         # Trigger indexing (async)
         await self._index_document(agent_id, doc_id)
 
-        return Document(**doc_data)
+        # The upload time is set by Firestore, use the local time for the returned document
+        return Document.from_firestore({**doc_data, "uploadedAt": datetime.utcnow()})
 
     async def _index_document(self, agent_id: str, doc_id: str):
         """Index document in Vertex AI RAG"""
@@ -130,7 +144,7 @@ class DocumentService:
             .collection("documents").document(doc_id).get()
         if not doc.exists:
             raise ValueError(f"Document {doc_id} not found")
-        return Document(**doc.to_dict())
+        return Document.from_firestore(doc.to_dict())
 
     async def list_documents(self, agent_id: str) -> list[Document]:
         """List documents for agent"""
@@ -138,7 +152,7 @@ class DocumentService:
         documents = []
         async for doc in self.firestore_client.collection("agents").document(agent_id)\
                 .collection("documents").stream():
-            documents.append(Document(**doc.to_dict()))
+            documents.append(Document.from_firestore(doc.to_dict()))
         return documents
 
     async def delete_document(self, agent_id: str, doc_id: str):
@@ -149,7 +163,7 @@ class DocumentService:
 
         # Delete from GCS
         blob_name = doc.gcs_path.replace(f"gs://{agent.bucket_name}/", "")
-        self.storage_service.delete_file(agent.bucket_name, blob_name)
+        await self.storage_service.delete_file(agent.bucket_name, blob_name)
 
         # Delete from Firestore
         await self.firestore_client.collection("agents").document(agent_id)\
@@ -162,4 +176,30 @@ class DocumentService:
         doc = await self.get_document(agent_id, doc_id)
 
         blob_name = doc.gcs_path.replace(f"gs://{agent.bucket_name}/", "")
-        return self.storage_service.generate_signed_url(agent.bucket_name, blob_name)
+        return await self.storage_service.generate_signed_url(agent.bucket_name, blob_name)
+
+    async def find_document_file(self, agent_id: str, file_name: str) -> Optional[tuple[str, str]]:
+        """
+        Find the bucket and object name of a document of an agent from the file name cited in answers,
+        matching the stored file name first and then the original one.
+        Raises AmbiguousDocumentError if the name matches several documents.
+        """
+        self._ensure_initialized()
+        cache_key = (agent_id, file_name)
+        cached = self._file_locations.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Equality filters on the documents of one agent use Firestore's automatic single-field indexes
+        documents = self.firestore_client.collection("agents").document(agent_id).collection("documents")
+        for field in ("fileName", "originalName"):
+            query = documents.where(filter=self._firestore.FieldFilter(field, "==", file_name)).limit(2)
+            matches = [doc.to_dict() async for doc in query.stream()]
+            if len(matches) > 1:
+                raise AmbiguousDocumentError(f"'{file_name}' matches several documents of agent {agent_id}")
+            if matches:
+                location = parse_gcs_path(Document.from_firestore(matches[0]).gcs_path)
+                if location is not None:
+                    self._file_locations[cache_key] = (time.monotonic() + self.FILE_LOCATION_TTL, location)
+                return location
+        return None
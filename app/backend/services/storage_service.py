@@ -1,12 +1,78 @@
 """Storage service for GCS operations"""
+import asyncio
 import logging
-from google.cloud import storage
+from collections import OrderedDict
+from collections.abc import AsyncGenerator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, TYPE_CHECKING
 from datetime import timedelta
 from core.config import get_settings
 
+if TYPE_CHECKING:
+    from google.cloud import storage
+
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Shared by every StorageService instance so the number of concurrent
+# blocking GCS calls per worker stays bounded
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_storage_executor() -> ThreadPoolExecutor:
+    """Get the bounded executor used for blocking GCS calls"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.STORAGE_MAX_WORKERS,
+            thread_name_prefix="gcs-io"
+        )
+    return _executor
+
+
+def parse_gcs_path(path: str) -> Optional[tuple[str, str]]:
+    """Split a gs://bucket/name path into the bucket and object names"""
+    # Paths taken from a URL may have had their double slash merged
+    for prefix in ("gs://", "gs:/"):
+        if path.startswith(prefix):
+            bucket_name, _, blob_name = path[len(prefix):].partition("/")
+            if bucket_name and blob_name:
+                return bucket_name, blob_name
+            return None
+    return None
+
+
+class ContentCache:
+    """Least recently used cache of small files, keyed by object generation so a new version is never served stale"""
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._files: OrderedDict[tuple[str, str, int], bytes] = OrderedDict()
+        self._size = 0
+
+    def accepts(self, size: int) -> bool:
+        """Whether a file of this size is small enough to be cached"""
+        return size <= min(self.max_file_bytes, self.max_bytes)
+
+    def get(self, bucket_name: str, blob_name: str, generation: int) -> Optional[bytes]:
+        key = (bucket_name, blob_name, generation)
+        data = self._files.get(key)
+        if data is not None:
+            self._files.move_to_end(key)
+        return data
+
+    def put(self, bucket_name: str, blob_name: str, generation: int, data: bytes):
+        key = (bucket_name, blob_name, generation)
+        if not self.accepts(len(data)) or key in self._files:
+            return
+        self._files[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._files.popitem(last=False)
+            self._size -= len(evicted)
+
 
 class StorageService:
     """Service for Cloud Storage operations"""
@@ -20,6 +86,8 @@ class StorageService:
         if self._initialized:
             return
         try:
+            # Imported here so the Cloud Storage SDK is not loaded at startup
+            from google.cloud import storage
             self.client = storage.Client(project=settings.GCP_PROJECT_ID)
             self._initialized = True
             logger.info("StorageService initialized successfully")
@@ -27,54 +95,105 @@ class StorageService:
             logger.error(f"Failed to initialize StorageService: {e}")
             raise
 
-    def create_bucket(self, bucket_name: str, location: str = None) -> storage.Bucket:
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking GCS call on the storage executor"""
+        self._ensure_initialized()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_storage_executor(), partial(func, *args, **kwargs))
+
+    async def create_bucket(self, bucket_name: str, location: str = None) -> "storage.Bucket":
         """Create a new bucket"""
         self._ensure_initialized()
-        bucket = self.client.create_bucket(
+        return await self._run(
+            self.client.create_bucket,
             bucket_name,
             location=location or settings.GCP_REGION
         )
-        return bucket
 
-    def delete_bucket(self, bucket_name: str, force: bool = True):
+    async def delete_bucket(self, bucket_name: str, force: bool = True):
         """Delete a bucket"""
         self._ensure_initialized()
         bucket = self.client.bucket(bucket_name)
         if force:
-            bucket.delete(force=True)
+            await self._run(bucket.delete, force=True)
         else:
-            bucket.delete()
+            await self._run(bucket.delete)
+
+    async def delete_all_files(self, bucket_name: str, batch_size: int = 100) -> AsyncGenerator[int, None]:
+        """Delete every object in a bucket using batched requests, yielding the count deleted per batch"""
+        self._ensure_initialized()
+        bucket = self.client.bucket(bucket_name)
+        pages = bucket.list_blobs(page_size=batch_size).pages
+        while True:
+            page = await self._run(next, pages, None)
+            if page is None:
+                return
+            blobs = list(page)
+            if blobs:
+                await self._run(self._delete_blobs_batch, blobs)
+                yield len(blobs)
 
-    def upload_file(self, bucket_name: str, source_data: bytes, destination_blob_name: str, content_type: str = None):
+    def _delete_blobs_batch(self, blobs: list):
+        """Delete blobs with a single GCS batch request"""
+        with self.client.batch():
+            for blob in blobs:
+                blob.delete()
+
+    async def upload_file(self, bucket_name: str, source_data: bytes, destination_blob_name: str, content_type: str = None):
         """Upload file to bucket"""
         self._ensure_initialized()
         bucket = self.client.bucket(bucket_name)
         blob = bucket.blob(destination_blob_name)
-        blob.upload_from_string(source_data, content_type=content_type)
+        await self._run(blob.upload_from_string, source_data, content_type=content_type)
         return f"gs://{bucket_name}/{destination_blob_name}"
 
-    def delete_file(self, bucket_name: str, blob_name: str):
+    async def delete_file(self, bucket_name: str, blob_name: str):
         """Delete file from bucket"""
         self._ensure_initialized()
         bucket = self.client.bucket(bucket_name)
         blob = bucket.blob(blob_name)
-        blob.delete()
+        await self._run(blob.delete)
 
-    def generate_signed_url(self, bucket_name: str, blob_name: str, expiration_hours: int = 1) -> str:
+    async def generate_signed_url(self, bucket_name: str, blob_name: str, expiration_hours: int = 1) -> str:
         """Generate signed URL for file download"""
         self._ensure_initialized()
         bucket = self.client.bucket(bucket_name)
         blob = bucket.blob(blob_name)
-        url = blob.generate_signed_url(
+        return await self._run(
+            blob.generate_signed_url,
             version="v4",
             expiration=timedelta(hours=expiration_hours),
             method="GET"
         )
-        return url
 
-    def list_files(self, bucket_name: str, prefix: str = None) -> list:
-        """List files in bucket"""
+    async def get_file_metadata(self, bucket_name: str, blob_name: str) -> Optional["storage.Blob"]:
+        """Get the size, generation, content type and update time of a file, None if it does not exist"""
+        self._ensure_initialized()
+        bucket = self.client.bucket(bucket_name)
+        return await self._run(bucket.get_blob, blob_name)
+
+    async def stream_file(
+        self, bucket_name: str, blob_name: str, generation: int, start: int, end: int, chunk_size: int
+    ) -> AsyncGenerator[bytes, None]:
+        """Download bytes start to end (inclusive) of a generation of a file, one chunk at a time"""
+        self._ensure_initialized()
+        # Pinned to the generation so that the chunks all come from the same version of the file
+        blob = self.client.bucket(bucket_name).blob(blob_name, generation=generation)
+        while start <= end:
+            chunk_end = min(start + chunk_size - 1, end)
+            yield await self._run(blob.download_as_bytes, start=start, end=chunk_end, checksum=None)
+            start = chunk_end + 1
+
+    async def list_files(self, bucket_name: str, prefix: str = None) -> AsyncGenerator[str, None]:
+        """List files in bucket, fetching one page at a time"""
         self._ensure_initialized()
         bucket = self.client.bucket(bucket_name)
-        blobs = bucket.list_blobs(prefix=prefix)
-        return [blob.name for blob in blobs]
+        blobs = bucket.list_blobs(prefix=prefix, page_size=settings.STORAGE_LIST_PAGE_SIZE)
+        pages = blobs.pages
+        while True:
+            # Each next() on the page iterator performs one list request
+            page = await self._run(next, pages, None)
+            if page is None:
+                return
+            for blob in page:
+                yield blob.name
@@ -2,10 +2,12 @@
 Vertex AI service for chat and embeddings
 Imports are done lazily to avoid startup failures
 """
+import asyncio
 import logging
 from typing import AsyncGenerator, Optional, TYPE_CHECKING
 
 from core.config import get_settings
+from core.metrics import observe_first_token, observe_llm_tokens, track_retrieval, track_stage
 from models.agent import Agent
 
 logger = logging.getLogger(__name__)
@@ -115,6 +117,7 @@ class VertexAIService:
                 "max_output_tokens": settings.DEFAULT_MAX_TOKENS,
             }
         )
+        self._observe_usage(response)
 
         return response.text
 
@@ -164,9 +167,13 @@ class VertexAIService:
             stream=True
         )
 
+        chunk = None
         for chunk in response:
             if chunk.text:
+                observe_first_token()
                 yield chunk.text
+        # Usage is reported on the last chunk
+        self._observe_usage(chunk)
 
     async def chat_stream(
         self,
@@ -189,17 +196,18 @@ class VertexAIService:
         """
         self._ensure_initialized()
         try:
-            # Build system prompt with context
-            system_prompt = self._build_system_prompt(agent, retrieved_contexts)
+            with track_stage("prompt_render"):
+                # Build system prompt with context
+                system_prompt = self._build_system_prompt(agent, retrieved_contexts)
 
-            # Initialize model using lazy-loaded class
-            model = self._GenerativeModel(
-                model_name=agent.settings.model,
-                system_instruction=system_prompt
-            )
+                # Initialize model using lazy-loaded class
+                model = self._GenerativeModel(
+                    model_name=agent.settings.model,
+                    system_instruction=system_prompt
+                )
 
-            # Build conversation
-            contents = self._build_contents(conversation_history, message)
+                # Build conversation
+                contents = self._build_contents(conversation_history, message)
 
             # Generate with streaming
             response = model.generate_content(
@@ -211,14 +219,24 @@ class VertexAIService:
                 stream=True
             )
 
+            chunk = None
             for chunk in response:
                 if chunk.text:
+                    observe_first_token()
                     yield chunk.text
+            # Usage is reported on the last chunk
+            self._observe_usage(chunk)
 
         except Exception as e:
             logger.error(f"Chat stream error: {e}")
             raise
 
+    def _observe_usage(self, response):
+        """Record the Gemini input and output token counts of a response"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            observe_llm_tokens(usage.prompt_token_count, usage.candidates_token_count)
+
     def _build_system_prompt(self, agent: Agent, contexts: Optional[list] = None) -> str:
         """Build system prompt with retrieved context"""
         base_prompt = agent.settings.system_prompt or """Tu es un assistant intelligent qui répond aux questions en te basant sur les documents fournis.
@@ -286,6 +304,24 @@ INSTRUCTIONS:
             logger.error(f"Error creating RAG corpus: {e}")
             raise
 
+    async def delete_rag_corpus(self, corpus_id: str):
+        """
+        Delete a RAG corpus and all of its files
+
+        Args:
+            corpus_id: Corpus ID
+        """
+        self._ensure_initialized()
+        if not self._rag_available:
+            logger.warning("RAG API not available, skipping corpus deletion")
+            return
+
+        try:
+            await asyncio.to_thread(self._rag.delete_corpus, name=corpus_id)
+        except Exception as e:
+            logger.error(f"Error deleting RAG corpus: {e}")
+            raise
+
     async def import_files_to_corpus(
         self,
         corpus_id: str,
@@ -343,14 +379,15 @@ INSTRUCTIONS:
             return []
 
         try:
-            response = self._rag.retrieval_query(
-                rag_resources=[
-                    self._rag.RagResource(rag_corpus=corpus_id)
-                ],
-                text=query,
-                similarity_top_k=top_k,
-                vector_distance_threshold=threshold,
-            )
+            with track_retrieval():
+                response = self._rag.retrieval_query(
+                    rag_resources=[
+                        self._rag.RagResource(rag_corpus=corpus_id)
+                    ],
+                    text=query,
+                    similarity_top_k=top_k,
+                    vector_distance_threshold=threshold,
+                )
 
             contexts = []
             for ctx in response.contexts:
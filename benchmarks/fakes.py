@@ -0,0 +1,349 @@
+"""
+In-process fakes for the Google Cloud services used by the FastAPI backend (app/backend/main.py).
+
+The fakes replace the Firestore, Cloud Storage, Firebase Auth and Vertex AI clients of the service
+instances created by main.py, so the backend can be load tested offline with predictable latencies.
+Each fake keeps the calling convention of the SDK it stands in for: Firestore is async and awaits its
+latency, while Cloud Storage and Vertex AI are synchronous and sleep, so a fake blocks the caller (the
+event loop or a storage executor thread) exactly where the real SDK would.
+
+Usage:
+    import main
+    from fakes import FakeBackendConfig, install_fakes
+
+    install_fakes(main, FakeBackendConfig(tokens_per_second=80))
+"""
+
+import asyncio
+import itertools
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Optional
+
+BENCH_USER_TOKEN = "bench-admin"
+BENCH_AGENT_PREFIX = "bench-agent-"
+
+ANSWER_WORDS = (
+    "Le document indique que la politique couvre les frais médicaux et dentaires des employés "
+    "ainsi que les soins de vision, avec une franchise annuelle et un plafond de remboursement"
+).split()
+
+
+@dataclass
+class FakeBackendConfig:
+    """Latencies (in seconds) and generation rates of the fake services"""
+
+    firestore_latency: float = 0.01
+    gcs_latency: float = 0.05
+    gcs_bytes_per_second: float = 50 * 1024 * 1024
+    retrieval_latency: float = 0.15
+    import_latency: float = 0.5
+    time_to_first_token: float = 0.4
+    tokens_per_second: float = 50.0
+    output_tokens: int = 200
+    tokens_per_chunk: int = 5
+    contexts: int = 5
+    agents: int = 10
+
+
+def _server_timestamps(data: dict) -> dict:
+    return {
+        key: datetime.now(timezone.utc) if value is FakeFirestoreModule.SERVER_TIMESTAMP else value
+        for key, value in data.items()
+    }
+
+
+class FakeFirestoreModule:
+    """Stands in for the firebase_admin.firestore module"""
+
+    SERVER_TIMESTAMP = object()
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: Optional[dict]):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[dict]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    async def get(self) -> FakeSnapshot:
+        await self._client.round_trip()
+        return FakeSnapshot(self.id, self._client.documents.get(self.path))
+
+    async def set(self, data: dict, merge: bool = False):
+        await self._client.round_trip()
+        existing = self._client.documents.get(self.path) if merge else None
+        self._client.documents[self.path] = {**(existing or {}), **_server_timestamps(data)}
+
+    async def update(self, data: dict):
+        await self._client.round_trip()
+        if self.path not in self._client.documents:
+            raise ValueError(f"No document to update: {self.path}")
+        self._client.documents[self.path].update(_server_timestamps(data))
+
+    async def delete(self):
+        await self._client.round_trip()
+        self._client.documents.pop(self.path, None)
+
+
+class FakeCollectionReference:
+    def __init__(
+        self, client: "FakeFirestoreClient", path: str, order_by: Optional[str] = None, limit: Optional[int] = None
+    ):
+        self._client = client
+        self.path = path
+        self._order_by = order_by
+        self._limit = limit
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, f"{self.path}/{doc_id or uuid.uuid4().hex}")
+
+    def order_by(self, field: str, **kwargs) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self.path, field, self._limit)
+
+    def limit(self, count: int) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self.path, self._order_by, count)
+
+    async def add(self, data: dict):
+        doc_ref = self.document()
+        await doc_ref.set(data)
+        return None, doc_ref
+
+    async def stream(self):
+        await self._client.round_trip()
+        prefix = f"{self.path}/"
+        documents = [
+            FakeSnapshot(path[len(prefix) :], data)
+            for path, data in self._client.documents.items()
+            if path.startswith(prefix) and "/" not in path[len(prefix) :]
+        ]
+        if self._order_by:
+            documents.sort(key=lambda snapshot: snapshot.to_dict().get(self._order_by) or 0)
+        for snapshot in documents[: self._limit]:
+            yield snapshot
+
+
+class FakeFirestoreClient:
+    """Stands in for firestore.AsyncClient, with documents kept in memory by path"""
+
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+        self.documents: dict[str, dict] = {}
+
+    async def round_trip(self):
+        await asyncio.sleep(self.config.firestore_latency)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_string(self, data: bytes, content_type: Optional[str] = None):
+        config = self.bucket.client.config
+        time.sleep(config.gcs_latency + len(data) / config.gcs_bytes_per_second)
+        self.bucket.client.objects[(self.bucket.name, self.name)] = bytes(data)
+
+    def delete(self):
+        time.sleep(self.bucket.client.config.gcs_latency)
+        self.bucket.client.objects.pop((self.bucket.name, self.name), None)
+
+    def generate_signed_url(self, **kwargs) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}?X-Goog-Signature=fake"
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+
+class FakeStorageClient:
+    """Stands in for google.cloud.storage.Client, with objects kept in memory"""
+
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+        self.objects: dict[tuple[str, str], bytes] = {}
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+
+class FakeFirebaseAuth:
+    """Stands in for firebase_admin.auth, every token is accepted and used as the user ID"""
+
+    @staticmethod
+    def verify_id_token(token: str) -> dict:
+        return {"uid": token, "email": f"{token}@example.com", "email_verified": True}
+
+
+class FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+    @classmethod
+    def from_text(cls, text: str) -> "FakePart":
+        return cls(text)
+
+
+class FakeContent:
+    def __init__(self, role: str, parts: list[FakePart]):
+        self.role = role
+        self.parts = parts
+
+
+class FakeGenerativeModel:
+    """Stands in for vertexai GenerativeModel, answers with canned text at the configured token rate"""
+
+    config: FakeBackendConfig = FakeBackendConfig()
+
+    def __init__(self, model_name: str, system_instruction: Optional[str] = None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+
+    def _prompt_tokens(self, contents: list[FakeContent]) -> int:
+        characters = len(self.system_instruction) + sum(len(part.text) for c in contents for part in c.parts)
+        return characters // 4
+
+    def _answer_tokens(self) -> list[str]:
+        words = list(itertools.islice(itertools.cycle(ANSWER_WORDS), self.config.output_tokens))
+        if words:
+            words[-1] += " [Source: document-0.pdf]"
+        return [f"{word} " for word in words]
+
+    def _usage(self, contents: list[FakeContent]) -> SimpleNamespace:
+        return SimpleNamespace(
+            prompt_token_count=self._prompt_tokens(contents), candidates_token_count=self.config.output_tokens
+        )
+
+    def generate_content(self, contents: list[FakeContent], generation_config: Any = None, stream: bool = False):
+        if stream:
+            return self._stream(contents)
+        time.sleep(self.config.time_to_first_token + self.config.output_tokens / self.config.tokens_per_second)
+        return SimpleNamespace(text="".join(self._answer_tokens()), usage_metadata=self._usage(contents))
+
+    def _stream(self, contents: list[FakeContent]):
+        # The real SDK blocks while waiting for each chunk, so does the fake
+        time.sleep(self.config.time_to_first_token)
+        tokens = self._answer_tokens()
+        size = max(1, self.config.tokens_per_chunk)
+        for start in range(0, len(tokens), size):
+            chunk = tokens[start : start + size]
+            if start:
+                time.sleep(len(chunk) / self.config.tokens_per_second)
+            last = start + size >= len(tokens)
+            yield SimpleNamespace(text="".join(chunk), usage_metadata=self._usage(contents) if last else None)
+
+
+class FakeRag:
+    """Stands in for vertexai.preview.rag"""
+
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+
+    @staticmethod
+    def RagResource(rag_corpus: str) -> SimpleNamespace:
+        return SimpleNamespace(rag_corpus=rag_corpus)
+
+    def retrieval_query(self, rag_resources: list, text: str, similarity_top_k: int = 5, **kwargs) -> SimpleNamespace:
+        time.sleep(self.config.retrieval_latency)
+        contexts = [
+            SimpleNamespace(
+                text=" ".join(ANSWER_WORDS) * 4,
+                source_name=f"document-{i}.pdf",
+                score=0.9 - i * 0.05,
+                chunk_id=f"chunk-{i}",
+            )
+            for i in range(min(similarity_top_k, self.config.contexts))
+        ]
+        return SimpleNamespace(contexts=contexts)
+
+    def import_files(self, corpus_name: str, paths: list[str], **kwargs):
+        time.sleep(self.config.import_latency)
+
+
+def seed_data(firestore_client: FakeFirestoreClient, config: FakeBackendConfig):
+    """Create the benchmark admin user and agents, written in the format of the backend"""
+    # Imported here as the backend is only on the path once main.py is imported
+    from models.agent import Agent
+
+    now = datetime.now(timezone.utc)
+    firestore_client.documents[f"users/{BENCH_USER_TOKEN}"] = {
+        "email": f"{BENCH_USER_TOKEN}@example.com",
+        "role": "admin",
+        "firebaseUid": BENCH_USER_TOKEN,
+        "createdAt": now,
+    }
+    for i in range(config.agents):
+        agent = Agent(
+            id=f"{BENCH_AGENT_PREFIX}{i}",
+            name=f"Benchmark agent {i}",
+            description="Agent used by the load tests",
+            created_by=BENCH_USER_TOKEN,
+            created_at=now,
+            updated_at=now,
+            bucket_name=f"bench-bucket-{i}",
+            corpus_id=f"projects/bench/locations/europe-west1/ragCorpora/{i}",
+        )
+        firestore_client.documents[f"agents/{agent.id}"] = agent.to_firestore()
+
+
+def install_fakes(main_module, config: FakeBackendConfig) -> FakeFirestoreClient:
+    """
+    Replace the SDK clients of the services of main.py with fakes and seed them.
+    Every service shares the same fakes, so data written by one is visible to the others.
+    """
+    firestore_client = FakeFirestoreClient(config)
+    storage_client = FakeStorageClient(config)
+    FakeGenerativeModel.config = config
+    seed_data(firestore_client, config)
+
+    main_module.storage_service.client = storage_client
+    main_module.storage_service._initialized = True
+
+    vertex_ai_service = main_module.vertex_ai_service
+    vertex_ai_service._GenerativeModel = FakeGenerativeModel
+    vertex_ai_service._Content = FakeContent
+    vertex_ai_service._Part = FakePart
+    vertex_ai_service._rag = FakeRag(config)
+    vertex_ai_service._rag_available = True
+    vertex_ai_service._initialized = True
+
+    main_module.auth_service._auth = FakeFirebaseAuth
+    for service in (
+        main_module.auth_service,
+        main_module.agent_service,
+        main_module.document_service,
+        main_module.chat_service,
+    ):
+        service.firestore_client = firestore_client
+        service._firestore = FakeFirestoreModule
+        service._initialized = True
+    for service in (main_module.agent_service, main_module.document_service, main_module.chat_service):
+        service.vertex_service = vertex_ai_service
+    for service in (main_module.agent_service, main_module.document_service):
+        service.storage_service = main_module.storage_service
+    for service in (main_module.document_service, main_module.chat_service):
+        service.agent_service = main_module.agent_service
+    return firestore_client
@@ -0,0 +1,87 @@
+"""
+Run the FastAPI backend (app/backend/main.py) in a single uvicorn worker, with the Google Cloud
+services replaced by the in-process fakes of fakes.py.
+
+The server can be load tested with loadtest.py (which starts it by itself) or any HTTP load tool.
+Requests are authenticated with the token "bench-admin", and agents bench-agent-0..N are seeded.
+
+Usage:
+    python benchmarks/fakeserver.py --port 8765 --tokens-per-second 80 --ttft-ms 300
+"""
+
+import argparse
+import os
+import sys
+from dataclasses import fields
+from pathlib import Path
+
+from fakes import FakeBackendConfig, install_fakes
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "app" / "backend"
+
+# Options given in milliseconds on the command line, stored in seconds in FakeBackendConfig
+MILLISECOND_OPTIONS = {
+    "firestore_latency": "firestore-latency-ms",
+    "gcs_latency": "gcs-latency-ms",
+    "retrieval_latency": "retrieval-latency-ms",
+    "import_latency": "import-latency-ms",
+    "time_to_first_token": "ttft-ms",
+}
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser):
+    """Add an option for each field of FakeBackendConfig"""
+    defaults = FakeBackendConfig()
+    for config_field in fields(FakeBackendConfig):
+        default = getattr(defaults, config_field.name)
+        if config_field.name in MILLISECOND_OPTIONS:
+            parser.add_argument(f"--{MILLISECOND_OPTIONS[config_field.name]}", type=float, default=default * 1000)
+        else:
+            parser.add_argument(f"--{config_field.name.replace('_', '-')}", type=type(default), default=default)
+
+
+def fake_config_from_args(args: argparse.Namespace) -> FakeBackendConfig:
+    values = {}
+    for config_field in fields(FakeBackendConfig):
+        if config_field.name in MILLISECOND_OPTIONS:
+            values[config_field.name] = getattr(args, MILLISECOND_OPTIONS[config_field.name].replace("-", "_")) / 1000
+        else:
+            values[config_field.name] = getattr(args, config_field.name)
+    return FakeBackendConfig(**values)
+
+
+def fake_arguments(config: FakeBackendConfig) -> list[str]:
+    """Command line arguments that reproduce a FakeBackendConfig"""
+    arguments = []
+    for config_field in fields(FakeBackendConfig):
+        value = getattr(config, config_field.name)
+        if config_field.name in MILLISECOND_OPTIONS:
+            arguments += [f"--{MILLISECOND_OPTIONS[config_field.name]}", str(value * 1000)]
+        else:
+            arguments += [f"--{config_field.name.replace('_', '-')}", str(value)]
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the FastAPI backend against in-process fakes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    # The backend only uses Vertex AI when a project is configured, and reads its settings at import
+    os.environ.setdefault("GCP_PROJECT_ID", "bench-project")
+    os.environ.setdefault("ENABLE_SERVER_TIMING", "true")
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(BACKEND_DIR)
+
+    import uvicorn
+
+    import main as backend
+
+    install_fakes(backend, fake_config_from_args(args))
+    uvicorn.run(backend.app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Profile the import time of a backend module with `python -X importtime`.
+
+Runs the import in a fresh interpreter, so the numbers reflect a cold start of the
+FastAPI entrypoint (or any other module in app/backend), and writes a report listing
+the slowest imports by cumulative time.
+
+Usage:
+    python benchmarks/importtime.py --module main --output benchmarks/results/importtime_main.txt
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "app" / "backend"
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    records = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append(ImportRecord(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def run_importtime(module: str, runs: int) -> list[list[ImportRecord]]:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    results = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(parse_importtime(completed.stderr))
+    return results
+
+
+def top_level_packages(records: list[ImportRecord]) -> dict[str, int]:
+    """Sum the self time of every import by its top-level package."""
+    totals: dict[str, int] = {}
+    for record in records:
+        package = record.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + record.self_us
+    return totals
+
+
+def format_report(module: str, runs: list[list[ImportRecord]], top: int) -> str:
+    # Use the fastest run, the others include noise from a cold disk cache
+    records = min(runs, key=lambda rs: sum(r.self_us for r in rs))
+    total_us = sum(r.self_us for r in records)
+    lines = [
+        f"Import time profile for `import {module}` (best of {len(runs)} runs, Python {sys.version.split()[0]})",
+        f"Total: {total_us / 1000:.1f} ms across {len(records)} modules",
+        "",
+        f"Top {top} top-level packages by self time:",
+    ]
+    packages = sorted(top_level_packages(records).items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in packages[:top]:
+        lines.append(f"  {self_us / 1000:9.1f} ms  {package}")
+    lines.append("")
+    lines.append(f"Top {top} imports by cumulative time:")
+    for record in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        lines.append(f"  {record.cumulative_us / 1000:9.1f} ms  {'  ' * record.depth}{record.module}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of a backend module.")
+    parser.add_argument("--module", default="main", help="Module to import from app/backend")
+    parser.add_argument("--runs", type=int, default=3, help="Number of fresh interpreter runs")
+    parser.add_argument("--top", type=int, default=25, help="Number of entries to report")
+    parser.add_argument("--output", help="File to write the report to (defaults to stdout)")
+    args = parser.parse_args()
+
+    report = format_report(args.module, run_importtime(args.module, args.runs), args.top)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(report)
+    else:
+        print(report, end="")
+
+
+if __name__ == "__main__":
+    main()
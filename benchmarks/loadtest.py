@@ -0,0 +1,344 @@
+"""
+Offline load test of the FastAPI backend (app/backend/main.py).
+
+Starts the backend in a single uvicorn worker with the Google Cloud services replaced by the fakes of
+fakes.py (see fakeserver.py), then runs each scenario at increasing concurrency levels:
+
+- chat_stream: POST /chat/stream with an agent (NDJSON stream, RAG retrieval + Gemini)
+- agent_chat_stream: POST /api/agents/{id}/chat/stream (SSE stream, history + RAG + Gemini)
+- upload: POST /api/agents/{id}/documents (GCS upload + Firestore + RAG import)
+
+For every level it measures the latency, time to first token (TTFT) and tokens per second percentiles,
+and stops at the first level that misses the objectives. The highest level that met them is the max
+sustainable concurrency of the worker. Results are written as a JSON report, and with --fail-below the
+exit code is non-zero when a scenario can't sustain the given concurrency, so the test can gate CI.
+
+Tokens are counted as whitespace-separated words of the streamed answer, which is what the fake model
+produces one at a time.
+
+Usage:
+    python benchmarks/loadtest.py --output benchmarks/results/loadtest_fastapi.json
+    python benchmarks/loadtest.py --concurrency 1,2,4 --duration 5 --tokens-per-second 100 --fail-below 2
+    python benchmarks/loadtest.py --url http://localhost:8080 --scenarios chat_stream
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from fakes import BENCH_AGENT_PREFIX, BENCH_USER_TOKEN
+from fakeserver import add_fake_arguments, fake_arguments, fake_config_from_args
+
+SCENARIOS = ("chat_stream", "agent_chat_stream", "upload")
+STREAMING_SCENARIOS = ("chat_stream", "agent_chat_stream")
+
+QUESTIONS = [
+    "Que couvre la politique de santé ?",
+    "Quelle est la franchise annuelle ?",
+    "Les soins dentaires sont-ils remboursés ?",
+    "Quel est le plafond de remboursement pour la vision ?",
+]
+
+UPLOAD_BYTES = b"Benchmark document.\n" * 5000
+
+
+@dataclass
+class RequestResult:
+    latency: float
+    ok: bool
+    ttft: Optional[float] = None
+    tokens: int = 0
+    tokens_per_second: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class StepReport:
+    concurrency: int
+    requests: int
+    errors: int
+    error_rate: float
+    throughput_rps: float
+    latency_ms: dict[str, float]
+    ttft_ms: dict[str, float] = field(default_factory=dict)
+    tokens_per_second: dict[str, float] = field(default_factory=dict)
+    output_tokens_per_second: float = 0.0
+    sustainable: bool = False
+    sample_error: Optional[str] = None
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def summarize(values: list[float], scale: float = 1.0) -> dict[str, float]:
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50) * scale, 1),
+        "p95": round(percentile(values, 95) * scale, 1),
+        "p99": round(percentile(values, 99) * scale, 1),
+        "max": round(max(values) * scale, 1),
+    }
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def stream_result(started: float, first_token: Optional[float], last_token: Optional[float], tokens: int):
+    latency = time.perf_counter() - started
+    if first_token is None:
+        return RequestResult(latency, ok=False, error="No answer token in the stream")
+    generation = last_token - first_token
+    return RequestResult(
+        latency,
+        ok=True,
+        ttft=first_token - started,
+        tokens=tokens,
+        tokens_per_second=tokens / generation if generation > 0 else None,
+    )
+
+
+async def run_chat_stream(client: httpx.AsyncClient, user: int, iteration: int) -> RequestResult:
+    body = {
+        "messages": [{"role": "user", "content": QUESTIONS[iteration % len(QUESTIONS)]}],
+        "context": {"overrides": {"agent_id": f"{BENCH_AGENT_PREFIX}{user % 10}"}},
+    }
+    started = time.perf_counter()
+    first_token = last_token = None
+    tokens = 0
+    async with client.stream("POST", "/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            return RequestResult(time.perf_counter() - started, ok=False, error=f"HTTP {response.status_code}")
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                return RequestResult(time.perf_counter() - started, ok=False, error=str(event["error"]))
+            content = (event.get("delta") or {}).get("content")
+            if content and "message" not in event:
+                last_token = time.perf_counter()
+                first_token = first_token or last_token
+                tokens += count_tokens(content)
+    return stream_result(started, first_token, last_token, tokens)
+
+
+async def run_agent_chat_stream(client: httpx.AsyncClient, user: int, iteration: int) -> RequestResult:
+    agent_id = f"{BENCH_AGENT_PREFIX}{user % 10}"
+    body = {"message": QUESTIONS[iteration % len(QUESTIONS)], "conversation_id": f"bench-{user}"}
+    started = time.perf_counter()
+    first_token = last_token = None
+    tokens = 0
+    event_type = None
+    async with client.stream("POST", f"/api/agents/{agent_id}/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            return RequestResult(time.perf_counter() - started, ok=False, error=f"HTTP {response.status_code}")
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event_type = line[len("event: ") :]
+            elif line.startswith("data: "):
+                if event_type == "error":
+                    return RequestResult(time.perf_counter() - started, ok=False, error=line[len("data: ") :])
+                if event_type == "content":
+                    last_token = time.perf_counter()
+                    first_token = first_token or last_token
+                    tokens += count_tokens(json.loads(line[len("data: ") :]))
+    return stream_result(started, first_token, last_token, tokens)
+
+
+async def run_upload(client: httpx.AsyncClient, user: int, iteration: int) -> RequestResult:
+    agent_id = f"{BENCH_AGENT_PREFIX}{user % 10}"
+    files = {"files": (f"bench-{user}-{iteration}.txt", UPLOAD_BYTES, "text/plain")}
+    started = time.perf_counter()
+    response = await client.post(f"/api/agents/{agent_id}/documents", files=files)
+    latency = time.perf_counter() - started
+    if response.status_code != 200:
+        return RequestResult(latency, ok=False, error=f"HTTP {response.status_code}")
+    # Failed files are reported in the body of a 200 response
+    errors = [result["error"] for result in response.json() if "error" in result]
+    if errors:
+        return RequestResult(latency, ok=False, error=errors[0])
+    return RequestResult(latency, ok=True)
+
+
+SCENARIO_RUNNERS = {
+    "chat_stream": run_chat_stream,
+    "agent_chat_stream": run_agent_chat_stream,
+    "upload": run_upload,
+}
+
+
+async def run_step(url: str, scenario: str, concurrency: int, duration: float, timeout: float) -> list[RequestResult]:
+    """Run `concurrency` users that send requests back to back for `duration` seconds"""
+    runner = SCENARIO_RUNNERS[scenario]
+    results: list[RequestResult] = []
+    deadline = time.perf_counter() + duration
+
+    async def user(client: httpx.AsyncClient, user_id: int):
+        iteration = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                results.append(await runner(client, user_id, iteration))
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                results.append(RequestResult(time.perf_counter() - started, ok=False, error=repr(e)))
+            iteration += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {BENCH_USER_TOKEN}"}
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(user(client, user_id) for user_id in range(concurrency)))
+    return results
+
+
+def step_report(
+    scenario: str, concurrency: int, results: list[RequestResult], elapsed: float, args: argparse.Namespace
+) -> StepReport:
+    successes = [result for result in results if result.ok]
+    errors = [result for result in results if not result.ok]
+    report = StepReport(
+        concurrency=concurrency,
+        requests=len(results),
+        errors=len(errors),
+        error_rate=round(len(errors) / len(results), 4) if results else 1.0,
+        throughput_rps=round(len(results) / elapsed, 2),
+        latency_ms=summarize([result.latency for result in successes], 1000),
+        sample_error=errors[0].error if errors else None,
+    )
+    if scenario in STREAMING_SCENARIOS:
+        report.ttft_ms = summarize([result.ttft for result in successes], 1000)
+        report.tokens_per_second = summarize([r.tokens_per_second for r in successes if r.tokens_per_second])
+        report.output_tokens_per_second = round(sum(result.tokens for result in successes) / elapsed, 1)
+        within_objective = bool(report.ttft_ms) and report.ttft_ms["p95"] <= args.slo_ttft_p95_ms
+    else:
+        within_objective = bool(report.latency_ms) and report.latency_ms["p95"] <= args.slo_latency_p95_ms
+    report.sustainable = within_objective and report.error_rate <= args.max_error_rate
+    return report
+
+
+async def run_scenario(url: str, scenario: str, args: argparse.Namespace) -> dict:
+    steps = []
+    max_sustainable = 0
+    for concurrency in args.concurrency:
+        started = time.perf_counter()
+        results = await run_step(url, scenario, concurrency, args.duration, args.timeout)
+        report = step_report(scenario, concurrency, results, time.perf_counter() - started, args)
+        steps.append(asdict(report))
+        print(
+            f"{scenario:>18} x{concurrency:<3} {report.requests:>5} req  "
+            f"p95 latency {report.latency_ms.get('p95', '-')} ms  p95 ttft {report.ttft_ms.get('p95', '-')} ms  "
+            f"errors {report.error_rate:.1%}  {'ok' if report.sustainable else 'over objectives'}",
+            file=sys.stderr,
+        )
+        if not report.sustainable:
+            break
+        max_sustainable = concurrency
+    return {"max_sustainable_concurrency": max_sustainable, "steps": steps}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The fake server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The fake server did not become healthy within {timeout}s")
+
+
+def parse_levels(value: str) -> list[int]:
+    return [int(level) for level in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the FastAPI backend against in-process fakes.")
+    parser.add_argument("--url", help="Test an already running server instead of starting the fake server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, among {SCENARIOS}")
+    parser.add_argument("--concurrency", type=parse_levels, default=[1, 2, 4, 8, 16, 32], help="Levels to run")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout of a single request in seconds")
+    parser.add_argument("--slo-ttft-p95-ms", type=float, default=2000, help="Objective for streaming scenarios")
+    parser.add_argument("--slo-latency-p95-ms", type=float, default=5000, help="Objective for other scenarios")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--fail-below", type=int, default=0, help="Exit with 1 if a scenario sustains less")
+    parser.add_argument("--output", help="File to write the JSON report to (defaults to stdout)")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, str(Path(__file__).with_name("fakeserver.py")), "--port", str(port)]
+            + fake_arguments(fake_config_from_args(args)),
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        if server is not None:
+            wait_until_healthy(url, server)
+        results = {scenario: asyncio.run(run_scenario(url, scenario, args)) for scenario in scenarios}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "target": args.url or "fake server (1 uvicorn worker)",
+        "fakes": None if args.url else asdict(fake_config_from_args(args)),
+        "objectives": {
+            "ttft_p95_ms": args.slo_ttft_p95_ms,
+            "latency_p95_ms": args.slo_latency_p95_ms,
+            "max_error_rate": args.max_error_rate,
+        },
+        "duration_per_level_s": args.duration,
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2) + "\n"
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+    else:
+        print(output, end="")
+
+    failing = [name for name, result in results.items() if result["max_sustainable_concurrency"] < args.fail_below]
+    if failing:
+        print(f"Below {args.fail_below} concurrent users: {', '.join(failing)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
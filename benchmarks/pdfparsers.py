@@ -0,0 +1,98 @@
+"""
+Compare the local PDF parsers of prepdocslib on the PDFs in data/.
+
+Parses every PDF with LocalPdfParser (pypdf) and PyMuPdfParser, with one process and optionally
+with a process pool, and reports the best time of each parser per file and the speedup over pypdf.
+
+Usage:
+    python benchmarks/pdfparsers.py --output benchmarks/results/pdfparsers.txt
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / "app" / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from prepdocslib.page import Page  # noqa: E402
+from prepdocslib.parser import Parser  # noqa: E402
+from prepdocslib.pdfparser import LocalPdfParser, PyMuPdfParser  # noqa: E402
+
+
+async def parse(parser: Parser, path: Path, data: bytes) -> list[Page]:
+    content = io.BytesIO(data)
+    content.name = path.name
+    return [page async for page in parser.parse(content)]
+
+
+def best_time(parser: Parser, path: Path, data: bytes, runs: int) -> tuple[float, list[Page]]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        pages = asyncio.run(parse(parser, path, data))
+        timings.append(time.perf_counter() - started)
+    return min(timings), pages
+
+
+def format_report(paths: list[Path], parsers: dict[str, Parser], runs: int) -> str:
+    names = list(parsers)
+    lines = [
+        f"Local PDF parsers on {len(paths)} files (best of {runs} runs, {os.cpu_count()} CPUs, "
+        f"Python {sys.version.split()[0]})",
+        "",
+        f"{'file':45} {'pages':>5} " + " ".join(f"{name:>16}" for name in names) + "  speedup",
+    ]
+    totals = dict.fromkeys(names, 0.0)
+    for path in paths:
+        data = path.read_bytes()
+        timings = {}
+        for name, parser in parsers.items():
+            timings[name], pages = best_time(parser, path, data, runs)
+            totals[name] += timings[name]
+        speedup = timings[names[0]] / min(timings[name] for name in names[1:])
+        lines.append(
+            f"{path.name:45} {len(pages):5} "
+            + " ".join(f"{timings[name] * 1000:13.0f} ms" for name in names)
+            + f"  {speedup:6.1f}x"
+        )
+    speedup = totals[names[0]] / min(totals[name] for name in names[1:])
+    lines.append(
+        f"{'total':45} {'':5} " + " ".join(f"{totals[name] * 1000:13.0f} ms" for name in names) + f"  {speedup:6.1f}x"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the local PDF parsers on the PDFs in data/.")
+    parser.add_argument("--data", default=str(ROOT_DIR / "data"), help="Folder of the PDFs to parse")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs per parser and file")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes of the parallel PyMuPDF parser, 1 to leave it out",
+    )
+    parser.add_argument("--output", help="File to write the report to (defaults to stdout)")
+    args = parser.parse_args()
+
+    parsers: dict[str, Parser] = {"pypdf": LocalPdfParser(), "pymupdf": PyMuPdfParser()}
+    if args.processes > 1:
+        parsers[f"pymupdf x{args.processes}"] = PyMuPdfParser(processes=args.processes, parallel_min_pages=1)
+    paths = sorted(Path(args.data).glob("**/*.pdf"))
+
+    report = format_report(paths, parsers, args.runs)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(report)
+    else:
+        print(report, end="")
+
+
+if __name__ == "__main__":
+    main()
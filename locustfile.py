@@ -1,8 +1,38 @@
+import itertools
+import json
+import os
 import random
 import time
+from pathlib import Path
+from typing import Optional
 
 from locust import HttpUser, between, task
 
+DEFAULT_QUESTIONS = [
+    "What is included in my Northwind Health Plus plan that is not in standard?",
+    "What does a Product Manager do?",
+    "What happens in a performance review?",
+    "Whats your whistleblower policy?",
+]
+
+
+def load_questions() -> list[str]:
+    """
+    Questions to replay, from the file in LOCUST_QUESTIONS if set: either JSONL with a "question"
+    field per line (like evals/ground_truth.jsonl) or plain text with one question per line.
+    """
+    path = os.getenv("LOCUST_QUESTIONS")
+    if not path:
+        return DEFAULT_QUESTIONS
+    lines = [line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+
+# Shared by all users so the corpus is replayed in order
+questions = itertools.cycle(load_questions())
+
 
 class ChatUser(HttpUser):
     wait_time = between(5, 20)
@@ -14,14 +44,7 @@ class ChatUser(HttpUser):
             name="home",
         )
         time.sleep(self.wait_time())
-        first_question = random.choice(
-            [
-                "What is included in my Northwind Health Plus plan that is not in standard?",
-                "What does a Product Manager do?",
-                "What happens in a performance review?",
-                "Whats your whistleblower policy?",
-            ]
-        )
+        first_question = random.choice(DEFAULT_QUESTIONS)
 
         response = self.client.post(
             "/chat",
@@ -72,3 +95,120 @@ class ChatUser(HttpUser):
                 },
             },
         )
+
+
+class StreamingUser(HttpUser):
+    """
+    Base class of the users of the streaming chat endpoints. Besides the request itself, each stream
+    reports custom entries to the locust statistics, named after the request:
+    - "<name> ttfb": time until the response headers are received
+    - "<name> first delta": time until the first answer content is received
+    - "<name> chunk gap": time between two consecutive answer contents, reported for each gap
+    - "<name> tokens": the whole stream, with its answer length in tokens (words) as response size
+    """
+
+    abstract = True
+    wait_time = between(5, 20)
+
+    def record(self, name: str, response_time: float, response_length: int = 0):
+        self.environment.events.request.fire(
+            request_type="STREAM",
+            name=name,
+            response_time=response_time * 1000,
+            response_length=response_length,
+            exception=None,
+            context={},
+        )
+
+    def content_deltas(self, response) -> list[str]:
+        """Answer contents of each line of the stream, empty for lines without answer content"""
+        raise NotImplementedError
+
+    def stream(self, path: str, name: str, body: dict, headers: Optional[dict] = None):
+        started = time.perf_counter()
+        with self.client.post(
+            path, name=name, json=body, headers=headers, stream=True, catch_response=True
+        ) as response:
+            self.record(f"{name} ttfb", time.perf_counter() - started)
+            if response.status_code != 200:
+                response.failure(f"HTTP {response.status_code}")
+                return
+            last_delta = None
+            tokens = 0
+            try:
+                for delta in self.content_deltas(response):
+                    if not delta:
+                        continue
+                    now = time.perf_counter()
+                    if last_delta is None:
+                        self.record(f"{name} first delta", now - started)
+                    else:
+                        self.record(f"{name} chunk gap", now - last_delta)
+                    last_delta = now
+                    tokens += len(delta.split())
+            except (ValueError, KeyError) as e:
+                response.failure(f"Invalid stream: {e}")
+                return
+            if last_delta is None:
+                response.failure("No answer content in the stream")
+                return
+            self.record(f"{name} tokens", time.perf_counter() - started, tokens)
+            response.success()
+
+
+class ChatStreamUser(StreamingUser):
+    """
+    Streams answers from /chat/stream (NDJSON), as served by the Quart app and by the FastAPI app.
+    Set LOCUST_AGENT_ID to chat with an agent of the FastAPI app.
+    """
+
+    def content_deltas(self, response):
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                raise ValueError(event["error"])
+            # The final frame of the FastAPI app repeats the full message with an empty delta
+            yield (event.get("delta") or {}).get("content") or ""
+
+    @task
+    def ask_question(self):
+        overrides = {"retrieval_mode": "hybrid", "semantic_ranker": True, "top": 3}
+        if agent_id := os.getenv("LOCUST_AGENT_ID"):
+            overrides["agent_id"] = agent_id
+        self.stream(
+            "/chat/stream",
+            name="chat stream",
+            body={
+                "messages": [{"content": next(questions), "role": "user"}],
+                "context": {"overrides": overrides},
+            },
+        )
+
+
+class AgentChatStreamUser(StreamingUser):
+    """
+    Streams answers from /api/agents/{agent_id}/chat/stream (SSE) of the FastAPI app.
+    LOCUST_AGENT_ID and LOCUST_AUTH_TOKEN default to the agent and token of benchmarks/fakeserver.py.
+    """
+
+    def content_deltas(self, response):
+        event_type = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event_type = line[len("event: ") :]
+            elif line.startswith("data: "):
+                if event_type == "error":
+                    raise ValueError(line[len("data: ") :])
+                yield json.loads(line[len("data: ") :]) if event_type == "content" else ""
+
+    @task
+    def ask_question(self):
+        agent_id = os.getenv("LOCUST_AGENT_ID", "bench-agent-0")
+        self.stream(
+            f"/api/agents/{agent_id}/chat/stream",
+            name="agent chat stream",
+            body={"message": next(questions)},
+            headers={"Authorization": f"Bearer {os.getenv('LOCUST_AUTH_TOKEN', 'bench-admin')}"},
+        )
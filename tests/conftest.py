@@ -511,6 +511,7 @@ def mock_env(monkeypatch, request):
         monkeypatch.setenv("AZURE_SPEECH_SERVICE_LOCATION", "eastus")
         monkeypatch.setenv("AZURE_OPENAI_CHATGPT_MODEL", "gpt-4.1-mini")
         monkeypatch.setenv("ALLOWED_ORIGIN", "https://frontend.com")
+        monkeypatch.setenv("METRICS_TOKEN", "test-metrics-token")
         for key, value in request.param.items():
             monkeypatch.setenv(key, value)
         if os.getenv("AZURE_USE_AUTHENTICATION") is not None:
@@ -653,6 +654,45 @@ async def client(
         yield test_app.test_client()
 
 
+@pytest_asyncio.fixture(scope="function")
+async def server_timing_client(
+    monkeypatch,
+    mock_env,
+    mock_openai_chatcompletion,
+    mock_openai_embedding,
+    mock_acs_search,
+    mock_blob_container_client,
+    mock_azurehttp_calls,
+):
+    monkeypatch.setenv("ENABLE_SERVER_TIMING", "true")
+    quart_app = app.create_app()
+
+    async with quart_app.test_app() as test_app:
+        test_app.app.config.update({"TESTING": True})
+        mock_openai_chatcompletion(test_app.app.config[app.CONFIG_OPENAI_CLIENT])
+        mock_openai_embedding(test_app.app.config[app.CONFIG_OPENAI_CLIENT])
+        yield test_app.test_client()
+
+
+@pytest_asyncio.fixture(scope="function")
+async def debug_client(
+    monkeypatch,
+    mock_env,
+    mock_openai_chatcompletion,
+    mock_openai_embedding,
+    mock_acs_search,
+    mock_blob_container_client,
+    mock_azurehttp_calls,
+):
+    monkeypatch.setenv("ENABLE_DEBUG_ENDPOINTS", "true")
+    monkeypatch.setenv("ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS", "true")
+    quart_app = app.create_app()
+
+    async with quart_app.test_app() as test_app:
+        test_app.app.config.update({"TESTING": True})
+        yield test_app.test_client()
+
+
 @pytest_asyncio.fixture(scope="function")
 async def reasoning_client(
     monkeypatch,
@@ -1,6 +1,7 @@
 import json
 import os
 from collections import namedtuple
+from datetime import datetime, timezone
 from io import BytesIO
 from typing import Optional
 
@@ -65,19 +66,32 @@ class MockAzureCredentialExpired(AsyncTokenCredential):
 
 
 class MockBlobClient:
-    async def download_blob(self):
-        return MockBlob()
+    async def download_blob(self, offset: int = 0, length: Optional[int] = None, **kwargs):
+        return MockBlob(offset, length)
+
+    async def get_blob_properties(self):
+        return MockBlob().properties
 
 
 class MockBlob:
-    def __init__(self):
+    def __init__(self, offset: int = 0, length: Optional[int] = None):
         self.properties = BlobProperties(
             name="Financial Market Analysis Report 2023-7.png", content_settings={"content_type": "image/png"}
         )
+        self.properties.size = len(TEST_PNG_BYTES)
+        self.properties.etag = '"0x8DC1234567890AB"'
+        self.properties.last_modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.content = TEST_PNG_BYTES[offset : None if length is None else offset + length]
 
     async def readall(self):
         return TEST_PNG_BYTES
 
+    async def chunks(self):
+        # Two chunks, as the content is streamed in chunks
+        middle = len(self.content) // 2
+        yield self.content[:middle]
+        yield self.content[middle:]
+
     async def readinto(self, buffer: BytesIO):
         buffer.write(b"test")
 
@@ -670,8 +684,11 @@ class MockFileClient:
     def __init__(self, path_name):
         self.path_name = path_name
 
-    async def download_file(self):
-        return MockBlob()
+    async def download_file(self, offset: int = 0, length: Optional[int] = None, **kwargs):
+        return MockBlob(offset, length)
+
+    async def get_file_properties(self):
+        return MockBlob().properties
 
 
 def mock_speak_text_success(self, text):
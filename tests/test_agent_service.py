@@ -0,0 +1,298 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from google.api_core.exceptions import NotFound
+
+from models.agent import Agent, AgentCreate, AgentStatus
+from services.agent_service import AgentService
+
+SERVER_TIMESTAMP = object()
+
+
+def server_timestamps(data: dict) -> dict:
+    now = datetime.now(timezone.utc)
+    return {key: now if value is SERVER_TIMESTAMP else value for key, value in data.items()}
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeReference:
+    """A Firestore document or collection, holding documents by path like the Firestore SDK"""
+
+    def __init__(self, documents: dict, path: str):
+        self.documents = documents
+        self.path = path
+
+    def collection(self, name: str):
+        return FakeReference(self.documents, f"{self.path}/{name}".lstrip("/"))
+
+    document = collection
+
+    async def get(self):
+        return FakeSnapshot(self.documents.get(self.path))
+
+    async def set(self, data: dict):
+        self.documents[self.path] = server_timestamps(data)
+
+    async def update(self, data: dict):
+        if self.path not in self.documents:
+            raise NotFound(f"No document to update: {self.path}")
+        self.documents[self.path].update(server_timestamps(data))
+
+    async def delete(self):
+        self.documents.pop(self.path, None)
+
+    async def stream(self):
+        prefix = f"{self.path}/"
+        for path, data in list(self.documents.items()):
+            if path.startswith(prefix) and "/" not in path[len(prefix) :]:
+                yield FakeSnapshot(data)
+
+
+class FakeStorageService:
+    def __init__(self):
+        self.objects = 250
+        self.buckets_deleted = []
+
+    async def create_bucket(self, bucket_name: str):
+        pass
+
+    async def delete_all_files(self, bucket_name: str, batch_size: int = 100):
+        while self.objects:
+            count = min(batch_size, self.objects)
+            self.objects -= count
+            yield count
+
+    async def delete_bucket(self, bucket_name: str, force: bool = False):
+        self.buckets_deleted.append(bucket_name)
+
+
+class FakeVertexService:
+    def __init__(self):
+        self.error = None
+        self.corpora_deleted = []
+
+    async def create_rag_corpus(self, agent_id: str, name: str) -> str:
+        return f"projects/test/locations/europe-west1/ragCorpora/{agent_id}"
+
+    async def delete_rag_corpus(self, corpus_id: str):
+        if self.error:
+            raise self.error
+        self.corpora_deleted.append(corpus_id)
+
+
+@pytest.fixture
+def agent_service():
+    agent_service = AgentService()
+    agent_service.firestore_client = FakeReference({}, "")
+    agent_service._firestore = SimpleNamespace(SERVER_TIMESTAMP=SERVER_TIMESTAMP)
+    agent_service.storage_service = FakeStorageService()
+    agent_service.vertex_service = FakeVertexService()
+    agent_service._initialized = True
+
+    async def recursive_delete(collection_path: str) -> int:
+        return 2
+
+    agent_service._recursive_delete = recursive_delete
+    return agent_service
+
+
+async def wait_for_teardowns(agent_service: AgentService):
+    await asyncio.gather(*agent_service._teardown_tasks.values())
+
+
+@pytest.mark.asyncio
+async def test_create_and_get_agent(agent_service):
+    created = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+
+    # Agents are stored with camelCase field names, and read back from them
+    record = agent_service.firestore_client.documents[f"agents/{created.id}"]
+    assert record["createdBy"] == "user1"
+    assert record["bucketName"] == created.bucket_name
+    assert record["corpusId"] == created.corpus_id
+    assert record["status"] == "active"
+    assert "created_by" not in record
+
+    agent = await agent_service.get_agent(created.id)
+    assert agent.created_by == "user1"
+    assert agent.bucket_name == created.bucket_name
+    assert agent.corpus_id == created.corpus_id
+    assert agent.status == AgentStatus.ACTIVE
+    assert [agent.id for agent in await agent_service.list_agents()] == [created.id]
+
+    with pytest.raises(ValueError):
+        await agent_service.get_agent("missing")
+
+
+def test_agent_firestore_record():
+    now = datetime.now(timezone.utc)
+    agent = Agent(
+        id="agent1",
+        name="HR",
+        description="HR policies",
+        created_by="user1",
+        created_at=now,
+        updated_at=now,
+        bucket_name="proj-agent-agent1",
+        document_count=3,
+    )
+    assert Agent.from_firestore(agent.to_firestore()) == agent
+
+
+@pytest.mark.asyncio
+async def test_delete_agent_reports_progress(agent_service):
+    agent = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+
+    job = await agent_service.delete_agent(agent.id)
+    assert job["status"] == "running"
+    assert agent_service.firestore_client.documents[f"agents/{agent.id}"]["status"] == "deleting"
+    await wait_for_teardowns(agent_service)
+
+    job = await agent_service.get_teardown_status(agent.id)
+    assert job["status"] == "completed"
+    assert job["objectsDeleted"] == 250
+    assert job["bucketDeleted"] is True
+    assert job["corpusDeleted"] is True
+    assert job["documentsDeleted"] == 2
+    assert job["conversationsDeleted"] == 2
+    assert job["error"] is None
+    assert "completedAt" in job
+    assert agent_service.storage_service.buckets_deleted == [agent.bucket_name]
+    assert agent_service.vertex_service.corpora_deleted == [agent.corpus_id]
+    assert f"agents/{agent.id}" not in agent_service.firestore_client.documents
+
+    # A completed job is not started again
+    assert (await agent_service.retry_teardown(agent.id))["status"] == "completed"
+    assert not agent_service._teardown_tasks
+
+
+@pytest.mark.asyncio
+async def test_delete_agent_twice(agent_service):
+    agent = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+    job_path = f"agentTeardowns/{agent.id}"
+
+    await agent_service.delete_agent(agent.id)
+    task = agent_service._teardown_tasks[agent.id]
+    agent_service.firestore_client.documents[job_path]["objectsDeleted"] = 100
+
+    # A second delete while the teardown runs returns the running job, without resetting it
+    job = await agent_service.delete_agent(agent.id)
+    assert job["status"] == "running"
+    assert job["objectsDeleted"] == 100
+    assert agent_service._teardown_tasks == {agent.id: task}
+
+    await wait_for_teardowns(agent_service)
+    assert not agent_service._teardown_tasks
+    # And once it completed, the completed job
+    job = await agent_service.delete_agent(agent.id)
+    assert job["status"] == "completed"
+    assert not agent_service._teardown_tasks
+
+
+def test_finished_teardown_keeps_newer_task(agent_service):
+    old_task, new_task = object(), object()
+    agent_service._teardown_tasks["agent1"] = new_task
+    agent_service._forget_teardown("agent1", old_task)
+    assert agent_service._teardown_tasks == {"agent1": new_task}
+    agent_service._forget_teardown("agent1", new_task)
+    assert not agent_service._teardown_tasks
+
+
+@pytest.mark.asyncio
+async def test_delete_agent_failure_and_retry(agent_service):
+    agent = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+    agent_service.vertex_service.error = RuntimeError("Vertex AI unavailable")
+
+    await agent_service.delete_agent(agent.id)
+    await wait_for_teardowns(agent_service)
+
+    job = await agent_service.get_teardown_status(agent.id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Vertex AI unavailable"
+    assert job["objectsDeleted"] == 250
+    assert job["bucketDeleted"] is True
+    assert job["corpusDeleted"] is False
+    assert agent_service.firestore_client.documents[f"agents/{agent.id}"]["status"] == "error"
+
+    agent_service.vertex_service.error = None
+    job = await agent_service.retry_teardown(agent.id)
+    assert job["status"] == "running"
+    await wait_for_teardowns(agent_service)
+
+    job = await agent_service.get_teardown_status(agent.id)
+    assert job["status"] == "completed"
+    assert job["error"] is None
+    assert job["objectsDeleted"] == 250
+    assert agent_service.vertex_service.corpora_deleted == [agent.corpus_id]
+    assert f"agents/{agent.id}" not in agent_service.firestore_client.documents
+
+    with pytest.raises(ValueError):
+        await agent_service.retry_teardown("missing")
+
+
+@pytest.mark.asyncio
+async def test_delete_agent_failure_after_agent_deleted(agent_service):
+    agent = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+    documents = agent_service.firestore_client.documents
+
+    class FailingReference(FakeReference):
+        async def update(self, data: dict):
+            if data.get("status") == "completed":
+                raise RuntimeError("Firestore unavailable")
+            await super().update(data)
+
+    job_ref = FailingReference(documents, f"agentTeardowns/{agent.id}")
+    await job_ref.set({"agentId": agent.id, "status": "running"})
+    job = {
+        "agentId": agent.id,
+        "bucketName": agent.bucket_name,
+        "corpusId": agent.corpus_id,
+        "objectsDeleted": 0,
+        "documentsDeleted": 0,
+        "conversationsDeleted": 0,
+    }
+    # The agent is deleted before the job is marked as completed, reporting the failure must not raise
+    await agent_service._teardown_agent(job, job_ref)
+    assert f"agents/{agent.id}" not in documents
+    assert documents[f"agentTeardowns/{agent.id}"]["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_retry_teardown_stuck_job(agent_service):
+    agent = await agent_service.create_agent(AgentCreate(name="HR", description="HR policies"), "user1")
+    documents = agent_service.firestore_client.documents
+    job = {
+        "agentId": agent.id,
+        "bucketName": agent.bucket_name,
+        "corpusId": agent.corpus_id,
+        "status": "running",
+        "objectsDeleted": 100,
+        "bucketDeleted": False,
+        "corpusDeleted": False,
+        "documentsDeleted": 0,
+        "conversationsDeleted": 0,
+        "error": None,
+        "updatedAt": datetime.now(timezone.utc),
+    }
+    documents[f"agentTeardowns/{agent.id}"] = dict(job)
+
+    # A job that still reports progress may be running on another instance
+    await agent_service.retry_teardown(agent.id)
+    assert not agent_service._teardown_tasks
+
+    # One that stopped reporting progress is restarted
+    documents[f"agentTeardowns/{agent.id}"]["updatedAt"] -= timedelta(hours=1)
+    await agent_service.retry_teardown(agent.id)
+    await wait_for_teardowns(agent_service)
+    job = await agent_service.get_teardown_status(agent.id)
+    assert job["status"] == "completed"
+    assert job["objectsDeleted"] == 350
@@ -381,10 +381,10 @@ async def test_chat_request_must_be_json(client):
 async def test_content_file_missing_content_settings(auth_client, monkeypatch):
     blob_manager = auth_client.config[app.CONFIG_GLOBAL_BLOB_MANAGER]
 
-    async def fake_download_blob(_path):
-        return b"data", {}
+    async def fake_get_blob_properties(_path):
+        return {}
 
-    monkeypatch.setattr(blob_manager, "download_blob", fake_download_blob)
+    monkeypatch.setattr(blob_manager, "get_blob_properties", fake_get_blob_properties)
 
     response = await auth_client.get("/content/file.pdf", headers={"Authorization": "Bearer token"})
     assert response.status_code == 404
@@ -943,6 +943,157 @@ async def test_chat_stream_text(client, snapshot):
     snapshot.assert_match(result, "result.jsonlines")
 
 
+METRICS_HEADERS = {"Authorization": "Bearer test-metrics-token"}
+
+
+@pytest.mark.asyncio
+async def test_metrics_requires_token(client):
+    response = await client.get("/metrics")
+    assert response.status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer wrong-token"})
+    assert response.status_code == 401
+
+    # Without a configured token, metrics are not served at all
+    client.app.config[app.CONFIG_METRICS_TOKEN] = None
+    response = await client.get("/metrics", headers=METRICS_HEADERS)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):
+    response = await client.get("/config")
+    assert response.status_code == 200
+    response = await client.get("/metrics", headers=METRICS_HEADERS)
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    result = (await response.get_data()).decode()
+    assert 'rag_request_duration_seconds_count{agent="",endpoint="/config",method="GET",status="200"}' in result
+    assert "rag_streams_in_flight" in result
+
+
+@pytest.mark.asyncio
+async def test_metrics_chat_stream(client):
+    response = await client.post(
+        "/chat/stream",
+        json={
+            "messages": [{"content": "What is the capital of France?", "role": "user"}],
+            "context": {
+                "overrides": {"retrieval_mode": "text"},
+            },
+        },
+    )
+    assert response.status_code == 200
+    await response.get_data()
+    response = await client.get("/metrics", headers=METRICS_HEADERS)
+    result = (await response.get_data()).decode()
+    assert 'rag_time_to_first_token_seconds_count{agent="",endpoint="/chat/stream"}' in result
+    assert 'rag_retrieval_duration_seconds_count{agent="",endpoint="/chat/stream"}' in result
+    assert 'rag_llm_tokens_count{agent="",direction="output",endpoint="/chat/stream"}' in result
+    assert 'rag_streams_in_flight{agent="",endpoint="/chat/stream"} 0.0' in result
+
+
+@pytest.mark.asyncio
+async def test_chat_server_timing(server_timing_client):
+    response = await server_timing_client.post(
+        "/chat",
+        json={
+            "messages": [{"content": "What is the capital of France?", "role": "user"}],
+            "context": {
+                "overrides": {"retrieval_mode": "hybrid"},
+            },
+        },
+    )
+    assert response.status_code == 200
+    server_timing = response.headers["Server-Timing"]
+    for stage in ("auth", "prompt_render", "query_rewrite", "embedding", "search", "answer"):
+        assert f"{stage};dur=" in server_timing
+    result = await response.get_json()
+    assert set(result["context"]["thoughts"][-1]["props"]["stage_timings"]) >= {"query_rewrite", "search"}
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_server_timing(server_timing_client):
+    response = await server_timing_client.post(
+        "/chat/stream",
+        json={
+            "messages": [{"content": "What is the capital of France?", "role": "user"}],
+            "context": {
+                "overrides": {"retrieval_mode": "text"},
+            },
+        },
+    )
+    assert response.status_code == 200
+    lines = (await response.get_data()).decode().splitlines()
+    timings = json.loads(lines[-1])["timings"]
+    assert set(timings) >= {"auth", "query_rewrite", "search", "prompt_render", "first_token"}
+
+
+@pytest.mark.asyncio
+async def test_chat_server_timing_disabled(client):
+    response = await client.post(
+        "/chat",
+        json={
+            "messages": [{"content": "What is the capital of France?", "role": "user"}],
+        },
+    )
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_debug_endpoint_disabled(client):
+    response = await client.get("/debug/loop-lag")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_debug_endpoint_toggle(debug_client):
+    response = await debug_client.get("/debug/loop-lag")
+    assert response.status_code == 200
+    assert (await response.get_json())["enabled"] is False
+
+    response = await debug_client.post("/debug/loop-lag", json={"enabled": True, "threshold_ms": 500})
+    assert response.status_code == 200
+    result = await response.get_json()
+    assert result["enabled"] is True
+    assert result["threshold_ms"] == 500
+
+    response = await debug_client.post("/debug/loop-lag", json={"enabled": False})
+    assert (await response.get_json())["enabled"] is False
+
+    response = await debug_client.post("/debug/loop-lag", json={"threshold_ms": -1})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoints_refused_without_authentication(debug_client):
+    # Without authentication, debug endpoints need ALLOW_UNAUTHENTICATED_DEBUG_ENDPOINTS when running locally
+    debug_client.app.config[app.CONFIG_DEBUG_ALLOW_UNAUTHENTICATED] = False
+    response = await debug_client.get("/debug/loop-lag")
+    assert response.status_code == 403
+    response = await debug_client.get("/debug/profile?seconds=0.1")
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_profile_debug_endpoint_disabled(client):
+    response = await client.get("/debug/profile?seconds=0.1")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_profile_debug_endpoint(debug_client):
+    response = await debug_client.get("/debug/profile?seconds=0.1&interval_ms=5")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert response.headers["Content-Disposition"].startswith("attachment;")
+    result = (await response.get_data()).decode()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in result.splitlines())
+
+    response = await debug_client.get("/debug/profile?seconds=1000")
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_chat_text_reasoning(reasoning_client, snapshot):
     response = await reasoning_client.post(
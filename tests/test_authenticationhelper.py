@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 import re
@@ -277,6 +278,41 @@ async def test_check_path_auth_allowed_fragment(
     assert filter == "(sourcefile eq 'Benefit_Options.pdf') or (sourcepage eq 'Benefit_Options.pdf')"
 
 
+@pytest.mark.asyncio
+async def test_check_path_auth_cached_per_user(
+    monkeypatch, mock_confidential_client_success, mock_validate_token_success
+):
+    auth_helper_enforce_access_control = create_authentication_helper(enforce_access_control=True)
+    searches = []
+
+    async def mock_search(self, *args, **kwargs):
+        searches.append(kwargs.get("x_ms_query_source_authorization"))
+        if kwargs.get("x_ms_query_source_authorization") == "TokenA":
+            return MockAsyncPageIterator(data=[{"sourcefile": "Benefit_Options.pdf"}])
+        return MockAsyncPageIterator(data=[])
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+
+    async def check(oid: str, access_token: str, path: str = "Benefit_Options.pdf") -> bool:
+        return await auth_helper_enforce_access_control.check_path_auth(
+            path=path, auth_claims={"oid": oid, "access_token": access_token}, search_client=create_search_client()
+        )
+
+    # The pages of a document are checked once per user
+    assert await check("OID_A", "TokenA") is True
+    assert await check("OID_A", "TokenA", "Benefit_Options.pdf#page=2") is True
+    assert await check("OID_B", "TokenB") is False
+    assert await check("OID_B", "TokenB") is False
+    assert searches == ["TokenA", "TokenB"]
+
+    # Until the results expire
+    auth_helper_enforce_access_control.path_auth_cache = {
+        key: (0, allowed) for key, (_, allowed) in auth_helper_enforce_access_control.path_auth_cache.items()
+    }
+    assert await check("OID_A", "TokenA") is True
+    assert searches == ["TokenA", "TokenB", "TokenA"]
+
+
 @pytest.mark.asyncio
 async def test_check_path_auth_allowed_without_access_control(
     monkeypatch, mock_confidential_client_success, mock_validate_token_success
@@ -439,3 +475,87 @@ async def test_validate_access_token(monkeypatch, mock_confidential_client_succe
 
     helper = create_authentication_helper()
     await helper.validate_access_token(mock_token)
+
+
+def create_jwk(public_key, kid):
+    def encode(number: int) -> str:
+        return (
+            base64.urlsafe_b64encode(number.to_bytes((number.bit_length() + 7) // 8, byteorder="big"))
+            .decode()
+            .rstrip("=")
+        )
+
+    numbers = public_key.public_numbers()
+    return {"kty": "RSA", "kid": kid, "use": "sig", "n": encode(numbers.n), "e": encode(numbers.e)}
+
+
+@pytest.mark.asyncio
+async def test_validate_access_token_caches_keys_and_tokens(monkeypatch, mock_confidential_client_success):
+    token, public_key, _ = create_mock_jwt(kid="mock_kid", oid="OID_X")
+    other_token, other_public_key, _ = create_mock_jwt(kid="mock_kid", oid="OID_Y")
+    jwks = {"keys": [create_jwk(public_key, "mock_kid")]}
+    fetches = []
+
+    def mock_get(*args, **kwargs):
+        fetches.append(kwargs["url"])
+        return MockResponse(status=200, text=json.dumps(jwks), headers={"Cache-Control": "max-age=86400, private"})
+
+    monkeypatch.setattr(aiohttp.ClientSession, "get", mock_get)
+    decode = jwt.decode
+    verified = []
+
+    def mock_decode(*args, **kwargs):
+        if "options" not in kwargs:
+            verified.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", mock_decode)
+
+    helper = create_authentication_helper()
+    await helper.validate_access_token(token)
+    await helper.validate_access_token(token)
+    # The keys are downloaded once, as the response says they can be kept for a day
+    assert fetches == ["https://login.microsoftonline.com/TENANT_ID/discovery/v2.0/keys"]
+    assert helper.jwks_expires - helper.jwks_fetched == pytest.approx(86400)
+    assert list(helper.public_keys) == ["mock_kid"]
+    # And a token already validated is not checked again
+    assert verified == [token]
+
+    # A token signed with another key of the same ID doesn't validate
+    with pytest.raises(AuthError):
+        await helper.validate_access_token(other_token)
+    assert len(fetches) == 1
+
+
+@pytest.mark.asyncio
+async def test_validate_access_token_refreshes_keys_once_for_unknown_kid(monkeypatch, mock_confidential_client_success):
+    token, public_key, _ = create_mock_jwt(kid="old_kid")
+    new_token, new_public_key, _ = create_mock_jwt(kid="new_kid")
+    jwks = {"keys": [create_jwk(public_key, "old_kid")]}
+    fetches = 0
+
+    def mock_get(*args, **kwargs):
+        nonlocal fetches
+        fetches += 1
+        return MockResponse(status=200, text=json.dumps(jwks))
+
+    monkeypatch.setattr(aiohttp.ClientSession, "get", mock_get)
+
+    helper = create_authentication_helper()
+    await helper.validate_access_token(token)
+    assert fetches == 1
+    assert helper.jwks_expires - helper.jwks_fetched == pytest.approx(AuthenticationHelper.JWKS_DEFAULT_MAX_AGE)
+
+    # The keys were rotated: concurrent requests with a token signed by the new key download them again once
+    jwks = {"keys": [create_jwk(new_public_key, "new_kid")]}
+    helper.jwks_fetched -= AuthenticationHelper.JWKS_MIN_REFRESH_INTERVAL
+    await asyncio.gather(*(helper.validate_access_token(new_token) for _ in range(3)))
+    assert fetches == 2
+    # The public key of the removed signing key is forgotten
+    assert list(helper.public_keys) == ["new_kid"]
+
+    # Tokens naming unknown keys don't download the keys again right away
+    unknown_token, _, _ = create_mock_jwt(kid="unknown_kid")
+    with pytest.raises(AuthError):
+        await helper.validate_access_token(unknown_token)
+    assert fetches == 2
@@ -1,19 +1,32 @@
+import io
 import os
+import pathlib
 import sys
+import zlib
 from tempfile import NamedTemporaryFile
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import azure.storage.blob.aio
 import azure.storage.filedatalake.aio
 import pytest
+from azure.core.exceptions import ResourceNotFoundError
+from PIL import Image, ImageChops
 
 # The pythonpath is configured in pyproject.toml to include app/backend
-from prepdocslib.blobmanager import AdlsBlobManager, BlobManager
+from prepdocslib.blobmanager import (
+    PNG_SIGNATURE,
+    AdlsBlobManager,
+    BlobManager,
+    ExistenceCache,
+    png_chunk,
+    read_rgb_png,
+)
 from prepdocslib.listfilestrategy import File
 
 from .mocks import MockAzureCredential
 
 WINDOWS = sys.platform.startswith("win")
+TEST_DATA_DIR = pathlib.Path(__file__).parent / "test-data"
 
 
 @pytest.fixture
@@ -301,6 +314,62 @@ def test_blob_name_from_file_name():
     assert BlobManager.blob_name_from_file_name("tmp/test.html") == "test.html"
 
 
+def png_image_data(png: bytes) -> bytes:
+    image_data, position = b"", 8
+    while position < len(png):
+        length = int.from_bytes(png[position : position + 4], "big")
+        if png[position + 4 : position + 8] == b"IDAT":
+            image_data += png[position + 8 : position + 8 + length]
+        position += 12 + length
+    return image_data
+
+
+def test_add_image_citation_without_reencoding():
+    image_bytes = (TEST_DATA_DIR / "Financial Market Analysis Report 2023_page2_figure.png").read_bytes()
+    assert read_rgb_png(image_bytes) is not None
+
+    stamped = BlobManager.add_image_citation(
+        image_bytes, "Financial Market Analysis Report 2023.pdf", "figure2_1.png", 1
+    )
+    reencoded = BlobManager.add_image_citation(
+        image_bytes, "Financial Market Analysis Report 2023.pdf", "figure2_1.png", 1, reencode=True
+    )
+
+    # The original image data is reused as is, behind the citation rows
+    assert png_image_data(image_bytes)[2:-4] in png_image_data(stamped)
+    # The checksum of the combined image data is valid
+    zlib.decompress(png_image_data(stamped))
+    stamped_image, reencoded_image = Image.open(io.BytesIO(stamped)), Image.open(io.BytesIO(reencoded))
+    assert stamped_image.size == reencoded_image.size == (1221, 1190)
+    assert ImageChops.difference(stamped_image.convert("RGB"), reencoded_image).getbbox() is None
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "L", "P"])
+def test_add_image_citation_reencodes_other_images(mode):
+    image = Image.new("RGB", (50, 20), "red").convert(mode)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    assert read_rgb_png(output.getvalue()) is None
+
+    stamped = Image.open(io.BytesIO(BlobManager.add_image_citation(output.getvalue(), "test.pdf", "figure1_1.png", 0)))
+    assert stamped.size == (50, 80)
+    assert stamped.getpixel((25, 70)) == image.convert("RGB").getpixel((25, 10))
+
+
+def test_add_image_citation_reencodes_png_filtered_on_the_row_above():
+    # Every row uses the Up filter: the first row holds the red pixels, the next ones repeat the row above
+    raw = b"\x02" + b"\xff\x00\x00" * 50 + (b"\x02" + b"\x00" * 150) * 19
+    header = (50).to_bytes(4, "big") + (20).to_bytes(4, "big") + bytes([8, 2, 0, 0, 0])
+    image_bytes = (
+        PNG_SIGNATURE + png_chunk(b"IHDR", header) + png_chunk(b"IDAT", zlib.compress(raw)) + png_chunk(b"IEND", b"")
+    )
+    assert read_rgb_png(image_bytes) is None
+
+    stamped = Image.open(io.BytesIO(BlobManager.add_image_citation(image_bytes, "test.pdf", "figure1_1.png", 0)))
+    assert stamped.size == (50, 80)
+    assert stamped.getpixel((25, 60)) == (255, 0, 0)
+
+
 @pytest.mark.asyncio
 async def test_download_blob(monkeypatch, mock_env, mock_blob_container_client_exists, blob_manager):
     # Mock the download_blob method
@@ -349,6 +418,46 @@ async def test_download_blob_not_found(monkeypatch, mock_env, mock_blob_containe
     assert result is None
 
 
+@pytest.mark.asyncio
+async def test_download_blob_not_found_keeps_container(monkeypatch, mock_env, blob_manager):
+    exists = AsyncMock(return_value=True)
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.exists", exists)
+    blob_not_found = ResourceNotFoundError("Blob not found")
+    blob_not_found.error_code = "BlobNotFound"
+    container_not_found = ResourceNotFoundError("Container not found")
+    container_not_found.error_code = "ContainerNotFound"
+    download_blob = AsyncMock(side_effect=[blob_not_found, blob_not_found, container_not_found])
+    monkeypatch.setattr("azure.storage.blob.aio.BlobClient.download_blob", download_blob)
+
+    # A missing blob doesn't mean the container is missing
+    assert await blob_manager.download_blob("nonexistent.pdf") is None
+    assert await blob_manager.download_blob("nonexistent.pdf") is None
+    assert exists.await_count == 1
+
+    # Once the container is gone, it is checked again
+    assert await blob_manager.download_blob("nonexistent.pdf") is None
+    assert blob_manager.containers.get(blob_manager.container) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_get_blob_properties_not_found_keeps_container(monkeypatch, mock_env, blob_manager):
+    exists = AsyncMock(return_value=True)
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.exists", exists)
+    blob_not_found = ResourceNotFoundError("Blob not found")
+    blob_not_found.error_code = "BlobNotFound"
+    container_not_found = ResourceNotFoundError("Container not found")
+    container_not_found.error_code = "ContainerNotFound"
+    get_blob_properties = AsyncMock(side_effect=[blob_not_found, blob_not_found, container_not_found])
+    monkeypatch.setattr("azure.storage.blob.aio.BlobClient.get_blob_properties", get_blob_properties)
+
+    assert await blob_manager.get_blob_properties("nonexistent.pdf") is None
+    assert await blob_manager.get_blob_properties("nonexistent.pdf") is None
+    assert exists.await_count == 1
+
+    assert await blob_manager.get_blob_properties("nonexistent.pdf") is None
+    assert blob_manager.containers.get(blob_manager.container) == (False, None)
+
+
 @pytest.mark.asyncio
 async def test_download_blob_container_not_exist(
     monkeypatch, mock_env, mock_blob_container_client_does_not_exist, blob_manager
@@ -425,3 +534,105 @@ async def test_adls_download_blob_with_permission(
 
     assert content.startswith(b"\x89PNG\r\n\x1a\n")
     assert properties["content_settings"]["content_type"] == "application/octet-stream"
+
+
+def test_existence_cache(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("prepdocslib.blobmanager.time.monotonic", lambda: now)
+    cache = ExistenceCache(ttl=60)
+    cache.add("user", "user")
+    cache.add("user/images/doc.pdf", "user")
+    cache.add("user/images/doc.pdf/page_1", "user")
+    cache.add("user/images/doc.pdf2", "user")
+    assert cache.get("user") == (True, "user")
+    assert cache.get("other") == (False, None)
+
+    # Forgetting a directory forgets the directories below it
+    cache.discard("user/images/doc.pdf")
+    assert cache.get("user/images/doc.pdf/page_1") == (False, None)
+    assert cache.get("user/images/doc.pdf2") == (True, "user")
+
+    now += 61
+    assert cache.get("user") == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_adls_ensure_directory_is_cached(adls_blob_manager):
+    directory_client = MagicMock()
+    directory_client.get_directory_properties = AsyncMock()
+    directory_client.get_access_control = AsyncMock(return_value={"owner": "OID_X"})
+    adls_blob_manager.file_system_client.get_directory_client = MagicMock(return_value=directory_client)
+
+    await adls_blob_manager._ensure_directory("OID_X", "OID_X")
+    await adls_blob_manager._ensure_directory("OID_X", "OID_X")
+    # The owner is remembered too, so other users are still denied
+    with pytest.raises(PermissionError):
+        await adls_blob_manager._ensure_directory("OID_X", "OID_Y")
+
+    directory_client.get_directory_properties.assert_awaited_once()
+    directory_client.get_access_control.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_adls_download_blob_checks_directory_again_when_gone(adls_blob_manager):
+    directory_client = MagicMock()
+    directory_client.get_directory_properties = AsyncMock()
+    directory_client.get_access_control = AsyncMock(return_value={"owner": "OID_X"})
+    download = MagicMock()
+    download.readall = AsyncMock(return_value=b"image")
+    download.properties = {"content_type": "image/png"}
+    file_client = MagicMock()
+    file_client.download_file = AsyncMock(side_effect=[download, ResourceNotFoundError(), download])
+    directory_client.get_file_client.return_value = file_client
+    adls_blob_manager.file_system_client.get_directory_client = MagicMock(return_value=directory_client)
+
+    assert (await adls_blob_manager.download_blob("OID_X/images/doc.pdf/figure.png", "OID_X"))[0] == b"image"
+    # The directory was remembered but the file is gone, so the directory is checked again before retrying
+    assert (await adls_blob_manager.download_blob("OID_X/images/doc.pdf/figure.png", "OID_X"))[0] == b"image"
+    assert directory_client.get_directory_properties.await_count == 2
+    assert file_client.download_file.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_adls_remove_blob_forgets_image_directory(adls_blob_manager):
+    directory_client = MagicMock()
+    directory_client.get_directory_properties = AsyncMock()
+    directory_client.get_access_control = AsyncMock(return_value={"owner": "OID_X"})
+    directory_client.delete_directory = AsyncMock()
+    directory_client.get_file_client.return_value.delete_file = AsyncMock()
+    adls_blob_manager.file_system_client.get_directory_client = MagicMock(return_value=directory_client)
+    adls_blob_manager.directories.add("OID_X/images/doc.pdf/page_0", "OID_X")
+
+    await adls_blob_manager.remove_blob("doc.pdf", "OID_X")
+
+    assert adls_blob_manager.directories.get("OID_X") == (True, "OID_X")
+    assert adls_blob_manager.directories.get("OID_X/images/doc.pdf") == (False, None)
+    assert adls_blob_manager.directories.get("OID_X/images/doc.pdf/page_0") == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_upload_document_image_checks_container_once(monkeypatch, mock_env):
+    blob_manager = BlobManager(
+        endpoint=f"https://{os.environ['AZURE_STORAGE_ACCOUNT']}.blob.core.windows.net",
+        credential=MockAzureCredential(),
+        container=os.environ["AZURE_STORAGE_CONTAINER"],
+        image_container="test-image-container",
+    )
+    exists = AsyncMock(return_value=True)
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.exists", exists)
+    blob_client = MagicMock(url="https://test.blob.core.windows.net/test-image-container/figure.png")
+    upload_blob = AsyncMock(side_effect=[blob_client, ResourceNotFoundError(), blob_client])
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.upload_blob", upload_blob)
+    create_container = AsyncMock()
+    monkeypatch.setattr("azure.storage.blob.aio.ContainerClient.create_container", create_container)
+    monkeypatch.setattr(BlobManager, "add_image_citation", lambda *args: b"image")
+
+    await blob_manager.upload_document_image("doc.pdf", b"image", "figure.png", 0)
+    assert exists.await_count == 1
+
+    # The container was deleted since: it is checked again, created, and the upload retried
+    exists.return_value = False
+    await blob_manager.upload_document_image("doc.pdf", b"image", "figure.png", 0)
+    assert exists.await_count == 2
+    create_container.assert_awaited_once()
+    assert upload_blob.await_count == 3
@@ -1,10 +1,14 @@
 import json
+import sqlite3
+from types import SimpleNamespace
 
 import pytest
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.aio import SearchClient
 from azure.search.documents.models import VectorizedQuery
+from openai.types import CreateEmbeddingResponse, Embedding
 from openai.types.chat import ChatCompletion
+from openai.types.create_embedding_response import Usage
 
 from approaches.approach import (
     ActivityDetail,
@@ -17,6 +21,7 @@ from approaches.approach import (
 )
 from approaches.chatreadretrieveread import ChatReadRetrieveReadApproach
 from approaches.promptmanager import PromptyManager
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings
 
 from .mocks import (
@@ -308,6 +313,63 @@ async def test_compute_multimodal_embedding_no_client():
         await chat_approach.compute_multimodal_embedding("What's in this image?")
 
 
+@pytest.mark.asyncio
+async def test_compute_text_embedding_uses_cache(chat_approach, tmp_path):
+    calls = []
+
+    class MockEmbeddingsClient:
+        async def create(self, *args, **kwargs):
+            calls.append(kwargs["input"])
+            return CreateEmbeddingResponse(
+                object="list",
+                data=[Embedding(embedding=[0.5, 0.25], index=0, object="embedding")],
+                model=MOCK_EMBEDDING_MODEL_NAME,
+                usage=Usage(prompt_tokens=1, total_tokens=1),
+            )
+
+    chat_approach.openai_client = SimpleNamespace(embeddings=MockEmbeddingsClient())
+    chat_approach.embedding_cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+
+    first = await chat_approach.compute_text_embedding("What is included in my plan?")
+    second = await chat_approach.compute_text_embedding("What is included in my plan?")
+
+    assert first.vector == second.vector == [0.5, 0.25]
+    assert second.fields == "embedding3"
+    assert calls == ["What is included in my plan?"]
+    chat_approach.embedding_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_compute_text_embedding_cache_errors(chat_approach, tmp_path):
+    calls = []
+
+    class MockEmbeddingsClient:
+        async def create(self, *args, **kwargs):
+            calls.append(kwargs["input"])
+            return CreateEmbeddingResponse(
+                object="list",
+                data=[Embedding(embedding=[0.5, 0.25], index=0, object="embedding")],
+                model=MOCK_EMBEDDING_MODEL_NAME,
+                usage=Usage(prompt_tokens=1, total_tokens=1),
+            )
+
+    class LockedEmbeddingCache(EmbeddingCache):
+        def get_many(self, keys):
+            raise sqlite3.OperationalError("database is locked")
+
+        def put_many(self, items):
+            raise sqlite3.OperationalError("database is locked")
+
+    chat_approach.openai_client = SimpleNamespace(embeddings=MockEmbeddingsClient())
+    chat_approach.embedding_cache = LockedEmbeddingCache(str(tmp_path / "cache.sqlite"))
+
+    # The query is embedded by the API when the cache can't be read nor written
+    result = await chat_approach.compute_text_embedding("What is included in my plan?")
+    assert result.vector == [0.5, 0.25]
+    assert calls == ["What is included in my plan?"]
+    chat_approach.embedding_cache.close()
+
+
 @pytest.mark.asyncio
 async def test_chat_prompt_render_with_image_directive(chat_approach):
     """Verify DocFX style :::image directive is sanitized (replaced with [image]) during prompt rendering."""
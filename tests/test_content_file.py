@@ -14,10 +14,12 @@ from azure.storage.blob.aio import BlobServiceClient
 import app
 
 from .mocks import (
+    TEST_PNG_BYTES,
     MockAiohttpClientResponse,
     MockAiohttpClientResponse404,
     MockAzureCredential,
     MockBlob,
+    MockBlobClient,
 )
 
 
@@ -36,8 +38,10 @@ async def test_content_file(monkeypatch, mock_env, mock_acs_search, mock_blob_co
                         b"test content",
                         {
                             "Content-Type": "application/octet-stream",
-                            "Content-Range": "bytes 0-27/28",
-                            "Content-Length": "28",
+                            "Content-Range": "bytes 0-11/12",
+                            "Content-Length": "12",
+                            "ETag": '"0x8DC1234567890AB"',
+                            "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
                         },
                     ),
                 )
@@ -86,7 +90,7 @@ async def test_content_file_useruploaded_found(
 ):
     # We need to mock our the global blob and container client since the /content path checks that first!
     class MockBlobClient:
-        async def download_blob(self):
+        async def get_blob_properties(self):
             raise ResourceNotFoundError(MockAiohttpClientResponse404("userdoc.pdf", b""))
 
     monkeypatch.setattr(
@@ -114,7 +118,10 @@ async def test_content_file_useruploaded_found(
         def __init__(self, path_name):
             self.path_name = path_name
 
-        async def download_file(self):
+        async def get_file_properties(self):
+            return MockBlob().properties
+
+        async def download_file(self, **kwargs):
             downloaded_files.append(self.path_name)
             return MockBlob()
 
@@ -127,7 +134,8 @@ async def test_content_file_useruploaded_found(
 
     response = await auth_client.get("/content/userdoc.pdf", headers={"Authorization": "Bearer test"})
     assert response.status_code == 200
-    assert len(downloaded_files) == 1
+    assert await response.get_data() == TEST_PNG_BYTES
+    assert downloaded_files == ["userdoc.pdf"]
 
 
 @pytest.mark.asyncio
@@ -136,7 +144,7 @@ async def test_content_file_useruploaded_notfound(
 ):
 
     class MockBlobClient:
-        async def download_blob(self):
+        async def get_blob_properties(self):
             raise ResourceNotFoundError(MockAiohttpClientResponse404("userdoc.pdf", b""))
 
     monkeypatch.setattr(
@@ -161,7 +169,7 @@ async def test_content_file_useruploaded_notfound(
         def __init__(self, path_name):
             self.path_name = path_name
 
-        async def download_file(self):
+        async def get_file_properties(self):
             # Simulate file not found error
             raise ResourceNotFoundError(MockAiohttpClientResponse404(self.path_name, b""))
 
@@ -174,3 +182,83 @@ async def test_content_file_useruploaded_notfound(
 
     response = await auth_client.get("/content/userdoc.pdf", headers={"Authorization": "Bearer test"})
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_content_file_streamed_with_validators(
+    auth_client, mock_blob_container_client, mock_blob_container_client_exists
+):
+    response = await auth_client.get("/content/Benefit_Options.pdf", headers={"Authorization": "Bearer test"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/pdf"
+    assert response.headers["Content-Length"] == str(len(TEST_PNG_BYTES))
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"] == '"0x8DC1234567890AB"'
+    assert response.headers["Last-Modified"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert await response.get_data() == TEST_PNG_BYTES
+
+
+@pytest.mark.asyncio
+async def test_content_file_range(auth_client, mock_blob_container_client, mock_blob_container_client_exists):
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf", headers={"Authorization": "Bearer test", "Range": "bytes=10-19"}
+    )
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(TEST_PNG_BYTES)}"
+    assert response.headers["Content-Length"] == "10"
+    assert await response.get_data() == TEST_PNG_BYTES[10:20]
+
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf", headers={"Authorization": "Bearer test", "Range": "bytes=-5"}
+    )
+    assert response.status_code == 206
+    assert await response.get_data() == TEST_PNG_BYTES[-5:]
+
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf", headers={"Authorization": "Bearer test", "Range": "bytes=100000-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(TEST_PNG_BYTES)}"
+
+    # A range of another version of the file gets the whole current file
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf",
+        headers={"Authorization": "Bearer test", "Range": "bytes=10-19", "If-Range": '"0xOLDVERSION"'},
+    )
+    assert response.status_code == 200
+    assert await response.get_data() == TEST_PNG_BYTES
+
+
+@pytest.mark.asyncio
+async def test_content_file_not_modified(
+    auth_client, mock_blob_container_client, mock_blob_container_client_exists, monkeypatch
+):
+    downloads = []
+
+    async def download_blob(self, **kwargs):
+        downloads.append(kwargs)
+        return MockBlob()
+
+    monkeypatch.setattr(MockBlobClient, "download_blob", download_blob)
+
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf",
+        headers={"Authorization": "Bearer test", "If-None-Match": '"0x8DC1234567890AB"'},
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"0x8DC1234567890AB"'
+    assert await response.get_data() == b""
+
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf",
+        headers={"Authorization": "Bearer test", "If-Modified-Since": "Tue, 02 Jan 2024 00:00:00 GMT"},
+    )
+    assert response.status_code == 304
+    assert downloads == []
+
+    response = await auth_client.get(
+        "/content/Benefit_Options.pdf",
+        headers={"Authorization": "Bearer test", "If-None-Match": '"0xOLDVERSION"'},
+    )
+    assert response.status_code == 200
+    assert downloads[0]["etag"] == '"0x8DC1234567890AB"'
@@ -0,0 +1,230 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from starlette.datastructures import Headers
+
+from services.content_service import (
+    ContentService,
+    if_range_matches,
+    not_modified,
+    parse_range,
+)
+from services.document_service import AmbiguousDocumentError, DocumentService
+
+UPDATED = datetime(2024, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+
+def test_parse_range():
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-5", 100) == (95, 99)
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    # Multiple, malformed and other units of ranges are served as the whole file
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    assert parse_range("bytes=-", 100) is None
+    assert parse_range("bytes=20-10", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    # Ranges past the end of the file can't be satisfied
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=0-", 0)
+
+
+def test_not_modified():
+    assert not_modified(Headers({"If-None-Match": '"7"'}), '"7"', UPDATED)
+    assert not_modified(Headers({"If-None-Match": 'W/"6", W/"7"'}), '"7"', UPDATED)
+    assert not_modified(Headers({"If-None-Match": "*"}), '"7"', UPDATED)
+    assert not not_modified(Headers({"If-None-Match": '"6"'}), '"7"', UPDATED)
+    # If-Modified-Since is only used without If-None-Match, and HTTP dates have a precision of one second
+    assert not_modified(Headers({"If-Modified-Since": "Mon, 01 Jan 2024 12:00:00 GMT"}), '"7"', UPDATED)
+    assert not not_modified(Headers({"If-Modified-Since": "Mon, 01 Jan 2024 11:59:59 GMT"}), '"7"', UPDATED)
+    assert not not_modified(
+        Headers({"If-None-Match": '"6"', "If-Modified-Since": "Mon, 01 Jan 2024 12:00:00 GMT"}), '"7"', UPDATED
+    )
+    assert not not_modified(Headers({"If-Modified-Since": "not a date"}), '"7"', UPDATED)
+    assert not not_modified(Headers({}), '"7"', UPDATED)
+
+
+def test_if_range_matches():
+    assert if_range_matches(Headers({}), '"7"', UPDATED)
+    assert if_range_matches(Headers({"If-Range": '"7"'}), '"7"', UPDATED)
+    assert not if_range_matches(Headers({"If-Range": '"6"'}), '"7"', UPDATED)
+    assert if_range_matches(Headers({"If-Range": "Mon, 01 Jan 2024 12:00:00 GMT"}), '"7"', UPDATED)
+    assert not if_range_matches(Headers({"If-Range": "Sun, 31 Dec 2023 12:00:00 GMT"}), '"7"', UPDATED)
+
+
+class FakeAgentService:
+    async def get_agent(self, agent_id: str):
+        if agent_id != "agent1":
+            raise ValueError(f"Agent {agent_id} not found")
+        return SimpleNamespace(id=agent_id, bucket_name="proj-agent-agent1")
+
+
+class FakeDocumentService:
+    def __init__(self):
+        self.lookups = []
+
+    async def find_document_file(self, agent_id: str, file_name: str):
+        self.lookups.append((agent_id, file_name))
+        if file_name == "abc_doc.pdf":
+            return "proj-agent-agent1", "documents/abc_doc.pdf"
+        if file_name == "other.pdf":
+            return "proj-agent-agent2", "documents/other.pdf"
+        return None
+
+
+@pytest.mark.asyncio
+async def test_resolve():
+    documents = FakeDocumentService()
+    content_service = ContentService(FakeAgentService(), documents)
+
+    assert await content_service.resolve("abc_doc.pdf#page=3", "agent1") == (
+        "proj-agent-agent1",
+        "documents/abc_doc.pdf",
+    )
+    assert documents.lookups == [("agent1", "abc_doc.pdf")]
+    assert await content_service.resolve("gs://proj-agent-agent1/images/page1.png", "agent1") == (
+        "proj-agent-agent1",
+        "images/page1.png",
+    )
+    # Paths taken from a URL may have had their double slash merged
+    assert await content_service.resolve("gs:/proj-agent-agent1/images/page1.png", "agent1") == (
+        "proj-agent-agent1",
+        "images/page1.png",
+    )
+
+    # Files of other buckets, including those of other agents, are not served
+    assert await content_service.resolve("gs://proj-agent-agent2/documents/x.pdf", "agent1") is None
+    assert await content_service.resolve("gs://private-bucket/secret.pdf", "agent1") is None
+    assert await content_service.resolve("other.pdf", "agent1") is None
+    assert await content_service.resolve("missing.pdf", "agent1") is None
+    with pytest.raises(ValueError):
+        await content_service.resolve("abc_doc.pdf", "agent2")
+
+
+class FakeQuery:
+    def __init__(self, documents: list[dict], field: str, value: str):
+        self.matches = [doc for doc in documents if doc.get(field) == value]
+        self.count = None
+
+    def limit(self, count: int):
+        self.count = count
+        return self
+
+    async def stream(self):
+        for doc in self.matches[: self.count]:
+            yield SimpleNamespace(to_dict=lambda doc=doc: doc)
+
+
+class FakeDocuments:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+        self.queries = 0
+
+    def collection(self, name: str):
+        return self
+
+    def document(self, doc_id: str):
+        return self
+
+    def where(self, filter):
+        self.queries += 1
+        field, value = filter
+        return FakeQuery(self.documents, field, value)
+
+
+def create_document_service(documents: list[dict]) -> DocumentService:
+    document_service = DocumentService()
+    document_service.firestore_client = FakeDocuments(documents)
+    document_service._firestore = SimpleNamespace(FieldFilter=lambda field, op, value: (field, value))
+    document_service._initialized = True
+    return document_service
+
+
+def create_document(file_name: str, original_name: str) -> dict:
+    return {
+        "id": file_name,
+        "agentId": "agent1",
+        "fileName": file_name,
+        "originalName": original_name,
+        "gcsPath": f"gs://proj-agent-agent1/documents/{file_name}",
+        "contentType": "application/pdf",
+        "size": 1,
+        "uploadedBy": "user",
+        "uploadedAt": UPDATED,
+    }
+
+
+@pytest.mark.asyncio
+async def test_find_document_file():
+    document_service = create_document_service(
+        [
+            create_document("1234abcd_report.pdf", "report.pdf"),
+            create_document("5678efgh_report.pdf", "report.pdf"),
+            create_document("9999aaaa_notes.pdf", "notes.pdf"),
+        ]
+    )
+
+    location = ("proj-agent-agent1", "documents/1234abcd_report.pdf")
+    assert await document_service.find_document_file("agent1", "1234abcd_report.pdf") == location
+    assert await document_service.find_document_file("agent1", "notes.pdf") == (
+        "proj-agent-agent1",
+        "documents/9999aaaa_notes.pdf",
+    )
+    assert await document_service.find_document_file("agent1", "missing.pdf") is None
+    # Two uploads of the same file name can't be told apart
+    with pytest.raises(AmbiguousDocumentError):
+        await document_service.find_document_file("agent1", "report.pdf")
+
+    # Locations are remembered
+    queries = document_service.firestore_client.queries
+    assert await document_service.find_document_file("agent1", "1234abcd_report.pdf") == location
+    assert document_service.firestore_client.queries == queries
+
+
+@pytest.fixture
+def content_client(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    data = bytes(range(256)) * 10
+
+    async def get_file_metadata(bucket_name, blob_name):
+        return SimpleNamespace(generation=7, updated=UPDATED, size=len(data), content_type="application/pdf")
+
+    async def stream_file(bucket_name, blob_name, generation, start, end, chunk_size):
+        yield data[start : end + 1]
+
+    monkeypatch.setattr(main, "content_service", ContentService(FakeAgentService(), FakeDocumentService()))
+    monkeypatch.setattr(main.storage_service, "get_file_metadata", get_file_metadata)
+    monkeypatch.setattr(main.storage_service, "stream_file", stream_file)
+    client = TestClient(main.app)
+    client.data = data
+    yield client
+    main.app.dependency_overrides.clear()
+
+
+def test_get_content_requires_user(content_client):
+    import main
+
+    response = content_client.get("/content/abc_doc.pdf?agent_id=agent1")
+    assert response.status_code == 401
+
+    main.app.dependency_overrides[main.get_current_user] = lambda: SimpleNamespace(id="user")
+    response = content_client.get("/content/abc_doc.pdf?agent_id=agent1", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["ETag"] == '"7"'
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(content_client.data)}"
+    assert response.content == content_client.data[10:20]
+
+    response = content_client.get("/content/abc_doc.pdf?agent_id=agent1", headers={"If-None-Match": '"7"'})
+    assert response.status_code == 304
+    assert content_client.get("/content/other.pdf?agent_id=agent1").status_code == 404
+    assert content_client.get("/content/abc_doc.pdf?agent_id=agent2").status_code == 404
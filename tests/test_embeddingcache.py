@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from prepdocslib.embeddingcache import EmbeddingCache
+
+
+def test_key_depends_on_model_dimensions_and_text():
+    key = EmbeddingCache.key("text-embedding-3-large", 3072, "hello")
+    assert key == EmbeddingCache.key("text-embedding-3-large", 3072, "hello")
+    assert key != EmbeddingCache.key("text-embedding-3-small", 3072, "hello")
+    assert key != EmbeddingCache.key("text-embedding-3-large", 1536, "hello")
+    assert key != EmbeddingCache.key("text-embedding-3-large", 3072, "hello ")
+    assert len(key) == 32
+
+
+def test_unsupported_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype="float64")
+
+
+def test_round_trip_float32(tmp_path):
+    path = str(tmp_path / "nested" / "cache.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many([(b"a", [0.25, -1.5, 3.0]), (b"b", [1.0])])
+    assert cache.get_many([b"a", b"b", b"missing"]) == {b"a": [0.25, -1.5, 3.0], b"b": [1.0]}
+    cache.close()
+
+    # The vectors are still there when the cache is opened again
+    cache = EmbeddingCache(path)
+    assert cache.get_many([b"a"]) == {b"a": [0.25, -1.5, 3.0]}
+    cache.close()
+
+
+def test_round_trip_float16(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype="float16")
+    cache.put_many([(b"a", [0.0023064255, -0.009327292, 0.5])])
+    vector = cache.get_many([b"a"])[b"a"]
+    assert vector[2] == 0.5
+    assert vector == pytest.approx([0.0023064255, -0.009327292, 0.5], rel=1e-3)
+    assert cache._stored_bytes() == 6
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    # Each vector of 4 float32 values takes 16 bytes
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=64)
+    cache.put_many([(bytes([i]), [float(i)] * 4) for i in range(4)])
+    time.sleep(0.01)
+    cache.get_many([bytes([0])])
+    time.sleep(0.01)
+    cache.put_many([(b"new", [1.0] * 4)])
+
+    # 80 bytes is above the limit, so the cache is brought down to 90% of it by removing the oldest vectors
+    assert set(cache.get_many([bytes([i]) for i in range(4)] + [b"new"])) == {bytes([0]), bytes([3]), b"new"}
+    assert cache._size == 48
+    cache.close()
+
+
+def test_prune(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many([(b"old", [1.0]), (b"recent", [2.0])])
+    cache._connection.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time() - 10 * 86400, b"old"))
+    cache._connection.commit()
+
+    assert cache.prune(max_age_days=7) == 1
+    assert cache.get_many([b"old", b"recent"]) == {b"recent": [2.0]}
+    assert cache._size == 4
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_async_access(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    await cache.aput_many([(b"a", [1.0, 2.0])])
+    assert await cache.aget_many([b"a", b"b"]) == {b"a": [1.0, 2.0]}
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_async_access_is_best_effort(tmp_path, caplog):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.close()
+    # Errors of the database are logged and treated as cache misses
+    assert await cache.aget_many([b"a"]) == {}
+    await cache.aput_many([(b"a", [1.0, 2.0])])
+    assert "Could not read from the embedding cache" in caplog.text
+    assert "Could not write to the embedding cache" in caplog.text
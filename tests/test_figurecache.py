@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from prepdocslib.figurecache import FigureCache
+
+
+def test_image_hash():
+    assert FigureCache.image_hash(b"logo") == FigureCache.image_hash(b"logo")
+    assert FigureCache.image_hash(b"logo") != FigureCache.image_hash(b"logo2")
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_in_memory():
+    cache = FigureCache()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        return "A logo"
+
+    assert await cache.get_or_create("description", "a", create) == "A logo"
+    assert await cache.get_or_create("description", "a", create) == "A logo"
+    assert await cache.get_or_create("other", "a", create) == "A logo"
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_concurrent_calls_share_one_creation():
+    cache = FigureCache()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [0.1, 0.2]
+
+    results = await asyncio.gather(*(cache.get_or_create("embedding", "a", create) for _ in range(5)))
+
+    assert results == [[0.1, 0.2]] * 5
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_does_not_cache_failures():
+    cache = FigureCache()
+
+    async def fail():
+        raise RuntimeError("Service unavailable")
+
+    async def create():
+        return "A chart"
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_create("description", "a", fail)
+    assert await cache.get_or_create("description", "a", create) == "A chart"
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_persistent(tmp_path):
+    path = str(tmp_path / "nested" / "figures.sqlite")
+    cache = FigureCache(path)
+
+    async def create():
+        return "A diagram"
+
+    async def create_url():
+        return "https://blob/figure.png"
+
+    await cache.get_or_create("description", "a", create)
+    await cache.get_or_create("url", "a", create_url, persist=False)
+    cache.close()
+
+    # Descriptions are found in the database by the next run, URLs are not stored
+    cache = FigureCache(path)
+
+    async def unexpected():
+        raise AssertionError("Should have been found in the cache")
+
+    async def new_url():
+        return "https://blob/new.png"
+
+    assert await cache.get_or_create("description", "a", unexpected) == "A diagram"
+    assert await cache.get_or_create("url", "a", new_url) == "https://blob/new.png"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
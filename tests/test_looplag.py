@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from core.looplag import LoopLagMonitor
+from core.metrics import MetricsMiddleware, set_metrics_endpoint
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+async def blocking_app(scope, receive, send):
+    set_metrics_endpoint("/blocking")
+
+    async def handle():
+        await asyncio.sleep(0.05)
+        block_the_loop()
+
+    # Frameworks handle requests in child tasks, the monitor must still find the route
+    await asyncio.create_task(handle())
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def call_app(app):
+    scope = {"type": "http", "method": "GET", "path": "/blocking"}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_logs_blocking_stack(caplog):
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.1)
+    monitor.start()
+    try:
+        with caplog.at_level(logging.WARNING, logger="core.looplag"):
+            await call_app(MetricsMiddleware(blocking_app))
+    finally:
+        monitor.stop()
+
+    assert monitor.blocked_count == 1
+    assert "Event loop blocked for more than" in caplog.text
+    assert "while serving /blocking" in caplog.text
+    assert "in block_the_loop" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_quiet_loop(caplog):
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.1)
+    monitor.start()
+    try:
+        with caplog.at_level(logging.WARNING, logger="core.looplag"):
+            await asyncio.sleep(0.2)
+    finally:
+        monitor.stop()
+
+    assert monitor.blocked_count == 0
+    assert "Event loop blocked" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_toggle():
+    loop = asyncio.get_running_loop()
+    previous_factory = loop.get_task_factory()
+    monitor = LoopLagMonitor()
+    assert monitor.status()["enabled"] is False
+
+    monitor.start()
+    assert monitor.status()["enabled"] is True
+    assert loop.get_task_factory() is not previous_factory
+
+    monitor.stop()
+    assert monitor.status()["enabled"] is False
+    assert loop.get_task_factory() is previous_factory
+
+
+def test_loop_lag_monitor_configure():
+    monitor = LoopLagMonitor()
+    monitor.configure(threshold=0.5)
+    assert monitor.status()["threshold_ms"] == 500
+    with pytest.raises(ValueError):
+        monitor.configure(threshold=0)
+
+
+class ContextlessTask(asyncio.Task):
+    """A task that, as on Python 3.10, doesn't take a context"""
+
+    def __init__(self, coro, *, loop=None):
+        super().__init__(coro, loop=loop)
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_task_factory_without_context(monkeypatch):
+    monkeypatch.setattr(asyncio, "Task", ContextlessTask)
+    monitor = LoopLagMonitor()
+    monitor.start()
+    try:
+        assert await asyncio.create_task(asyncio.sleep(0, result="done")) == "done"
+    finally:
+        monitor.stop()
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_chains_task_factory():
+    loop = asyncio.get_running_loop()
+    calls = []
+
+    def task_factory(loop, coro, **kwargs):
+        calls.append(kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    loop.set_task_factory(task_factory)
+    monitor = LoopLagMonitor()
+    monitor.start()
+    try:
+        assert await asyncio.create_task(asyncio.sleep(0, result="done")) == "done"
+    finally:
+        monitor.stop()
+        loop.set_task_factory(None)
+    # The context is only passed on to the previous factory when the loop passed one
+    assert calls[-1] == {}
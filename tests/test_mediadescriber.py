@@ -141,6 +141,46 @@ async def test_contentunderstanding_analyze(monkeypatch, caplog):
         await describer_bad_analyze.describe_image(b"imagebytes")
 
 
+@pytest.mark.asyncio
+async def test_contentunderstanding_reuses_session_and_token(monkeypatch):
+    result_url = "https://testcontentunderstanding.cognitiveservices.azure.com/contentunderstanding/analyzers/image_analyzer/results/1"
+
+    def mock_post(self, *args, **kwargs):
+        return MockResponse(status=200, headers={"Operation-Location": result_url})
+
+    def mock_get(self, url, **kwargs):
+        fields = {"Description": {"type": "string", "valueString": "A logo"}}
+        return MockResponse(
+            status=200, text=json.dumps({"status": "Succeeded", "result": {"contents": [{"fields": fields}]}})
+        )
+
+    monkeypatch.setattr(aiohttp.ClientSession, "post", mock_post)
+    monkeypatch.setattr(aiohttp.ClientSession, "get", mock_get)
+
+    class CountingCredential(MockAzureCredential):
+        def __init__(self):
+            self.calls = 0
+
+        async def get_token(self, *scopes, **kwargs):
+            self.calls += 1
+            return await super().get_token(*scopes, **kwargs)
+
+    credential = CountingCredential()
+    describer = ContentUnderstandingDescriber(
+        endpoint="https://testcontentunderstanding.cognitiveservices.azure.com", credential=credential
+    )
+    assert await describer.describe_image(b"imagebytes") == "A logo"
+    session = describer._session
+    assert await describer.describe_image(b"imagebytes") == "A logo"
+
+    assert describer._session is session
+    # The token is cached until it nears expiry
+    assert credential.calls == 1
+
+    await describer.close()
+    assert session.closed
+
+
 class MockAsyncOpenAI:
     def __init__(self, test_response):
         self.chat = type("MockChat", (), {})()
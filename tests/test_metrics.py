@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from core.metrics import RequestMetrics, metrics_authorized
+
+
+def test_metrics_authorized():
+    assert metrics_authorized("Bearer secret", "secret")
+    assert metrics_authorized("bearer secret", "secret")
+    assert not metrics_authorized("Bearer wrong", "secret")
+    assert not metrics_authorized("Basic secret", "secret")
+    assert not metrics_authorized("secret", "secret")
+    assert not metrics_authorized(None, "secret")
+    # Without a configured token, nobody is authorized
+    assert not metrics_authorized("Bearer ", "")
+    assert not metrics_authorized("Bearer secret", None)
+
+
+@pytest.fixture
+def main_client(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setattr(main.settings, "METRICS_TOKEN", "secret")
+    return TestClient(main.app), main
+
+
+def test_main_metrics_requires_token(main_client, monkeypatch):
+    client, main = main_client
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "rag_request_duration_seconds" in response.text
+
+    # Without a configured token, metrics are not served at all
+    monkeypatch.setattr(main.settings, "METRICS_TOKEN", None)
+    assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 404
+
+
+def test_request_metrics_labels_ignore_path_params():
+    scope = {"route": SimpleNamespace(path="/api/agents/{agent_id}"), "path_params": {"agent_id": "anything"}}
+    # Agent ids in the path are not validated, they must not become label values
+    assert RequestMetrics(scope=scope).labels() == {"endpoint": "/api/agents/{agent_id}", "agent": ""}
+    assert RequestMetrics(scope=scope, agent="agent1").labels()["agent"] == "agent1"
+
+
+def chat_stream_requests(agent: str) -> float:
+    labels = {"endpoint": "/chat/stream", "agent": agent, "method": "POST", "status": "200"}
+    return REGISTRY.get_sample_value("rag_request_duration_seconds_count", labels) or 0
+
+
+def test_main_chat_stream_labels_only_existing_agents(main_client, monkeypatch):
+    client, main = main_client
+
+    async def get_agent(agent_id: str):
+        if agent_id != "agent1":
+            raise ValueError(f"Agent {agent_id} not found")
+        return SimpleNamespace(id=agent_id, corpus_id=f"mock-corpus-{agent_id}")
+
+    monkeypatch.setattr(main.settings, "GCP_PROJECT_ID", "test-project")
+    monkeypatch.setattr(main.agent_service, "get_agent", get_agent)
+    monkeypatch.setattr(main.vertex_ai_service, "generate_response_stream", lambda *args: iter(["Hello"]))
+
+    def chat(agent_id: str):
+        body = {"messages": [{"role": "user", "content": "Hi"}], "context": {"overrides": {"agent_id": agent_id}}}
+        response = client.post("/chat/stream", json=body)
+        assert response.status_code == 200
+
+    before_agent, before_other = chat_stream_requests("agent1"), chat_stream_requests("")
+    chat("agent1")
+    chat("made-up-agent")
+    assert chat_stream_requests("agent1") == before_agent + 1
+    assert chat_stream_requests("") == before_other + 1
+    assert chat_stream_requests("made-up-agent") == 0
@@ -1,8 +1,10 @@
+import asyncio
 import io
 import json
 import logging
 import math
 import pathlib
+import pickle
 from unittest.mock import AsyncMock, MagicMock, Mock
 
 import pymupdf
@@ -24,14 +26,17 @@ from azure.core.exceptions import HttpResponseError
 from PIL import Image, ImageChops
 from werkzeug.datastructures import FileStorage
 
+from prepdocslib.figurecache import FigureCache
 from prepdocslib.figureprocessor import (
+    FigureLimits,
     FigureProcessor,
     MediaDescriptionStrategy,
     build_figure_markup,
     process_page_image,
+    process_page_images,
 )
-from prepdocslib.page import ImageOnPage
-from prepdocslib.pdfparser import DocumentAnalysisParser
+from prepdocslib.page import ImageOnPage, Page
+from prepdocslib.pdfparser import DocumentAnalysisParser, ObjectType, PyMuPdfParser
 
 from .mocks import MockAzureCredential
 
@@ -85,6 +90,79 @@ def test_crop_image_from_pdf_page():
     assert_image_equal(cropped_image, expected_image)
 
 
+def make_pdf(page_texts: list[str]) -> io.BytesIO:
+    doc = pymupdf.open()
+    for page_text in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), page_text)
+    content = io.BytesIO(doc.tobytes())
+    content.name = "test.pdf"
+    doc.close()
+    return content
+
+
+@pytest.mark.asyncio
+async def test_pymupdf_parser():
+    parser = PyMuPdfParser()
+    pages = [page async for page in parser.parse(make_pdf(["First page", "Second page", "Third page"]))]
+
+    assert [page.page_num for page in pages] == [0, 1, 2]
+    assert [page.text.strip() for page in pages] == ["First page", "Second page", "Third page"]
+    assert pages[0].offset == 0
+    assert pages[1].offset == len(pages[0].text)
+    assert pages[2].offset == len(pages[0].text) + len(pages[1].text)
+
+
+@pytest.mark.asyncio
+async def test_pymupdf_parser_in_parallel():
+    page_texts = [f"Page number {i}" for i in range(10)]
+    sequential = [page async for page in PyMuPdfParser().parse(make_pdf(page_texts))]
+    parser = PyMuPdfParser(processes=2, parallel_min_pages=5)
+    try:
+        parallel = [page async for page in parser.parse(make_pdf(page_texts))]
+        executor = parser._executor
+        # The process pool is kept for the next documents
+        again = [page async for page in parser.parse(make_pdf(page_texts))]
+        assert parser._executor is executor
+    finally:
+        await parser.close()
+    assert parser._executor is None
+
+    assert [(page.page_num, page.offset, page.text) for page in parallel] == [
+        (page.page_num, page.offset, page.text) for page in sequential
+    ]
+    assert [page.text.strip() for page in parallel] == page_texts
+    assert [page.text for page in again] == [page.text for page in parallel]
+
+
+def test_pymupdf_parser_in_worker_process():
+    parser = PyMuPdfParser(processes=4, parallel_min_pages=5)
+    # The copy a worker process gets extracts the pages in that process, without a pool of its own
+    copy = pickle.loads(pickle.dumps(parser))
+    assert copy.processes == 1
+    assert copy.parallel_min_pages == 5
+    assert parser.processes == 4
+
+
+def test_paint_segments():
+    table = (ObjectType.TABLE, 0)
+    other_table = (ObjectType.TABLE, 1)
+    figure = (ObjectType.FIGURE, 0)
+    # The figure is painted last, so it wins the characters it shares with the tables
+    painted = [(2, 8, table), (-3, 1, other_table), (6, 10, figure), (12, 20, table), (15, 15, figure)]
+
+    assert DocumentAnalysisParser.paint_segments(painted, 14) == [
+        (0, 1, other_table),
+        (1, 2, None),
+        (2, 6, table),
+        (6, 10, figure),
+        (10, 12, None),
+        (12, 14, table),
+    ]
+    assert DocumentAnalysisParser.paint_segments([], 5) == [(0, 5, None)]
+    assert DocumentAnalysisParser.paint_segments([], 0) == []
+
+
 def test_table_to_html():
     table = DocumentTable(
         row_count=2,
@@ -747,6 +825,143 @@ async def test_process_page_image_with_embeddings(sample_image):
     image_embeddings.create_embedding_for_image.assert_awaited_once()
 
 
+@pytest.mark.asyncio
+async def test_process_page_images_concurrently_within_limits():
+    pages = [
+        Page(
+            page_num=page_num,
+            offset=0,
+            text="",
+            images=[
+                ImageOnPage(
+                    bytes=f"{page_num}-{index}".encode(),
+                    bbox=(0, 0, 10, 10),
+                    page_num=page_num,
+                    figure_id=f"{page_num}.{index}",
+                    placeholder=f'<figure id="{page_num}.{index}"></figure>',
+                    filename=f"figure{page_num}_{index}.png",
+                )
+                for index in range(3)
+            ],
+        )
+        for page_num in range(4)
+    ]
+    running, max_running = 0, 0
+
+    async def describe(image_bytes):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # Later figures finish first, so results would come back out of order if they were not attached in place
+        await asyncio.sleep(0.01 / (1 + image_bytes[-1]))
+        running -= 1
+        return f"Figure {image_bytes.decode()}"
+
+    figure_processor = AsyncMock()
+    figure_processor.describe = describe
+    blob_manager = AsyncMock()
+    blob_manager.upload_document_image = AsyncMock(
+        side_effect=lambda document_filename, image_bytes, filename, page_num, user_oid: f"https://blob/{filename}"
+    )
+
+    await process_page_images(
+        pages=pages,
+        document_filename="test.pdf",
+        blob_manager=blob_manager,
+        image_embeddings_client=None,
+        figure_processor=figure_processor,
+        limits=FigureLimits(descriptions=2),
+    )
+
+    assert max_running == 2
+    assert blob_manager.upload_document_image.await_count == 12
+    for page in pages:
+        assert [image.description for image in page.images] == [f"Figure {page.page_num}-{index}" for index in range(3)]
+        assert [image.url for image in page.images] == [
+            f"https://blob/figure{page.page_num}_{index}.png" for index in range(3)
+        ]
+
+
+@pytest.mark.asyncio
+async def test_process_page_images_reuses_repeated_images():
+    def logo(page_num):
+        return ImageOnPage(
+            bytes=b"logo",
+            bbox=(0, 0, 10, 10),
+            page_num=page_num,
+            figure_id=f"{page_num}.1",
+            placeholder=f'<figure id="{page_num}.1"></figure>',
+            filename=f"figure{page_num}_1.png",
+        )
+
+    figure_processor = FigureProcessor(strategy=MediaDescriptionStrategy.OPENAI, openai_model="gpt-4o")
+    figure_processor.describe = AsyncMock(return_value="The company logo")
+    blob_manager = AsyncMock()
+    blob_manager.upload_document_image = AsyncMock(return_value="https://blob/figure0_1.png")
+    image_embeddings = AsyncMock()
+    image_embeddings.create_embedding_for_image = AsyncMock(return_value=[0.1, 0.2])
+    cache = FigureCache()
+
+    for document_filename in ["a.pdf", "b.pdf"]:
+        pages = [Page(page_num=page_num, offset=0, text="", images=[logo(page_num)]) for page_num in range(3)]
+        await process_page_images(
+            pages=pages,
+            document_filename=document_filename,
+            blob_manager=blob_manager,
+            image_embeddings_client=image_embeddings,
+            figure_processor=figure_processor,
+            cache=cache,
+        )
+        for page in pages:
+            assert page.images[0].description == "The company logo"
+            assert page.images[0].url == "https://blob/figure0_1.png"
+            assert page.images[0].embedding == [0.1, 0.2]
+
+    figure_processor.describe.assert_awaited_once()
+    image_embeddings.create_embedding_for_image.assert_awaited_once()
+    # The uploaded image is captioned with its document, so it is uploaded once per document
+    assert blob_manager.upload_document_image.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_process_page_images_cancels_remaining_on_error(sample_image):
+    cancelled = asyncio.Event()
+
+    async def describe(image_bytes):
+        if image_bytes == b"fail":
+            raise RuntimeError("Description failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    figure_processor = AsyncMock()
+    figure_processor.describe = describe
+    failing_image = ImageOnPage(
+        bytes=b"fail",
+        bbox=(0, 0, 10, 10),
+        page_num=2,
+        figure_id="2.1",
+        placeholder='<figure id="2.1"></figure>',
+        filename="figure2_1.png",
+    )
+    pages = [
+        Page(page_num=1, offset=0, text="", images=[sample_image]),
+        Page(page_num=2, offset=0, text="", images=[failing_image]),
+    ]
+
+    with pytest.raises(RuntimeError, match="Description failed"):
+        await process_page_images(
+            pages=pages,
+            document_filename="test.pdf",
+            blob_manager=AsyncMock(),
+            image_embeddings_client=None,
+            figure_processor=figure_processor,
+        )
+    assert cancelled.is_set()
+
+
 def test_image_on_page_from_skill_payload_without_bytes():
     """Test ImageOnPage.from_skill_payload when bytes_base64 is not provided."""
     payload = {
@@ -1,7 +1,11 @@
+import asyncio
+import json
 import logging
+import time
 from argparse import Namespace
 from unittest.mock import AsyncMock
 
+import httpx
 import openai
 import openai.types
 import pytest
@@ -11,6 +15,7 @@ from httpx import Request, Response
 from openai.types.create_embedding_response import Usage
 
 import prepdocs
+from prepdocslib.embeddingcache import EmbeddingCache
 from prepdocslib.embeddings import ImageEmbeddings, OpenAIEmbeddings
 
 from .mocks import (
@@ -192,6 +197,23 @@ async def test_image_embeddings_success(mock_azurehttp_calls):
     mock_token_provider.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_image_embeddings_reuse_session(mock_azurehttp_calls):
+    image_embeddings = ImageEmbeddings(
+        endpoint="https://fake-endpoint.azure.com/",
+        token_provider=AsyncMock(return_value="fake_token"),
+    )
+
+    await image_embeddings.create_embedding_for_image(b"fake_image_data")
+    session = image_embeddings._session
+    await image_embeddings.create_embedding_for_text("a query")
+    assert image_embeddings._session is session
+
+    await image_embeddings.close()
+    assert session.closed
+    assert image_embeddings._session is None
+
+
 def test_setup_list_file_strategy_uses_datalake_key(monkeypatch: pytest.MonkeyPatch) -> None:
     captured: dict[str, object] = {}
 
@@ -318,3 +340,107 @@ async def test_manageacl_main_uses_search_key(monkeypatch: pytest.MonkeyPatch) -
     assert captured["credentials"].key == "secret"
     assert captured["service_name"] == "searchsvc"
     assert captured["index_name"] == "searchindex"
+
+
+def embeddings_transport(handle_status):
+    """httpx transport answering embedding requests with one embedding per input, holding the first value
+    of each embedding to the position of the input in the whole call"""
+    state = {"in_flight": 0, "max_in_flight": 0, "requests": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"] += 1
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        try:
+            await asyncio.sleep(0.01)
+            error = handle_status(state["requests"])
+            if error is not None:
+                return error
+            texts = json.loads(request.content)["input"]
+            data = [
+                {"object": "embedding", "index": i, "embedding": [float(text.split()[-1]), 0.0]}
+                for i, text in enumerate(texts)
+            ]
+            return httpx.Response(
+                200,
+                json={"object": "list", "data": data, "model": "m", "usage": {"prompt_tokens": 1, "total_tokens": 1}},
+                headers={"x-ratelimit-limit-tokens": "100000", "x-ratelimit-remaining-tokens": "99000"},
+            )
+        finally:
+            state["in_flight"] -= 1
+
+    return httpx.MockTransport(handler), state
+
+
+@pytest.mark.asyncio
+async def test_compute_embedding_batches_concurrently_in_order():
+    transport, state = embeddings_transport(lambda request_number: None)
+    client = openai.AsyncOpenAI(api_key="key", max_retries=0, http_client=httpx.AsyncClient(transport=transport))
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=client,
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        max_concurrency=3,
+    )
+
+    result = await embeddings.create_embeddings([f"text number {i}" for i in range(50)])
+
+    assert [embedding[0] for embedding in result] == [float(i) for i in range(50)]
+    assert state["requests"] == 4
+    assert state["max_in_flight"] == 3
+    assert embeddings.rate_limiter.tokens.limit == 100000
+
+
+@pytest.mark.asyncio
+async def test_compute_embedding_rate_limited_waits_for_retry_after():
+    def handle_status(request_number):
+        if request_number == 1:
+            return httpx.Response(
+                429, json={"error": {"message": "Too many requests"}}, headers={"retry-after-ms": "50"}
+            )
+        return None
+
+    transport, state = embeddings_transport(handle_status)
+    client = openai.AsyncOpenAI(api_key="key", max_retries=0, http_client=httpx.AsyncClient(transport=transport))
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=client,
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        max_concurrency=4,
+    )
+
+    start = time.monotonic()
+    result = await embeddings.create_embeddings(["text number 0"])
+
+    assert result == [[0.0, 0.0]]
+    assert state["requests"] == 2
+    assert 0.05 <= time.monotonic() - start < 5
+    # Halved after the 429, then grown back by one after the success
+    assert embeddings.rate_limiter.concurrency == 3
+
+
+@pytest.mark.asyncio
+async def test_compute_embedding_uses_cache(tmp_path):
+    transport, state = embeddings_transport(lambda request_number: None)
+    client = openai.AsyncOpenAI(api_key="key", max_retries=0, http_client=httpx.AsyncClient(transport=transport))
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=client,
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        cache=cache,
+    )
+
+    assert await embeddings.create_embeddings(["text number 1", "text number 2", "text number 1"]) == [
+        [1.0, 0.0],
+        [2.0, 0.0],
+        [1.0, 0.0],
+    ]
+    assert state["requests"] == 1
+
+    # Only the text missing from the cache is sent to the API
+    assert await embeddings.create_embeddings(["text number 2", "text number 3"]) == [[2.0, 0.0], [3.0, 0.0]]
+    assert state["requests"] == 2
+    assert await embeddings.create_embeddings(["text number 1", "text number 3"]) == [[1.0, 0.0], [3.0, 0.0]]
+    assert state["requests"] == 2
+    cache.close()
@@ -1,3 +1,4 @@
+import json
 import os
 from io import BytesIO
 
@@ -5,9 +6,15 @@ import pytest
 from azure.search.documents.aio import SearchClient
 
 from prepdocslib.blobmanager import BlobManager
-from prepdocslib.figureprocessor import FigureProcessor, MediaDescriptionStrategy
+from prepdocslib.figureprocessor import (
+    FigureLimits,
+    FigureProcessor,
+    MediaDescriptionStrategy,
+)
 from prepdocslib.fileprocessor import FileProcessor
-from prepdocslib.filestrategy import FileStrategy, parse_file
+from prepdocslib.filestrategy import FileStrategy, UploadUserFileStrategy, parse_file
+from prepdocslib.ingestionpipeline import IngestionConcurrency
+from prepdocslib.jsonparser import JsonParser
 from prepdocslib.listfilestrategy import (
     ADLSGen2ListFileStrategy,
     File,
@@ -16,7 +23,7 @@ from prepdocslib.listfilestrategy import (
 from prepdocslib.page import ImageOnPage, Page
 from prepdocslib.strategy import SearchInfo
 from prepdocslib.textparser import TextParser
-from prepdocslib.textsplitter import SimpleTextSplitter
+from prepdocslib.textsplitter import SentenceTextSplitter, SimpleTextSplitter
 
 from .mocks import MockAzureCredential
 
@@ -75,7 +82,7 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
     assert len(uploaded_to_search) == 3
     assert uploaded_to_search == [
         {
-            "id": "file-a_txt-612E7478747B276F696473273A205B27412D555345522D4944275D2C202767726F757073273A205B27412D47524F55502D4944275D7D-page-0",
+            "id": "file-a_txt-612E7478747B276F696473273A205B27412D555345522D4944275D2C202767726F757073273A205B27412D47524F55502D4944275D7D-4e87d46a70a370eafd9be7e6ed6ff7c3-0",
             "content": "texttext",
             "category": None,
             "groups": ["A-GROUP-ID"],
@@ -85,7 +92,7 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
             "storageUrl": "https://test.blob.core.windows.net/a.txt",
         },
         {
-            "id": "file-b_txt-622E7478747B276F696473273A205B27422D555345522D4944275D2C202767726F757073273A205B27422D47524F55502D4944275D7D-page-0",
+            "id": "file-b_txt-622E7478747B276F696473273A205B27422D555345522D4944275D2C202767726F757073273A205B27422D47524F55502D4944275D7D-0f27884580d84355d1bdc77f293959ea-0",
             "content": "texttext",
             "category": None,
             "groups": ["B-GROUP-ID"],
@@ -95,7 +102,7 @@ async def test_file_strategy_adls2(monkeypatch, mock_env, mock_data_lake_service
             "storageUrl": "https://test.blob.core.windows.net/b.txt",
         },
         {
-            "id": "file-c_txt-632E7478747B276F696473273A205B27432D555345522D4944275D2C202767726F757073273A205B27432D47524F55502D4944275D7D-page-0",
+            "id": "file-c_txt-632E7478747B276F696473273A205B27432D555345522D4944275D2C202767726F757073273A205B27432D47524F55502D4944275D7D-90a852ee01862550e7e89c22f42e2558-0",
             "content": "texttext",
             "category": None,
             "groups": ["C-GROUP-ID"],
@@ -242,3 +249,94 @@ async def test_file_strategy_setup_with_content_understanding(monkeypatch, mock_
     # create_analyzer should be called during setup for content understanding
     assert figure_processor.media_describer.create_analyzer_called
     assert figure_processor.content_understanding_ready
+
+
+class StubBlobManager:
+    def __init__(self):
+        self.uploaded = []
+
+    async def upload_blob(self, file: File):
+        self.uploaded.append(file.filename())
+        return f"https://test.blob.core.windows.net/{file.filename()}"
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_pipeline(monkeypatch, tmp_path):
+    for i in range(6):
+        (tmp_path / f"doc{i}.txt").write_text(f"Text of document {i}.")
+    (tmp_path / "notes.xyz").write_text("No parser for this one")
+
+    uploaded_to_search = []
+
+    async def mock_upload_documents(self, documents):
+        uploaded_to_search.extend(documents)
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+
+    blob_manager = StubBlobManager()
+    file_strategy = FileStrategy(
+        list_file_strategy=LocalListFileStrategy(path_pattern=str(tmp_path / "*")),
+        blob_manager=blob_manager,
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".txt": FileProcessor(TextParser(), SentenceTextSplitter())},
+        concurrency=IngestionConcurrency(processes=2, uploads=2, indexing=2, queue_size=1),
+    )
+
+    await file_strategy.run()
+
+    assert sorted(blob_manager.uploaded) == sorted([f"doc{i}.txt" for i in range(6)] + ["notes.xyz"])
+    assert sorted((document["sourcefile"], document["content"]) for document in uploaded_to_search) == [
+        (f"doc{i}.txt", f"Text of document {i}.") for i in range(6)
+    ]
+    assert all(document["storageUrl"].endswith(document["sourcefile"]) for document in uploaded_to_search)
+
+
+@pytest.mark.asyncio
+async def test_file_strategy_pipeline_stops_on_parse_error(tmp_path):
+    (tmp_path / "broken.json").write_text("{not json")
+
+    file_strategy = FileStrategy(
+        list_file_strategy=LocalListFileStrategy(path_pattern=str(tmp_path / "*")),
+        blob_manager=StubBlobManager(),
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".json": FileProcessor(JsonParser(), SimpleTextSplitter())},
+        concurrency=IngestionConcurrency(processes=1),
+    )
+
+    with pytest.raises(json.JSONDecodeError):
+        await file_strategy.run()
+
+
+@pytest.mark.asyncio
+async def test_upload_user_file_strategy_shares_figure_limits(monkeypatch):
+    figure_limits = []
+
+    async def mock_parse_file(file, file_processors, category, blob_manager, image_embeddings_client, **kwargs):
+        figure_limits.append(kwargs["figure_limits"])
+        return []
+
+    monkeypatch.setattr("prepdocslib.filestrategy.parse_file", mock_parse_file)
+    limits = FigureLimits(descriptions=2, uploads=3, embeddings=1)
+    strategy = UploadUserFileStrategy(
+        search_info=SearchInfo(
+            endpoint="https://testsearchclient.blob.core.windows.net",
+            credential=MockAzureCredential(),
+            index_name="test",
+        ),
+        file_processors={".txt": FileProcessor(TextParser(), SentenceTextSplitter())},
+        blob_manager=StubBlobManager(),
+        figure_limits=limits,
+    )
+
+    # The figures of all the uploads share the same limits
+    await strategy.add_file(File(content=BytesIO(b"one"), url="one.txt"), user_oid="user1")
+    await strategy.add_file(File(content=BytesIO(b"two"), url="two.txt"), user_oid="user2")
+    assert figure_limits == [limits, limits]
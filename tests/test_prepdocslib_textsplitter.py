@@ -5,14 +5,16 @@ from pathlib import Path
 import pytest
 import tiktoken
 
+from prepdocslib import textsplitter
 from prepdocslib.listfilestrategy import LocalListFileStrategy
-from prepdocslib.page import Page
+from prepdocslib.page import Chunk, Page
 from prepdocslib.pdfparser import LocalPdfParser
 from prepdocslib.searchmanager import Section
 from prepdocslib.textsplitter import (
     ENCODING_MODEL,
     SentenceTextSplitter,
     SimpleTextSplitter,
+    _TokenOffsets,
 )
 
 # Deterministic single-token character used to create token pressure by repetition
@@ -490,6 +492,47 @@ def test_recursive_split_overlap_fallback_when_no_word_breaks():
     assert all(" " not in c.text for c in chunks)
 
 
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Hello world, this is a test.  Numbers 1234567 and   spaces\n\n  then 'll and 'S contractions.\r\n",
+        "   \n" * 50 + "tail",
+        "漢字かなカナ。" * 40,
+        SINGLE_TOKEN_CHAR * 200,
+    ],
+)
+def test_token_offsets_count_matches_encoder(text):
+    """Token counts of substrings come from a single pre-tokenization but must equal encoding each substring."""
+    token_offsets = _TokenOffsets(text, len(_bpe_for_guard.encode(text)))
+    assert token_offsets.exact
+    for start in range(0, len(text), 7):
+        for end in range(start, len(text) + 1, 5):
+            assert token_offsets.count(start, end) == len(_bpe_for_guard.encode(text[start:end])), (start, end)
+
+
+def test_token_offsets_without_tiktoken_internals(monkeypatch):
+    """Without the private pre-tokenizer of tiktoken, token counts come from encoding and chunks are unchanged."""
+    text = " ".join(["alpha", "beta", "gamma,", "delta."] * 300)
+    expected = list(SentenceTextSplitter(max_tokens_per_section=50).split_page_by_max_tokens(0, text))
+
+    monkeypatch.setattr(textsplitter, "_pretokenizer", None)
+    token_offsets = _TokenOffsets(text, len(_bpe_for_guard.encode(text)))
+    assert not token_offsets.exact
+    assert token_offsets.count(3, 200) == len(_bpe_for_guard.encode(text[3:200]))
+    assert token_offsets.count_joined(100, _TokenOffsets("more", 1)) == len(_bpe_for_guard.encode(text[:100] + "more"))
+    assert list(SentenceTextSplitter(max_tokens_per_section=50).split_page_by_max_tokens(0, text)) == expected
+
+
+def test_recursive_split_long_text_without_sentence_endings():
+    """A long run of words without sentence endings is split at word breaks into chunks under the token limit."""
+    splitter = SentenceTextSplitter(max_tokens_per_section=50)
+    text = " ".join(["alpha", "beta", "gamma,", "delta"] * 500)
+    chunks = list(splitter.split_page_by_max_tokens(0, text))
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks) == text
+    assert all(len(_bpe_for_guard.encode(chunk.text)) <= 50 for chunk in chunks)
+
+
 def test_fragment_shift_token_limit_fits_false():
     """Trigger trailing fragment carry-forward where fits() fails solely due to token limit (not char length) and trimming loop runs."""
     # Configure large char allowance so only token constraint matters.
@@ -704,3 +747,36 @@ def test_append_overlap_preserves_next_chunk_start():
             # If this occurs, safe_concat would have inserted a space earlier; treat as failure
             boundary_ok = tail_of_first.endswith(" ")
     assert boundary_ok, "First chunk tail and second chunk head joined mid-word without boundary handling"
+
+
+@pytest.mark.parametrize(
+    "text, following",
+    [
+        ("Hello world, this is a te", "st of joined   texts 12345.\n\n next"),
+        ("   \n" * 20 + "word", "s and more words"),
+        ("漢字かなカナ。" * 20, "カナ漢字。" * 20),
+        (SINGLE_TOKEN_CHAR * 100, SINGLE_TOKEN_CHAR * 50 + " tail"),
+    ],
+)
+def test_token_offsets_count_joined_matches_encoder(text, following):
+    """Token counts of a prefix joined with another text are exact, and bounded below by lower_bound."""
+    token_offsets = _TokenOffsets(text, len(_bpe_for_guard.encode(text)))
+    following_offsets = _TokenOffsets(following, len(_bpe_for_guard.encode(following)))
+    for end in range(len(text) + 1):
+        expected = len(_bpe_for_guard.encode(text[:end] + following))
+        assert token_offsets.count_joined(end, following_offsets) == expected, end
+        assert token_offsets.lower_bound(end) <= min(expected, len(_bpe_for_guard.encode(text[:end]))), end
+
+
+def test_append_overlap_shrinks_to_token_limit():
+    """An overlap prefix that would exceed the token limit is shrunk by whole words to the longest one that fits."""
+    splitter = SentenceTextSplitter(max_tokens_per_section=40)
+    prev_chunk = Chunk(page_num=0, text=SINGLE_TOKEN_CHAR * 30)
+    next_chunk = Chunk(page_num=1, text="abc " * 60)
+    result = splitter._append_overlap(prev_chunk, next_chunk)
+    appended = result.text[len(prev_chunk.text) :]
+    assert result.text.startswith(prev_chunk.text)
+    assert appended and next_chunk.text.startswith(appended) and appended.endswith(" ")
+    assert len(_bpe_for_guard.encode(result.text)) <= 40
+    # One more word would not fit
+    assert len(_bpe_for_guard.encode(result.text + "abc ")) > 40
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core import profiler
+from core.profiler import TRUNCATED_STACK, ProfilerBusyError, SamplingProfiler, profile
+
+
+def spin_for(seconds: float):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_profile_collapsed_stacks():
+    thread = threading.Thread(target=spin_for, args=(0.5,), name="busy-thread")
+    thread.start()
+    try:
+        collapsed = await profile(0.2, interval=0.005)
+    finally:
+        thread.join()
+
+    lines = collapsed.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+    busy_lines = [line for line in lines if line.startswith("busy-thread;")]
+    assert busy_lines
+    assert any("spin_for (test_profiler.py:" in line for line in busy_lines)
+
+
+@pytest.mark.asyncio
+async def test_profile_only_one_at_a_time():
+    first = asyncio.create_task(profile(0.2))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ProfilerBusyError):
+        await profile(0.1)
+    await first
+    # The lock is released once the first profile is done
+    assert await profile(0.01) is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("seconds, interval", [(0, 0.01), (-1, 0.01), (profiler.MAX_PROFILE_SECONDS + 1, 0.01), (1, 0)])
+async def test_profile_rejects_invalid_arguments(seconds, interval):
+    with pytest.raises(ValueError):
+        await profile(seconds, interval)
+
+
+def test_collapsed_truncates_to_max_bytes():
+    sampling_profiler = SamplingProfiler()
+    sampling_profiler.stacks.update({"main;a": 10, "main;b": 5, "main;c": 1})
+    assert sampling_profiler.collapsed(max_bytes=20) == f"main;a 10\nmain;b 5\n{TRUNCATED_STACK} 1\n"
+
+
+def test_sample_once_caps_distinct_stacks():
+    sampling_profiler = SamplingProfiler(max_stacks=1)
+    sampling_profiler.stacks["existing;stack"] = 1
+    sampling_profiler.sample_once()
+    assert set(sampling_profiler.stacks) == {"existing;stack", TRUNCATED_STACK}
+    assert sampling_profiler.samples == 1
@@ -513,7 +513,7 @@ async def test_create_index_acls_with_existing_fields_no_enforcement(monkeypatch
 async def test_update_content(monkeypatch, search_info):
     async def mock_upload_documents(self, documents):
         assert len(documents) == 1
-        assert documents[0]["id"] == "file-foo_pdf-666F6F2E706466-page-0"
+        assert documents[0]["id"] == "file-foo_pdf-666F6F2E706466-da24ec81264c715016ded43044f8ca6b-0"
         assert documents[0]["content"] == "test content"
         assert documents[0]["category"] == "test"
         assert documents[0]["sourcepage"] == "foo.pdf#page=1"
@@ -718,6 +718,33 @@ async def test_update_content_with_images_when_enabled(monkeypatch, search_info)
     assert img_entry["embedding"] == image.embedding
 
 
+def test_content_hash_ignores_derived_image_fields(search_info):
+    manager = SearchManager(search_info, search_images=True)
+
+    def make_section(image_bytes: bytes, description: str, url: str, embedding: list[float]) -> Section:
+        test_io = io.BytesIO(b"test content")
+        test_io.name = "test/foo.pdf"
+        image = ImageOnPage(
+            bytes=image_bytes,
+            bbox=(1.0, 2.0, 3.0, 4.0),
+            filename="img1.png",
+            description=description,
+            figure_id="fig1",
+            page_num=0,
+            placeholder="<figure id='fig1'></figure>",
+            url=url,
+            embedding=embedding,
+        )
+        return Section(chunk=Chunk(page_num=0, text="chunk text", images=[image]), content=File(test_io))
+
+    section = make_section(b"png", "A chart", "http://example.com/a/img1.png", [0.01, 0.02])
+    # Descriptions, URLs and embeddings of the same image don't change the id
+    regenerated = make_section(b"png", "A bar chart", "http://example.com/b/img1.png", [0.03, 0.04])
+    assert manager.content_hash(section) == manager.content_hash(regenerated)
+    # Another image does
+    assert manager.content_hash(section) != manager.content_hash(make_section(b"other", "A chart", "", []))
+
+
 class AsyncSearchResultsIterator:
     def __init__(self, results):
         self.results = results
@@ -734,6 +761,97 @@ class AsyncSearchResultsIterator:
         return len(self.results)
 
 
+def make_sections(texts: list[str]) -> list[Section]:
+    test_io = io.BytesIO(b"test content")
+    test_io.name = "test/foo.pdf"
+    file = File(test_io)
+    return [Section(chunk=Chunk(page_num=0, text=text), content=file, category="test") for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_update_content_ids_are_stable(monkeypatch, search_info):
+    uploaded_ids: list[list[str]] = []
+
+    async def mock_upload_documents(self, documents):
+        uploaded_ids.append([document["id"] for document in documents])
+
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    manager = SearchManager(search_info)
+
+    await manager.update_content(make_sections(["first", "second", "second"]))
+    await manager.update_content(make_sections(["inserted", "first", "second", "second"]))
+
+    first_ids, second_ids = uploaded_ids
+    # Identical sections are told apart by their ordinal, and inserting a section doesn't change the other ids
+    assert len(set(first_ids)) == 3
+    assert first_ids[1].endswith("-0") and first_ids[2].endswith("-1")
+    assert second_ids[1:] == first_ids
+    assert second_ids[0] not in first_ids
+
+
+@pytest.mark.asyncio
+async def test_update_content_diff_update(monkeypatch, search_info):
+    embeddings = OpenAIEmbeddings(
+        open_ai_client=MockClient(MockEmbeddingsClient(None)),
+        open_ai_model_name=MOCK_EMBEDDING_MODEL_NAME,
+        open_ai_dimensions=MOCK_EMBEDDING_DIMENSIONS,
+        disable_batch=True,
+    )
+    manager = SearchManager(search_info, embeddings=embeddings, field_name_embedding="embedding3", diff_update=True)
+    unchanged_id, removed_id = [
+        f"{section.content.filename_to_id()}-{manager.content_hash(section)}-0"
+        for section in make_sections(["unchanged", "removed"])
+    ]
+    search_results = AsyncSearchResultsIterator(
+        [
+            {"id": unchanged_id},
+            {"id": removed_id},
+            # Left by the previous id scheme
+            {"id": "file-foo_pdf-666F6F2E706466-page-2"},
+            # Another file with the same name, uploaded by a user
+            {"id": "file-foo_pdf-666F6F2E706466414243-page-0"},
+        ]
+    )
+    searched_filters = []
+
+    async def mock_search(self, *args, **kwargs):
+        searched_filters.append(kwargs.get("filter"))
+        return search_results
+
+    uploaded_documents = []
+
+    async def mock_upload_documents(self, documents):
+        uploaded_documents.extend(documents)
+
+    deleted_documents = []
+
+    async def mock_delete_documents(self, documents):
+        deleted_documents.extend(documents)
+        return documents
+
+    embedded_texts = []
+
+    async def mock_create_embeddings(self, texts):
+        embedded_texts.extend(texts)
+        return [[0.1, 0.2] for _ in texts]
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+    monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+    monkeypatch.setattr(OpenAIEmbeddings, "create_embeddings", mock_create_embeddings)
+
+    await manager.update_content(make_sections(["unchanged", "added"]))
+
+    assert searched_filters == ["sourcefile eq 'foo.pdf'"]
+    # Only the new section is embedded and uploaded, and the sections gone from the file are removed
+    assert [document["content"] for document in uploaded_documents] == ["added"]
+    assert uploaded_documents[0]["embedding3"] == [0.1, 0.2]
+    assert embedded_texts == ["added"]
+    assert sorted(document["id"] for document in deleted_documents) == sorted(
+        ["file-foo_pdf-666F6F2E706466-page-2", removed_id]
+    )
+
+
 @pytest.mark.asyncio
 async def test_remove_content(monkeypatch, search_info):
     search_results = AsyncSearchResultsIterator(
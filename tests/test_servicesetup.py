@@ -5,8 +5,9 @@ from openai.types.create_embedding_response import Usage
 from prepdocslib.embeddings import OpenAIEmbeddings
 from prepdocslib.figureprocessor import FigureProcessor, MediaDescriptionStrategy
 from prepdocslib.fileprocessor import FileProcessor
-from prepdocslib.pdfparser import DocumentAnalysisParser
+from prepdocslib.pdfparser import DocumentAnalysisParser, LocalPdfParser, PyMuPdfParser
 from prepdocslib.servicesetup import (
+    LocalPdfParserLibrary,
     OpenAIHost,
     build_file_processors,
     clean_key_if_exists,
@@ -284,6 +285,25 @@ def test_build_file_processors_with_document_intelligence_key():
     assert isinstance(file_processors[".pdf"].parser, DocumentAnalysisParser)
 
 
+def test_build_file_processors_local_pdf_parser_library():
+    """Test that build_file_processors uses pypdf for local PDF parsing unless PyMuPDF is selected."""
+    file_processors = build_file_processors(
+        azure_credential=MockAzureCredential(),
+        document_intelligence_service=None,
+    )
+    assert isinstance(file_processors[".pdf"].parser, LocalPdfParser)
+
+    file_processors = build_file_processors(
+        azure_credential=MockAzureCredential(),
+        document_intelligence_service="myservice",
+        use_local_pdf_parser=True,
+        local_pdf_parser_library=LocalPdfParserLibrary.PYMUPDF,
+        local_pdf_parser_processes=4,
+    )
+    assert isinstance(file_processors[".pdf"].parser, PyMuPdfParser)
+    assert file_processors[".pdf"].parser.processes == 4
+
+
 def test_build_file_processors_text_files():
     """Test that build_file_processors includes text file parsers."""
     file_processors = build_file_processors(
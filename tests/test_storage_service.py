@@ -0,0 +1,77 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services.storage_service import StorageService
+
+STORAGE_THREAD_PREFIX = "gcs-io"
+
+
+class FakeBlobs:
+    """Result of list_blobs, its pages are fetched one list request at a time like the GCS SDK"""
+
+    def __init__(self, pages: list[list[str]], calls: list):
+        self._pages = pages
+        self._calls = calls
+
+    @property
+    def pages(self):
+        for page in self._pages:
+            self._calls.append(("list", threading.current_thread().name))
+            yield [SimpleNamespace(name=name) for name in page]
+
+
+class FakeBucket:
+    def __init__(self, pages: list[list[str]], calls: list):
+        self._pages = pages
+        self._calls = calls
+
+    def list_blobs(self, prefix=None, page_size=None):
+        return FakeBlobs(self._pages, self._calls)
+
+    def blob(self, name: str):
+        calls = self._calls
+
+        class FakeBlob:
+            def upload_from_string(self, data, content_type=None):
+                calls.append(("upload", threading.current_thread().name))
+
+        return FakeBlob()
+
+
+@pytest.fixture
+def storage_service():
+    calls = []
+    pages = [["a.pdf", "b.pdf"], ["c.pdf"], ["d.pdf"]]
+    storage_service = StorageService()
+    storage_service.client = SimpleNamespace(bucket=lambda name: FakeBucket(pages, calls))
+    storage_service._initialized = True
+    return storage_service, calls
+
+
+@pytest.mark.asyncio
+async def test_list_files_fetches_pages_lazily(storage_service):
+    storage_service, calls = storage_service
+    files = storage_service.list_files("bucket")
+
+    # Only the pages holding the names consumed so far are requested
+    assert await files.__anext__() == "a.pdf"
+    assert await files.__anext__() == "b.pdf"
+    assert len(calls) == 1
+    assert await files.__anext__() == "c.pdf"
+    assert len(calls) == 2
+    await files.aclose()
+
+    assert [name async for name in storage_service.list_files("bucket")] == ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_calls_run_on_storage_executor(storage_service):
+    storage_service, calls = storage_service
+    await storage_service.upload_file("bucket", b"data", "a.pdf")
+    assert [name async for name in storage_service.list_files("bucket")]
+
+    # Blocking GCS calls run on the bounded storage executor, not on the event loop thread
+    assert calls
+    assert all(thread.startswith(STORAGE_THREAD_PREFIX) for _, thread in calls)
@@ -69,6 +69,38 @@ async def test_upload_file(auth_client, monkeypatch, mock_data_lake_service_clie
     monkeypatch.setattr(SearchClient, "upload_documents", mock_upload_documents)
     monkeypatch.setattr(OpenAIEmbeddings, "create_embeddings", mock_create_embeddings)
 
+    # A previous upload of the same file, and a file with the same name uploaded by another user
+    class MockSearchResults:
+        def __init__(self):
+            self.results = [
+                {"id": "file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-page-0"},
+                {"id": "file-a_txt-612E7478747B276F696473273A205B274F49445F59275D7D-page-0"},
+            ]
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if len(self.results) == 0:
+                raise StopAsyncIteration
+            return self.results.pop()
+
+    searched_filters = []
+
+    async def mock_search(self, *args, **kwargs):
+        searched_filters.append(kwargs.get("filter"))
+        return MockSearchResults()
+
+    monkeypatch.setattr(SearchClient, "search", mock_search)
+
+    deleted_documents = []
+
+    async def mock_delete_documents(self, documents):
+        deleted_documents.extend(documents)
+        return documents
+
+    monkeypatch.setattr(SearchClient, "delete_documents", mock_delete_documents)
+
     response = await auth_client.post(
         "/upload",
         headers={"Authorization": "Bearer test"},
@@ -77,8 +109,13 @@ async def test_upload_file(auth_client, monkeypatch, mock_data_lake_service_clie
     message = (await response.get_json())["message"]
     assert message == "File uploaded successfully"
     assert response.status_code == 200
+    assert searched_filters == ["sourcefile eq 'a.txt'"]
     assert len(documents_uploaded) == 1
-    assert documents_uploaded[0]["id"] == "file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-page-0"
+    assert (
+        documents_uploaded[0]["id"]
+        == "file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-22deb6e3663c0d00637f326860970283-0"
+    )
+    assert deleted_documents == [{"id": "file-a_txt-612E7478747B276F696473273A205B274F49445F58275D7D-page-0"}]
     assert documents_uploaded[0]["sourcepage"] == "a.txt"
     assert documents_uploaded[0]["sourcefile"] == "a.txt"
     assert documents_uploaded[0]["embedding"] == [0.0023064255, -0.009327292, -0.0028842222]